@@ -19,4 +19,4 @@
 # flask --app src.physrisk_api:create_app --debug run --host=0.0.0.0 --port=5000
 # export PYTHONPATH=$(pwd)
 # flask --app src.physrisk_api:create_app --debug run --host=0.0.0.0 --port=8081
-python src/server.py
\ No newline at end of file
+SERVER_MODE=${SERVER_MODE:-development} python src/server.py
\ No newline at end of file
@@ -0,0 +1,76 @@
+"""Compare the previous per-request JWT handling with decoding the JWT once and refreshing it in a response header.
+
+Previously the JWT was verified in the handler and again in the after_request hook, and an expiring token was
+refreshed by parsing the response body and serializing it again with 'access_token' added. The benchmark times
+the JWT handling of one request with a token about to expire (so that it is refreshed) for a get_asset_exposure
+response of realistic size.
+
+Usage:
+    python benchmarks/bench_jwt.py [--assets 10000] [--repeat 5]
+"""
+
+import argparse
+import json
+import timeit
+from datetime import timedelta
+
+from bench_response import exposure_response
+from flask import Flask
+from flask_jwt_extended import JWTManager, create_access_token, get_jwt, get_jwt_identity, verify_jwt_in_request
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--assets", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    resp_str = exposure_response(args.assets)
+    app = Flask(__name__)
+    app.config["JWT_SECRET_KEY"] = "benchmark-secret-key-of-at-least-32-bytes"
+    JWTManager(app)
+    with app.app_context():
+        token = create_access_token(
+            identity="test", additional_claims={"data_access": "osc"}, expires_delta=timedelta(minutes=10)
+        )
+    headers = {"Authorization": f"Bearer {token}"}
+
+    def previous():
+        with app.test_request_context(headers=headers):
+            # handler
+            verify_jwt_in_request(optional=True)
+            get_jwt().get("data_access", "osc")
+            response = app.response_class(resp_str, mimetype="application/json")
+            # after_request hook
+            verify_jwt_in_request(optional=True)
+            get_jwt()
+            access_token = create_access_token(identity=get_jwt_identity())
+            data = response.get_json()
+            data["access_token"] = access_token
+            response.data = json.dumps(data)
+            return response.get_data()
+
+    def decode_once():
+        with app.test_request_context(headers=headers):
+            verify_jwt_in_request(optional=True)
+            claims = get_jwt()
+            claims.get("data_access", "osc")
+            response = app.response_class(resp_str, mimetype="application/json")
+            response.headers["X-Access-Token"] = create_access_token(
+                identity=get_jwt_identity(), additional_claims={"data_access": claims["data_access"]}
+            )
+            return response.get_data()
+
+    def no_refresh():
+        with app.test_request_context():
+            return app.response_class(resp_str, mimetype="application/json").get_data()
+
+    print(f"response size: {len(resp_str) / 1024**2:.1f} MiB ({args.assets} assets)")
+    baseline = min(timeit.repeat(no_refresh, number=1, repeat=args.repeat))
+    for name, fn in [("verify twice + body", previous), ("verify once + header", decode_once)]:
+        best = min(timeit.repeat(fn, number=1, repeat=args.repeat))
+        print(f"{name:>22}: {best * 1000:8.2f} ms ({(best - baseline) * 1000:8.2f} ms JWT overhead)")
+
+
+if __name__ == "__main__":
+    main()
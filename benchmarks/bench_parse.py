@@ -0,0 +1,97 @@
+"""Time the decoding and parsing of a get_asset_exposure request body, in each supported format.
+
+The body is decoded and parsed as by the API before physrisk is called: decompressed according to its
+Content-Encoding and converted to a request dict, from JSON or from an Arrow or Parquet portfolio of assets.
+
+Usage:
+    python benchmarks/bench_parse.py [--assets 10000] [--repeat 5]
+"""
+
+import argparse
+import gzip
+import json
+import random
+import timeit
+
+from physrisk_api.app.request_formats import (
+    ARROW_STREAM_MIMETYPE,
+    PARQUET_MIMETYPE,
+    REQUEST_METADATA_KEY,
+    decode_body,
+    parse_request,
+)
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+MAX_SIZE = 512 * 1024**2
+
+
+def exposure_request(num_assets: int) -> dict:
+    """A get_asset_exposure request of realistic shape for `num_assets` assets."""
+    random.seed(42)
+    items = [
+        {
+            "asset_class": "PowerGeneratingAsset",
+            "type": random.choice(["Gas", "Coal", "Nuclear", "Solar"]),
+            "location": "Europe",
+            "latitude": 53.7 + random.uniform(-5, 5),
+            "longitude": 9.4 + random.uniform(-5, 5),
+            "capacity": random.uniform(10, 1000),
+        }
+        for _ in range(num_assets)
+    ]
+    return {"assets": {"items": items}, "scenario": "ssp585", "year": 2050, "provider_max_requests": {}}
+
+
+def columnar_body(request_dict: dict, mimetype: str) -> bytes:
+    items = request_dict["assets"]["items"]
+    columns = {name: [item[name] for item in items] for name in items[0]}
+    rest = {key: value for key, value in request_dict.items() if key != "assets"}
+    table = pa.table(columns).replace_schema_metadata({REQUEST_METADATA_KEY: json.dumps(rest)})
+    sink = pa.BufferOutputStream()
+    if mimetype == ARROW_STREAM_MIMETYPE:
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        pq.write_table(table, sink)
+    return sink.getvalue().to_pybytes()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--assets", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    request_dict = exposure_request(args.assets)
+    json_body = json.dumps(request_dict).encode()
+    bodies = [
+        ("json", json_body, None, "application/json"),
+        ("json + gzip", gzip.compress(json_body), "gzip", "application/json"),
+    ]
+    if pa is not None:
+        bodies += [
+            ("arrow stream", columnar_body(request_dict, ARROW_STREAM_MIMETYPE), None, ARROW_STREAM_MIMETYPE),
+            ("parquet", columnar_body(request_dict, PARQUET_MIMETYPE), None, PARQUET_MIMETYPE),
+        ]
+    else:
+        print("pyarrow is not installed: skipping Arrow and Parquet")
+
+    print(f"{args.assets} assets")
+    for name, body, content_encoding, mimetype in bodies:
+
+        def parse():
+            data = decode_body(body, content_encoding, MAX_SIZE)
+            return parse_request("get_asset_exposure", data, mimetype)
+
+        assert len(parse()["assets"]["items"]) == args.assets
+        best = min(timeit.repeat(parse, number=1, repeat=args.repeat))
+        print(f"{name:>14}: {best * 1000:8.2f} ms ({len(body) / 1024**2:6.2f} MiB body)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Compare the previous parse-and-reserialize handling of a physrisk JSON response with the pass-through path.
+
+Usage:
+    python benchmarks/bench_response.py [--assets 10000] [--repeat 5]
+"""
+
+import argparse
+import json
+import random
+import timeit
+
+from flask import Flask, jsonify
+
+from physrisk_api.app import json_backend
+
+
+def exposure_response(num_assets: int) -> str:
+    """A get_asset_exposure response of realistic shape for `num_assets` assets."""
+    random.seed(42)
+    hazards = ["RiverineInundation", "CoastalInundation", "ChronicHeat", "Wind", "Fire", "Drought", "Hail"]
+    items = [
+        {
+            "asset_id": f"asset-{i}",
+            "exposures": {
+                hazard: {
+                    "category": random.choice(["LOW", "MEDIUM", "HIGH", "NODATA"]),
+                    "value": random.random() * 10,
+                    "path": f"{hazard.lower()}/provider/v1/indicator_historical_1985",
+                }
+                for hazard in hazards
+            },
+        }
+        for i in range(num_assets)
+    ]
+    return json.dumps({"items": items})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--assets", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    resp_str = exposure_response(args.assets)
+    app = Flask(__name__)
+
+    def previous():
+        resp_data = json.loads(resp_str)
+        assert resp_data.get("items") or resp_data.get("models")
+        return jsonify(resp_data).get_data()
+
+    def pass_through():
+        assert json_backend.has_results(resp_str)
+        return app.response_class(resp_str, mimetype="application/json").get_data()
+
+    with app.app_context():
+        print(f"response size: {len(resp_str) / 1024**2:.1f} MiB ({args.assets} assets)")
+        for name, fn in [("parse + re-serialize", previous), ("pass-through", pass_through)]:
+            best = min(timeit.repeat(fn, number=1, repeat=args.repeat))
+            print(f"{name:>22}: {best * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""End-to-end load test of the hazard data, exposure, impact and tile endpoints.
+
+Requests are built as by the CLI: portfolios of assets scattered around a base location (the CLI's
+`_generate_assets`), and map tiles at the assets' locations (`_convert_latlon`). For each endpoint, `--requests`
+requests are sent by `--concurrency` concurrent clients, each sending its next request as soon as the previous
+one completes, after `--warmup` requests that are not measured. Latency percentiles (p50/p95/p99) and requests
+per second are reported for each endpoint.
+
+Unless --url is given, the API is run in this process (with Werkzeug's threaded server), so that no network
+access or credentials are needed. It reads hazard data from the local zarr store given by --zarr or else from
+synthetic hazard data (see physrisk_api.app.synthetic_hazard), generated in the --synthetic directory on the
+first run. Requests are generated from --seed, so the same requests are sent on every run: save the results of a
+run with --output and compare a later run (e.g. of another commit) with --compare.
+
+Usage:
+    python benchmarks/load.py [--concurrency 8] [--requests 100] [--assets 10]
+        [--endpoints hazard,exposure,impact,tiles] [--output results.json] [--compare base.json]
+    python benchmarks/load.py --zarr /path/to/hazard/hazard.zarr ...
+    python benchmarks/load.py --url http://localhost:8080 ...
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+
+# the CLI is run as a script, with its own directory on the path
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src" / "physrisk_api" / "cli"))
+
+from cli import _convert_latlon, _generate_assets  # noqa: E402
+from physrisk_temp import AssetExposureRequest, AssetImpactRequest, Assets, HazardDataRequestItem  # noqa: E402
+
+ENDPOINTS = ("hazard", "exposure", "impact", "tiles")
+TILE_RESOURCE = "inundation/wri/v2/inunriver_{scenario}_MIROC-ESM-CHEM_{year}"
+
+
+def hazard_request(args, seed: int) -> Dict[str, Any]:
+    assets = _generate_assets(args.latitude, args.longitude, args.variance, args.variance, args.assets, seed)
+    item = HazardDataRequestItem(
+        longitudes=[asset.longitude for asset in assets],
+        latitudes=[asset.latitude for asset in assets],
+        request_item_id="item1",
+        hazard_type="RiverineInundation",
+        indicator_id="flood_depth",
+        scenario=args.scenario,
+        year=args.year,
+    )
+    obj = {"items": [item.model_dump()], "interpolation": "floor", "provider_max_requests": {}}
+    return {"method": "POST", "url": "/api/get_hazard_data", "json": obj}
+
+
+def exposure_request(args, seed: int) -> Dict[str, Any]:
+    assets = _generate_assets(args.latitude, args.longitude, args.variance, args.variance, args.assets, seed)
+    obj = AssetExposureRequest(assets=Assets(items=assets), scenario=args.scenario, year=args.year)
+    return {"method": "POST", "url": "/api/get_asset_exposure", "json": obj.model_dump()}
+
+
+def impact_request(args, seed: int) -> Dict[str, Any]:
+    assets = _generate_assets(args.latitude, args.longitude, args.variance, args.variance, args.assets, seed)
+    obj = AssetImpactRequest(assets=Assets(items=assets), scenario=args.scenario, year=args.year)
+    return {"method": "POST", "url": "/api/get_asset_impact", "json": obj.model_dump()}
+
+
+def tile_request(args, seed: int) -> Dict[str, Any]:
+    (asset,) = _generate_assets(args.latitude, args.longitude, args.variance, args.variance, 1, seed)
+    x, y = _convert_latlon(asset.latitude, asset.longitude, args.zoom)
+    return {
+        "method": "GET",
+        "url": f"/api/tiles/{args.tile_resource}/{args.zoom}/{x}/{y}.png",
+        "params": {"scenarioId": args.scenario, "year": args.year},
+    }
+
+
+REQUEST_BUILDERS: Dict[str, Callable[[Any, int], Dict[str, Any]]] = {
+    "hazard": hazard_request,
+    "exposure": exposure_request,
+    "impact": impact_request,
+    "tiles": tile_request,
+}
+
+
+async def run_endpoint(client: httpx.AsyncClient, requests: List[Dict[str, Any]], concurrency: int):
+    """Send the requests with `concurrency` concurrent clients; return latencies, status codes and elapsed time."""
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    queue = iter(requests)
+
+    async def worker():
+        for kwargs in queue:
+            started = time.perf_counter()
+            try:
+                response = await client.request(**kwargs)
+                await response.aread()
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            elapsed = time.perf_counter() - started
+            statuses[status] = statuses.get(status, 0) + 1
+            if status.startswith("2"):
+                latencies.append(elapsed)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, statuses, time.perf_counter() - started
+
+
+def summarize(latencies: List[float], statuses: Dict[str, int], elapsed: float) -> Dict[str, Any]:
+    summary: Dict[str, Any] = {
+        "requests": sum(statuses.values()),
+        "errors": sum(count for status, count in statuses.items() if not status.startswith("2")),
+        "statuses": statuses,
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+    }
+    if len(latencies) >= 2:
+        percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+        summary.update(p50=percentiles[49], p95=percentiles[94], p99=percentiles[98], mean=statistics.mean(latencies))
+    return summary
+
+
+async def run(args, base_url: str) -> Dict[str, Dict[str, Any]]:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    timeout = httpx.Timeout(args.timeout)
+    results = {}
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+        for endpoint in args.endpoints:
+            build = REQUEST_BUILDERS[endpoint]
+            warmup = [build(args, args.seed + i) for i in range(args.warmup)]
+            requests = [build(args, args.seed + args.warmup + i) for i in range(args.requests)]
+            await run_endpoint(client, warmup, args.concurrency)
+            results[endpoint] = summarize(*await run_endpoint(client, requests, args.concurrency))
+    return results
+
+
+def serve_in_process() -> str:
+    """Start the API in a background thread; return its base URL."""
+    from werkzeug.serving import make_server
+
+    from physrisk_api.app import create_app
+
+    server = make_server("127.0.0.1", 0, create_app(), threaded=True)
+    threading.Thread(target=server.serve_forever, name="api-server", daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def generate_synthetic_hazard():
+    """Generate the synthetic hazard data before starting the API, rather than in its first request."""
+    from physrisk_api.app.override_providers import ZARR_PATH
+    from physrisk_api.app.synthetic_hazard import SyntheticHazardSettings, ensure_generated
+
+    settings = SyntheticHazardSettings()
+    root = str(Path(settings.directory, ZARR_PATH))
+    print(f"using synthetic hazard data in {root} (generated if not there already)")
+    ensure_generated(root, settings)
+
+
+def git_revision() -> Dict[str, Any]:
+    def git(*args: str) -> str:
+        try:
+            return subprocess.run(["git", *args], capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return ""
+
+    return {"commit": git("rev-parse", "HEAD"), "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def print_results(results: Dict[str, Dict[str, Any]], baseline: Optional[Dict[str, Dict[str, Any]]] = None):
+    print(f"{'endpoint':>10} {'requests':>9} {'errors':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>9}")
+    for endpoint, summary in results.items():
+        row = f"{endpoint:>10} {summary['requests']:>9} {summary['errors']:>7}"
+        for key in ("p50", "p95", "p99"):
+            row += f" {summary[key] * 1000:>9.1f}" if key in summary else f" {'-':>9}"
+        row += f" {summary['rps']:>9.1f}"
+        print(row)
+        previous = (baseline or {}).get(endpoint)
+        if previous is not None:
+            changes = [_change(summary.get(key), previous.get(key)) for key in ("p50", "p95", "p99", "rps")]
+            print(f"{'vs base':>10} {'':>9} {'':>7} " + " ".join(f"{change:>9}" for change in changes))
+
+
+def _change(value: Optional[float], previous: Optional[float]) -> str:
+    if value is None or not previous:
+        return "-"
+    return f"{(value - previous) / previous * 100:+.1f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="base URL of a running API; by default the API is run in this process")
+    parser.add_argument("--zarr", help="local zarr store (hazard/hazard.zarr) read by the in-process API")
+    parser.add_argument(
+        "--synthetic",
+        default=os.path.join(tempfile.gettempdir(), "physrisk_synthetic_hazard"),
+        help="directory of the synthetic hazard data read by the in-process API, unless --zarr is given",
+    )
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help="comma-separated subset of %(default)s")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=100, help="measured requests per endpoint")
+    parser.add_argument("--warmup", type=int, default=5, help="requests per endpoint sent before measuring")
+    parser.add_argument("--assets", type=int, default=10, help="assets (or locations) per request")
+    parser.add_argument("--latitude", type=float, default=53.69)
+    parser.add_argument("--longitude", type=float, default=9.40)
+    parser.add_argument("--variance", type=float, default=2.0, help="spread of asset locations in degrees")
+    parser.add_argument("--scenario", default="ssp585")
+    parser.add_argument("--year", type=int, default=2050)
+    parser.add_argument(
+        "--zoom", type=int, default=2, help="zoom level of tiles (at most the maximum zoom of the data - 1)"
+    )
+    parser.add_argument("--tile-resource", default=TILE_RESOURCE)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="results of a previous run (from --output) to compare with")
+    args = parser.parse_args()
+    args.endpoints = [endpoint.strip() for endpoint in args.endpoints.split(",") if endpoint.strip()]
+    unknown = set(args.endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(sorted(unknown))}")
+
+    if args.url:
+        base_url = args.url.rstrip("/")
+    elif args.zarr:
+        os.environ["OSC_ZARR_LOCAL_PATH"] = str(Path(args.zarr).resolve())
+        base_url = serve_in_process()
+    else:
+        os.environ["SYNTHETIC_HAZARD_DIR"] = args.synthetic
+        generate_synthetic_hazard()
+        base_url = serve_in_process()
+
+    results = asyncio.run(run(args, base_url))
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+    print_results(results, baseline)
+
+    if args.output:
+        settings = {key: value for key, value in vars(args).items() if key not in ("output", "compare")}
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    **git_revision(),
+                    "python": platform.python_version(),
+                    "cpus": os.cpu_count(),
+                    "settings": settings,
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+from physrisk_api.app import create_app
@@ -1,18 +1,29 @@
 import logging
 import os
 import pathlib
+import tempfile
 from datetime import timedelta
 
-from dependency_injector import providers
 from dotenv import load_dotenv
 from flask import Flask
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
-from physrisk.container import Container
 from werkzeug.middleware.proxy_fix import ProxyFix
 
-from physrisk_api.app.override_providers import provide_s3_zarr_store
+from physrisk_api.app.compression import Compressor, parse_levels
+from physrisk_api.app.hazard_cache import HazardPointCache
+from physrisk_api.app.jobs import JobManager, create_job_store
+from physrisk_api.app.json_backend import JSONProvider
+from physrisk_api.app.metrics import Metrics, TimedRequester
+from physrisk_api.app.override_providers import create_container
+from physrisk_api.app.parallel import ImpactPool
+from physrisk_api.app.prewarm import prewarm_tiles_command
+from physrisk_api.app.profiling import Profiler
+from physrisk_api.app.response_cache import ResponseCache
+from physrisk_api.app.single_flight import SingleFlight
+from physrisk_api.app.tile_cache import TileCache
 
+from .api import ACCESS_TOKEN_HEADER
 from .service import main
 
 
@@ -25,23 +36,132 @@ def create_app():
         load_dotenv(dotenv_path=dotenv_path, override=True)
 
     app = Flask(__name__)
+    app.json = JSONProvider(app)
     app.logger.setLevel(logging.INFO)
     app.logger.info("Starting physrisk_api...")
 
-    container = Container()
+    # the Requester records the time physrisk spends serializing responses; see physrisk_api.app.metrics
+    container = create_container(requester_cls=TimedRequester)
     container.wire(modules=[".api"])
-    # this is not needed but demonstrates how to override providers in physrisk Container.
-    container.override_providers(zarr_store=providers.Singleton(provide_s3_zarr_store))
-    # container.override_providers(config =
-    # providers.Configuration(default={"zarr_sources": ["embedded", "hazard_test"]}))
 
     app.container = container
+    # set by physrisk_api.app.warmup once the container has been built
+    app.ready = False
+    # background warm-up started by a readiness check or a reset, if any
+    app.warm_up_thread = None
+    # incremented by a reset, so that a warm-up started before it does not mark the app as ready
+    app.warm_up_generation = 0
     _ = JWTManager(app)
     app.config["JWT_SECRET_KEY"] = os.environ.get("JWT_SECRET_KEY", "not-to-be-used")
     app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(weeks=1)
+    app.config["TILE_CACHE_MAX_ENTRIES"] = int(os.environ.get("TILE_CACHE_MAX_ENTRIES", 1024))
+    app.config["TILE_CACHE_MAX_BYTES"] = int(os.environ.get("TILE_CACHE_MAX_BYTES", 256 * 1024**2))
+    # on-disk tier is disabled unless a directory is given
+    app.config["TILE_CACHE_DIR"] = os.environ.get("TILE_CACHE_DIR")
+    app.config["TILE_CACHE_DIR_MAX_BYTES"] = int(os.environ.get("TILE_CACHE_DIR_MAX_BYTES", 1024**3))
+    # bump DATASET_VERSION whenever the underlying hazard data changes so that entity tags change with it
+    app.config["DATASET_VERSION"] = os.environ.get("DATASET_VERSION", "hazard/hazard.zarr")
+    app.config["IMAGE_CACHE_MAX_AGE"] = int(os.environ.get("IMAGE_CACHE_MAX_AGE", 3600))
+    # per-location get_hazard_data cache; set HAZARD_CACHE_MAX_BYTES to 0 to disable
+    app.config["HAZARD_CACHE_MAX_BYTES"] = int(os.environ.get("HAZARD_CACHE_MAX_BYTES", 64 * 1024**2))
+    # quantization of request coordinates, in degrees; should not be coarser than the hazard data grids
+    app.config["HAZARD_CACHE_RESOLUTION"] = float(os.environ.get("HAZARD_CACHE_RESOLUTION", 1e-5))
+    # number of assets per physrisk call when streaming portfolio results as NDJSON
+    app.config["STREAM_CHUNK_SIZE"] = int(os.environ.get("STREAM_CHUNK_SIZE", 1000))
+    # JSON file listing tiles to render into the tile cache after warm-up; see physrisk_api.app.prewarm
+    app.config["TILE_PREWARM_CONFIG"] = os.environ.get("TILE_PREWARM_CONFIG")
+    app.config["TILE_PREWARM_WORKERS"] = int(os.environ.get("TILE_PREWARM_WORKERS", 2))
+    # worker processes for running large get_asset_impact requests in chunks; 0 (the default) runs them whole
+    app.config["IMPACT_POOL_SIZE"] = int(os.environ.get("IMPACT_POOL_SIZE", 0))
+    app.config["IMPACT_CHUNK_SIZE"] = int(os.environ.get("IMPACT_CHUNK_SIZE", 500))
+    # store of asynchronous jobs: 'memory', or 'sqlite' to share jobs between the processes of a server
+    app.config["JOBS_BACKEND"] = os.environ.get("JOBS_BACKEND", "memory")
+    app.config["JOBS_DB_PATH"] = os.environ.get("JOBS_DB_PATH", os.path.join(tempfile.gettempdir(), "physrisk_jobs.db"))
+    app.config["JOBS_WORKERS"] = int(os.environ.get("JOBS_WORKERS", 2))
+    # maximum number of jobs queued or running; further submissions are rejected
+    app.config["JOBS_MAX_ACTIVE"] = int(os.environ.get("JOBS_MAX_ACTIVE", 100))
+    # seconds for which a job and its results are kept after its last update
+    app.config["JOBS_TTL"] = int(os.environ.get("JOBS_TTL", 24 * 3600))
+    app.config["JOBS_CHUNK_SIZE"] = int(os.environ.get("JOBS_CHUNK_SIZE", 500))
+    # seconds after which a queued or running job not updated by its process (e.g. one that died) is marked failed
+    app.config["JOBS_STALE_AFTER"] = float(os.environ.get("JOBS_STALE_AFTER", 300))
+    # maximum size of a request body once decompressed (requests may be sent gzip or zstd encoded)
+    app.config["REQUEST_MAX_BYTES"] = int(os.environ.get("REQUEST_MAX_BYTES", 512 * 1024**2))
+    # response compression; encodings in order of preference, used if installed (see the 'compression' extra)
+    app.config["COMPRESSION_ENABLED"] = os.environ.get("COMPRESSION_ENABLED", "1") == "1"
+    app.config["COMPRESSION_ENCODINGS"] = os.environ.get("COMPRESSION_ENCODINGS", "zstd,br,gzip")
+    app.config["COMPRESSION_LEVELS"] = os.environ.get("COMPRESSION_LEVELS", "gzip=6,br=4,zstd=3")
+    # bodies smaller than this are sent uncompressed; bodies larger than COMPRESSION_STREAM_SIZE are compressed
+    # in slices as they are sent
+    app.config["COMPRESSION_MIN_SIZE"] = int(os.environ.get("COMPRESSION_MIN_SIZE", 1024))
+    app.config["COMPRESSION_STREAM_SIZE"] = int(os.environ.get("COMPRESSION_STREAM_SIZE", 4 * 1024**2))
+    # compressed bodies of responses with an entity tag are cached, up to this total size
+    app.config["COMPRESSION_CACHE_MAX_BYTES"] = int(os.environ.get("COMPRESSION_CACHE_MAX_BYTES", 32 * 1024**2))
+    # on-demand profiling of requests, enabled only if a key is set; see physrisk_api.app.profiling
+    app.config["PROFILING_KEY"] = os.environ.get("PROFILING_KEY")
+    # fraction of requests profiled at random, e.g. 0.001
+    app.config["PROFILING_SAMPLE_RATE"] = float(os.environ.get("PROFILING_SAMPLE_RATE", 0))
+    app.config["PROFILING_INTERVAL"] = float(os.environ.get("PROFILING_INTERVAL", 0.005))
+    app.config["PROFILING_MAX_PROFILES"] = int(os.environ.get("PROFILING_MAX_PROFILES", 32))
     print(f"EMB - Using app.config:{app.config}")
 
-    CORS(app)
+    app.tile_cache = TileCache(
+        max_entries=app.config["TILE_CACHE_MAX_ENTRIES"],
+        max_bytes=app.config["TILE_CACHE_MAX_BYTES"],
+        disk_dir=app.config["TILE_CACHE_DIR"],
+        disk_max_bytes=app.config["TILE_CACHE_DIR_MAX_BYTES"],
+    )
+    app.hazard_cache = (
+        HazardPointCache(
+            max_bytes=app.config["HAZARD_CACHE_MAX_BYTES"], resolution=app.config["HAZARD_CACHE_RESOLUTION"]
+        )
+        if app.config["HAZARD_CACHE_MAX_BYTES"] > 0
+        else None
+    )
+    app.impact_pool = (
+        ImpactPool(processes=app.config["IMPACT_POOL_SIZE"], chunk_size=app.config["IMPACT_CHUNK_SIZE"])
+        if app.config["IMPACT_POOL_SIZE"] > 0
+        else None
+    )
+    app.jobs = JobManager(
+        app,
+        create_job_store(app.config["JOBS_BACKEND"], app.config["JOBS_DB_PATH"]),
+        workers=app.config["JOBS_WORKERS"],
+        max_active=app.config["JOBS_MAX_ACTIVE"],
+        ttl=app.config["JOBS_TTL"],
+        chunk_size=app.config["JOBS_CHUNK_SIZE"],
+        stale_after=app.config["JOBS_STALE_AFTER"],
+    )
+    app.single_flight = SingleFlight()
+    # responses computed once per physrisk Container generation; cleared by /api/reset
+    app.response_cache = ResponseCache()
+    app.tile_prewarm = None
+    app.metrics = Metrics()
+    app.profiler = (
+        Profiler(
+            app.config["PROFILING_KEY"],
+            sample_rate=app.config["PROFILING_SAMPLE_RATE"],
+            interval=app.config["PROFILING_INTERVAL"],
+            max_profiles=app.config["PROFILING_MAX_PROFILES"],
+        )
+        if app.config["PROFILING_KEY"]
+        else None
+    )
+    app.compressor = (
+        Compressor(
+            encodings=[e.strip() for e in app.config["COMPRESSION_ENCODINGS"].split(",") if e.strip()],
+            levels=parse_levels(app.config["COMPRESSION_LEVELS"]),
+            min_size=app.config["COMPRESSION_MIN_SIZE"],
+            stream_size=app.config["COMPRESSION_STREAM_SIZE"],
+            cache_max_bytes=app.config["COMPRESSION_CACHE_MAX_BYTES"],
+        )
+        if app.config["COMPRESSION_ENABLED"]
+        else None
+    )
+    app.cli.add_command(prewarm_tiles_command)
+
+    # let browser clients read refreshed access tokens
+    CORS(app, expose_headers=[ACCESS_TOKEN_HEADER])
     app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_host=1)
     # The 'main' blueprint should be the only one registered here.
     # All other routes or blueprints should register with 'main'.
@@ -1,17 +1,40 @@
 import json
 import os
 from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, Optional, Union
 
 from dependency_injector.wiring import Provide, inject
-from flask import Blueprint, abort, current_app, jsonify, request
+from flask import Blueprint, abort, current_app, g, jsonify, request, stream_with_context, url_for
 from flask.helpers import make_response
 from flask_jwt_extended import create_access_token, get_jwt, get_jwt_identity, unset_jwt_cookies, verify_jwt_in_request
 from jwt import ExpiredSignatureError
 from physrisk.container import Container
 from physrisk.requests import Requester
 
+from physrisk_api.app.http_caching import (
+    DATA_ACCESS_HEADER,
+    compute_etag,
+    is_not_modified,
+    not_modified_response,
+    set_cache_headers,
+)
+from physrisk_api.app.jobs import CANCELLED, JOB_REQUEST_IDS, QUEUED, RUNNING, SUCCEEDED, QueueFullError
+from physrisk_api.app.json_backend import has_results
+from physrisk_api.app.override_providers import store_stats
+from physrisk_api.app.portfolio import ASSET_RESULT_KEYS, NDJSON_MIMETYPE, iter_ndjson
+from physrisk_api.app.profiling import profiled
+from physrisk_api.app.request_formats import RequestTooLarge, UnsupportedRequestFormat, decode_body, parse_request
+from physrisk_api.app.response_cache import PREPARED_REQUEST_IDS, PreparedResponse
+from physrisk_api.app.response_formats import COLUMNAR_RESPONSE_MIMETYPES, columnar_available, iter_columnar
+from physrisk_api.app.single_flight import COALESCED_REQUEST_IDS, SingleFlight
+from physrisk_api.app.tile_cache import image_request
+from physrisk_api.app.warmup import start_warm_up
+
 api = Blueprint("api", __name__, url_prefix="/api")
 
+# response header holding a refreshed access token
+ACCESS_TOKEN_HEADER = "X-Access-Token"
+
 
 @api.post("/token")
 def create_token():
@@ -49,6 +72,7 @@ def create_token():
 @api.post("/get_hazard_data_availability")
 @api.post("/get_asset_exposure")
 @api.post("/get_asset_impact")
+@profiled
 @inject
 def hazard_data(requester: Requester = Provide[Container.requester]):
     """Retrieve data from physrisk library based on request URL and JSON data."""
@@ -56,51 +80,250 @@ def hazard_data(requester: Requester = Provide[Container.requester]):
     log = current_app.logger
     request_id = os.path.basename(request.path)
     log.info(f"EMB - request_id:{request_id}")
-    request_dict = request.json
+    request_dict = _request_dict(request_id)
     # log.info(f"EMB - request_dict:{json.dumps(request_dict)}")
 
     log.info(f"Received '{request_id}' request")
 
+    # opt-in Arrow IPC or Parquet results for portfolio requests
+    columnar_mimetype = _columnar_mimetype() if request_id in ASSET_RESULT_KEYS else None
+    if columnar_mimetype is not None:
+        return _columnar_response(requester, request_id, request_dict, columnar_mimetype)
+
+    # opt-in streaming of one asset result per line for portfolio requests
+    stream = request_id in ASSET_RESULT_KEYS and _accepts_ndjson()
+
     try:
-        try:
-            verify_jwt_in_request(optional=True)
-            # if no JWT, default to 'public' access level
-            data_access: str = get_jwt().get("data_access", "osc")
-        except ExpiredSignatureError:
-            log.info("Signature has expired")
-            data_access = "osc"
-        except Exception as exc_info:
-            log.warning(f"No JWT for '{request_id}' request", exc_info=exc_info)
-            # 'public' or 'osc'
-            data_access: str = "osc"  # type:ignore
-        request_dict["group_ids"] = [data_access]  # type:ignore
-        resp_data = requester.get(request_id=request_id, request_dict=request_dict)
-        resp_data = json.loads(resp_data)
+        request_dict["group_ids"] = [_data_access()]  # type: ignore
+        if stream:
+            lines = iter_ndjson(
+                lambda d: requester.get(request_id=request_id, request_dict=d),
+                request_id,
+                request_dict,
+                chunk_size=current_app.config["STREAM_CHUNK_SIZE"],
+            )
+            # the first chunk is computed up front so that invalid requests still fail with a status code
+            first_line = next(lines, None)
+        else:
+            resp_data = _get_shared(requester, request_id, request_dict)
     except Exception as exc_info:
         log.error(f"Invalid '{request_id}' request", exc_info=exc_info)
         abort(400)
 
+    if stream:
+        return _ndjson_response(request_id, first_line, lines)
+    if isinstance(resp_data, PreparedResponse):
+        return _prepared_response(request_id, resp_data)
 
     # log.info(f"EMB - (A) resp_data:{json.dumps(resp_data)}")
 
     # Response object should hold a list of items, models or measures.
     # If not, none were found matching the request's criteria.
-    if not (
-        resp_data.get("items")
-        or resp_data.get("models")
-        or resp_data.get("asset_impacts")
-        or resp_data.get("risk_measures")
-    ):
+    if not has_results(resp_data):
         log.error(f"No results returned for '{request_id}' request")
         abort(404)
 
     # log.info(f"EMB - (B) resp_data:{json.dumps(resp_data)}")
 
-    return resp_data
+    # physrisk's response is already JSON: pass it through rather than parsing and re-serializing it
+    return current_app.response_class(resp_data, mimetype="application/json")
+
+
+def _request_dict(request_id: str) -> Dict[str, Any]:
+    """Request dict from the request body, which may be gzip or zstd compressed and, for portfolio requests, may be
+    a columnar portfolio of assets (see physrisk_api.app.request_formats)."""
+    log = current_app.logger
+    try:
+        with current_app.metrics.time("parse"):
+            data = decode_body(
+                request.get_data(), request.headers.get("Content-Encoding"), current_app.config["REQUEST_MAX_BYTES"]
+            )
+            return parse_request(request_id, data, request.mimetype)
+    except UnsupportedRequestFormat as exc_info:
+        log.warning(f"Unsupported '{request_id}' request: {exc_info}")
+        abort(415)
+    except RequestTooLarge as exc_info:
+        log.warning(f"Rejected '{request_id}' request: {exc_info}")
+        abort(413)
+    except Exception as exc_info:
+        log.error(f"Invalid '{request_id}' request body", exc_info=exc_info)
+        abort(400)
+
+
+def _data_access() -> str:
+    # claims are decoded once per request, by load_jwt; if no JWT, default to 'osc' access level
+    return g.jwt.get("data_access", "osc")
+
+
+def _get(requester: Requester, request_id: str, request_dict: dict) -> str:
+    hazard_cache = current_app.hazard_cache
+    impact_pool = current_app.impact_pool
+
+    def fetch(d: dict) -> str:
+        with current_app.metrics.time("compute"):
+            return requester.get(request_id=request_id, request_dict=d)
+
+    if request_id == "get_hazard_data" and hazard_cache is not None:
+        return hazard_cache.get(request_dict, fetch=fetch)
+    if impact_pool is not None:
+        return impact_pool.get(request_id, request_dict, fetch=fetch)
+    return fetch(request_dict)
+
+
+def _get_shared(requester: Requester, request_id: str, request_dict: dict) -> Union[str, PreparedResponse]:
+    """Response to a request, shared with identical requests in flight at the same time if of a kind that many
+    clients send at once, and prepared once per physrisk Container generation if it only changes with that."""
+    if request_id not in COALESCED_REQUEST_IDS:
+        return _get(requester, request_id, request_dict)
+    key = SingleFlight.key(request_id, request_dict)
+
+    def fetch() -> str:
+        return current_app.single_flight.do("requests", key, lambda: _get(requester, request_id, request_dict))
+
+    if request_id in PREPARED_REQUEST_IDS:
+        return current_app.response_cache.get_or_compute(key, fetch)
+    return fetch()
+
+
+def _prepared_response(request_id: str, prepared: PreparedResponse):
+    if not prepared.has_results:
+        current_app.logger.error(f"No results returned for '{request_id}' request")
+        abort(404)
+    # may change whenever the physrisk Container is reset, so clients must revalidate; the entity tag is weak since
+    # the body is sent with different content encodings
+    if is_not_modified(prepared.etag):
+        response = not_modified_response(prepared.etag, max_age=0, weak=True)
+    elif _negotiate_encoding() == "gzip":
+        response = current_app.response_class(prepared.gzipped, mimetype="application/json")
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        # other encodings are applied by the compressor, which caches the encoded body by entity tag
+        response = current_app.response_class(prepared.data, mimetype="application/json")
+    response.vary.add("Accept-Encoding")
+    return set_cache_headers(response, prepared.etag, max_age=0, weak=True)
+
+
+def _negotiate_encoding() -> Optional[str]:
+    compressor = current_app.compressor
+    if compressor is None:
+        return "gzip" if request.accept_encodings["gzip"] else None
+    return compressor.negotiate(request.accept_encodings)
+
+
+def _accepts_ndjson() -> bool:
+    return request.accept_mimetypes.best_match(["application/json", NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+
+
+def _ndjson_response(request_id: str, first_line: Optional[bytes], lines: Iterator[bytes]):
+    log = current_app.logger
+    if first_line is None:
+        log.error(f"No results returned for '{request_id}' request")
+        abort(404)
+
+    def generate():
+        yield first_line
+        try:
+            yield from lines
+        except Exception as exc_info:
+            # headers are already sent, so report the failure in-band as a final line
+            log.error(f"Failed streaming '{request_id}' response", exc_info=exc_info)
+            yield json.dumps({"error": f"Failed to complete '{request_id}' request"}).encode() + b"\n"
+
+    return current_app.response_class(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
+
+
+def _columnar_mimetype() -> Optional[str]:
+    best = request.accept_mimetypes.best_match(
+        ["application/json", NDJSON_MIMETYPE, *COLUMNAR_RESPONSE_MIMETYPES], default="application/json"
+    )
+    return best if best in COLUMNAR_RESPONSE_MIMETYPES else None
+
+
+def _columnar_response(requester: Requester, request_id: str, request_dict: Dict[str, Any], mimetype: str):
+    log = current_app.logger
+    if not columnar_available():
+        log.error(f"'{mimetype}' response to '{request_id}' request requires pyarrow")
+        abort(406)
+    try:
+        request_dict["group_ids"] = [_data_access()]
+        chunks = iter_columnar(
+            requester, request_id, request_dict, chunk_size=current_app.config["STREAM_CHUNK_SIZE"], mimetype=mimetype
+        )
+        # the first chunk is computed up front so that invalid requests still fail with a status code
+        first_chunk = next(chunks)
+    except Exception as exc_info:
+        log.error(f"Invalid '{request_id}' request", exc_info=exc_info)
+        abort(400)
+
+    def generate():
+        yield first_chunk
+        try:
+            yield from chunks
+        except Exception as exc_info:
+            # headers are already sent; the client sees an incomplete stream or file
+            log.error(f"Failed streaming '{request_id}' response", exc_info=exc_info)
+
+    return current_app.response_class(stream_with_context(generate()), mimetype=mimetype)
+
+
+def _render_image(requester: Requester, request_dict: Dict[str, Any]) -> bytes:
+    with current_app.metrics.time("compute"):
+        return requester.get_image(request_dict)
+
+
+@api.post("/jobs/<request_id>")
+def submit_job(request_id):
+    """Queue a request as a job, returning its ID and status at once (202), or 429 if too many jobs are queued."""
+    if request_id not in JOB_REQUEST_IDS:
+        abort(404)
+    request_dict = _request_dict(request_id)
+    request_dict["group_ids"] = [_data_access()]
+    try:
+        job = current_app.jobs.submit(request_id, request_dict)
+    except QueueFullError as e:
+        return {"msg": str(e)}, 429
+    current_app.logger.info(f"Queued job {job.id} for '{request_id}' request")
+    return job.as_dict(), 202, {"Location": url_for(".job_status", job_id=job.id)}
+
+
+@api.get("/jobs/<job_id>")
+def job_status(job_id):
+    """Status and progress of a job."""
+    job = current_app.jobs.status(job_id)
+    if job is None:
+        abort(404)
+    return job.as_dict()
+
+
+@api.delete("/jobs/<job_id>")
+def cancel_job(job_id):
+    job = current_app.jobs.cancel(job_id)
+    if job is None:
+        abort(404)
+    return job.as_dict()
+
+
+@api.get("/jobs/<job_id>/result")
+def job_result(job_id):
+    """Result of a completed job. With ?partial=true, the results of the portfolio chunks completed so far."""
+    jobs = current_app.jobs
+    job = jobs.get(job_id)
+    if job is None:
+        abort(404)
+    if job.status == SUCCEEDED:
+        result = job.result
+    elif request.args.get("partial", "false").lower() == "true" and job.status in (QUEUED, RUNNING, CANCELLED):
+        result = jobs.partial_result(job)
+    else:
+        result = None
+    if result is None:
+        return {"msg": f"No result available for job with status '{job.status}'", **job.as_dict()}, 409
+    return current_app.response_class(result, mimetype="application/json")
 
 
 @api.get("/images/<path:resource>.<format>")
 @api.get("/tiles/<path:resource>/<z>/<x>/<y>.<format>")
+@profiled
 @inject
 def get_image(resource, x=None, y=None, z=None, format="png", requester: Requester = Provide[Container.requester]):
     """Request that physrisk converts an array to image.
@@ -121,84 +344,125 @@ def get_image(resource, x=None, y=None, z=None, format="png", requester: Request
     max_value = float(max_value_arg) if max_value_arg is not None else None
     colormap = request.args.get("colormap")
     scenario_id = request.args.get("scenarioId")
-    year = int(request.args.get("year"))  # type:ignore
+    year = int(request.args.get("year"))  # type: ignore
 
-    log.info(f"EMB - request_id:{request_id} min_value_arg:{min_value_arg} min_value:{min_value} max_value_arg:{max_value_arg} max_value:{max_value}")
+    log.info(
+        f"EMB - request_id:{request_id} min_value_arg:{min_value_arg} min_value:{min_value} max_value_arg:{max_value_arg} max_value:{max_value}"
+    )
     log.info(f"EMB - colormap:{colormap} scenario_id:{scenario_id} year:{year}")
 
-    try:
-        verify_jwt_in_request(optional=True)
-        # if no JWT, default to 'osc' access level
-        data_access: str = get_jwt().get("data_access", "osc")
-    except Exception as exc_info:
-        log.info(f"EMB - warning: No JWT for '{request_id}' request")
-        log.warning(f"No JWT for '{request_id}' request", exc_info=exc_info)
-        # 'public' or 'osc'
-        data_access: str = "osc"  # type:ignore
+    data_access = _data_access()
 
     tilex = None if not x or not y or not z else (int(x), int(y), int(z))
     group_idx = [data_access]
     log.info(f"EMB - tilex:{tilex} group_idx:{group_idx} resource:{resource}")
 
+    request_dict = image_request(
+        resource,
+        tilex,
+        scenario_id,
+        year,
+        group_idx,
+        colormap=colormap,
+        min_value=min_value,
+        max_value=max_value,
+    )
+
+    tile_cache = current_app.tile_cache
+    cache_key = tile_cache.key(request_dict, format)
+    etag = compute_etag(cache_key, current_app.config["DATASET_VERSION"])
+    max_age = current_app.config["IMAGE_CACHE_MAX_AGE"]
+    if is_not_modified(etag):
+        return not_modified_response(etag, max_age)
+
     response = None
     try:
-        image_binary = requester.get_image(
-            request_dict={
-                "resource": resource,
-                "tile": tilex,
-                "colormap": colormap,
-                "scenario_id": scenario_id,
-                "year": year,
-                "group_ids": group_idx,
-                "max_value": max_value,
-                "min_value": min_value,
-            }
+        image_binary = current_app.single_flight.do(
+            "images",
+            cache_key,
+            lambda: tile_cache.get_or_render(cache_key, lambda: _render_image(requester, request_dict)),
         )
         response = make_response(image_binary)
         response.headers.set("Content-Type", "image/png")
+        set_cache_headers(response, etag, max_age)
     except Exception as e:
         log.error("EMB - error getting image", exc_info=e)
         raise e
     return response
 
 
+@api.get("/data_access")
+def get_data_access():
+    """The caller's data-access group, in the X-Data-Access header; used by the proxy tier to key its cache."""
+    response = current_app.response_class(status=204)
+    response.headers[DATA_ACCESS_HEADER] = _data_access()
+    return response
+
+
 @api.get("/reset")
 @inject
 def reset(container: Container = Provide[Container]):
     # container.requester.reset()
     container.reset_singletons()
+    current_app.tile_cache.clear()
+    if current_app.hazard_cache is not None:
+        current_app.hazard_cache.clear()
+    current_app.response_cache.clear()
+    if current_app.impact_pool is not None:
+        # worker processes hold their own containers
+        current_app.impact_pool.restart()
+    # rebuild in the background so that this worker is not left cold for long, reporting not ready until rebuilt;
+    # this also restarts tile pre-warming. A warm-up already running sees the new generation and builds again
+    current_app.warm_up_generation += 1
+    current_app.ready = False
+    start_warm_up(current_app._get_current_object())
     return "Reset successful"
 
 
-@api.after_request
-def refresh_expiring_jwts(response):
+@api.get("/cache/stats")
+def cache_stats():
+    stats = {"tiles": current_app.tile_cache.stats()}
+    if current_app.hazard_cache is not None:
+        stats["hazard_data"] = current_app.hazard_cache.stats()
+    stats["zarr_stores"] = {root: store.as_dict() for root, store in store_stats.items()}
+    stats["single_flight"] = current_app.single_flight.stats()
+    stats["prepared_responses"] = current_app.response_cache.stats()
+    if current_app.compressor is not None:
+        stats["compressed_responses"] = current_app.compressor.cache_stats()
+    if current_app.tile_prewarm is not None:
+        stats["tile_prewarm"] = current_app.tile_prewarm.progress.as_dict()
+    return stats
+
+
+@api.before_request
+def load_jwt():
+    """Verify and decode the request's JWT, if any, once per request; its claims are kept in `g.jwt`."""
+    g.jwt = {}
     if request.method == "OPTIONS":
-        return response
+        return
     try:
-        verify_jwt_in_request(optional=True)
-        jwt = get_jwt()
-        if "exp" not in jwt:
-            return response
-        exp_timestamp = jwt["exp"]
-        RuntimeError
-        now = datetime.now(timezone.utc)
-        target_timestamp = datetime.timestamp(now + timedelta(minutes=30))
-        if target_timestamp > exp_timestamp:
-            access_token = create_access_token(identity=get_jwt_identity())
-            data = response.get_json()
-            if type(data) is dict:
-                data["access_token"] = access_token
-                response.data = json.dumps(data)
-        return response
+        with current_app.metrics.time("jwt"):
+            verify_jwt_in_request(optional=True)
+            g.jwt = get_jwt()
     except ExpiredSignatureError:
-        log = current_app.logger
-        log.info("Signature has expired")
-        return response
+        current_app.logger.info("Signature has expired")
     except Exception as exc_info:
-        log = current_app.logger
-        log.warning("Cannot refresh JWT", exc_info=exc_info)
-        # Case where there is not a valid JWT. Just return the original response
+        current_app.logger.warning(f"Invalid JWT for '{request.path}' request", exc_info=exc_info)
+
+
+@api.after_request
+def refresh_expiring_jwts(response):
+    """Send a new access token in the X-Access-Token header if the request's token expires within 30 minutes."""
+    jwt = g.get("jwt") or {}
+    if "exp" not in jwt:
         return response
+    target_timestamp = datetime.timestamp(datetime.now(timezone.utc) + timedelta(minutes=30))
+    if target_timestamp > jwt["exp"]:
+        additional_claims = {"data_access": jwt["data_access"]} if "data_access" in jwt else None
+        response.headers[ACCESS_TOKEN_HEADER] = create_access_token(
+            identity=get_jwt_identity(), additional_claims=additional_claims
+        )
+    return response
 
 
 @api.post("/logout")
@@ -0,0 +1,191 @@
+"""Compression of response bodies, with the content encoding negotiated from each request's Accept-Encoding.
+
+gzip is always available; brotli ('br') and zstd are used if the 'brotli' and 'zstandard' packages are installed.
+Streamed responses (e.g. NDJSON portfolio results) are compressed as they are sent, flushing after each chunk, and
+large bodies are compressed in slices as they are sent. Compressed bodies of responses with an entity tag are
+cached, so that a cacheable response is compressed once per encoding; the entity tag of a compressed response is
+made weak, since its body differs byte for byte from that of the uncompressed response.
+"""
+
+import gzip
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from flask import Response
+from werkzeug.datastructures import Accept
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None  # type: ignore
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None  # type: ignore
+
+DEFAULT_LEVELS = {"gzip": 6, "br": 4, "zstd": 3}
+
+# slices in which large bodies are compressed and sent
+SLICE_SIZE = 256 * 1024
+
+
+def available_encodings() -> List[str]:
+    return [e for e, module in (("zstd", zstandard), ("br", brotli), ("gzip", gzip)) if module is not None]
+
+
+class _StreamEncoder:
+    """Incremental compressor, flushing after each chunk so that the client receives complete chunks promptly."""
+
+    def __init__(self, encoding: str, level: int):
+        self.encoding = encoding
+        if encoding == "gzip":
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        elif encoding == "br":
+            self._compressor = brotli.Compressor(quality=level)
+        else:
+            self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "gzip":
+            return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        if self.encoding == "br":
+            return self._compressor.process(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+def compress(data: bytes, encoding: str, level: int) -> bytes:
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=level)
+    if encoding == "br":
+        return brotli.compress(data, quality=level)
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+class Compressor:
+    """Compresses responses in the encoding preferred by the client, among `encodings` (in order of preference
+    of the server where the client accepts several equally).
+
+    Args:
+        encodings (List[str]): Encodings to use, e.g. ['zstd', 'br', 'gzip']; those not installed are ignored.
+        levels (Dict[str, int]): Compression level for each encoding.
+        min_size (int): Bodies smaller than this many bytes are sent uncompressed.
+        stream_size (int): Bodies larger than this many bytes are compressed in slices as they are sent.
+        cache_max_bytes (int): Maximum total size of the cached compressed bodies of responses with an ETag.
+        skip_mimetypes (Iterable[str]): Types of bodies already compressed, e.g. PNG images and Parquet.
+    """
+
+    def __init__(
+        self,
+        encodings: Optional[List[str]] = None,
+        levels: Optional[Dict[str, int]] = None,
+        min_size: int = 1024,
+        stream_size: int = 4 * 1024**2,
+        cache_max_bytes: int = 32 * 1024**2,
+        skip_mimetypes: Iterable[str] = ("image/png", "application/vnd.apache.parquet"),
+    ):
+        available = available_encodings()
+        self.encodings = [e for e in (encodings or available) if e in available]
+        self.levels = {**DEFAULT_LEVELS, **(levels or {})}
+        self.min_size = min_size
+        self.stream_size = stream_size
+        self.cache_max_bytes = cache_max_bytes
+        self.skip_mimetypes = set(skip_mimetypes)
+        self._cache: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+        self._cache_bytes = 0
+        self._lock = threading.Lock()
+
+    def negotiate(self, accept_encodings: Accept) -> Optional[str]:
+        """Encoding to use for a request with the given Accept-Encoding, or None to send the body as it is."""
+        best, best_quality = None, 0.0
+        for encoding in self.encodings:
+            quality = accept_encodings[encoding]
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+    def compress_response(self, response: Response, accept_encodings: Accept) -> Response:
+        if not self._compressible(response):
+            return response
+        response.vary.add("Accept-Encoding")
+        encoding = self.negotiate(accept_encodings)
+        if encoding is None:
+            return response
+        if response.is_streamed:
+            response.response = self._stream(encoding, response.response)
+        else:
+            data = response.get_data()
+            if len(data) < self.min_size:
+                return response
+            etag, _ = response.get_etag()
+            if etag is not None:
+                response.set_data(self._cached(etag, encoding, data))
+                response.set_etag(etag, weak=True)
+            elif len(data) > self.stream_size:
+                slices = (data[i : i + SLICE_SIZE] for i in range(0, len(data), SLICE_SIZE))
+                response.response = self._stream(encoding, slices)
+            else:
+                response.set_data(compress(data, encoding, self.levels[encoding]))
+        if response.is_streamed:
+            response.headers.pop("Content-Length", None)
+        response.headers["Content-Encoding"] = encoding
+        return response
+
+    def cache_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._cache), "bytes": self._cache_bytes}
+
+    def _compressible(self, response: Response) -> bool:
+        return (
+            200 <= response.status_code < 300
+            and response.status_code != 204
+            and not response.direct_passthrough
+            and "Content-Encoding" not in response.headers
+            and response.mimetype not in self.skip_mimetypes
+            and not response.cache_control.no_transform
+        )
+
+    def _stream(self, encoding: str, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        encoder = _StreamEncoder(encoding, self.levels[encoding])
+        try:
+            for chunk in chunks:
+                if chunk:
+                    yield encoder.compress(chunk.encode() if isinstance(chunk, str) else chunk)
+            yield encoder.finish()
+        finally:
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+
+    def _cached(self, etag: str, encoding: str, data: bytes) -> bytes:
+        key = (etag, encoding)
+        with self._lock:
+            encoded = self._cache.get(key)
+            if encoded is not None:
+                self._cache.move_to_end(key)
+                return encoded
+        encoded = compress(data, encoding, self.levels[encoding])
+        with self._lock:
+            if key not in self._cache and len(encoded) <= self.cache_max_bytes:
+                self._cache[key] = encoded
+                self._cache_bytes += len(encoded)
+                while self._cache_bytes > self.cache_max_bytes:
+                    _, evicted = self._cache.popitem(last=False)
+                    self._cache_bytes -= len(evicted)
+        return encoded
+
+
+def parse_levels(value: str) -> Dict[str, int]:
+    """Compression levels from e.g. 'gzip=6,br=4,zstd=3'."""
+    levels = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        encoding, level = item.split("=")
+        levels[encoding.strip()] = int(level)
+    return levels
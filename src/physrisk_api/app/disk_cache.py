@@ -0,0 +1,155 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+
+class DiskCache:
+    """Size-capped, content-addressed byte cache held in a local directory.
+
+    Entries are written to a temporary file and atomically renamed into place, so a reader (in this or any
+    other process sharing the directory) either sees a complete entry or none at all. Reads touch the
+    entry's modification time, which is used as the recency order when the directory grows past
+    `max_bytes` and the least recently used entries are evicted.
+
+    The total size of the entries is kept in a file in the directory, updated under an exclusive file lock by
+    every process writing to it, so that the cap holds for the directory as a whole. Without `fcntl` (on
+    Windows) the lock only covers the threads of this process.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 1024**3, suffix: str = ""):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._size_path = os.path.join(directory, ".size")
+        self._lock_path = os.path.join(directory, ".lock")
+
+    def path(self, key: str) -> str:
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest + self.suffix)
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self.path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            # Entry may have been evicted by another process in the meantime; the data read is still valid.
+            pass
+        return data
+
+    def put(self, key: str, data: bytes):
+        path = self.path(key)
+        try:
+            # an entry overwritten no longer counts towards the size
+            replaced = os.stat(path).st_size
+        except OSError:
+            replaced = 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        with self._locked():
+            size = self._read_size() + len(data) - replaced
+            if size > self.max_bytes:
+                size = self._evict()
+            self._write_size(size)
+
+    def clear(self):
+        with self._locked():
+            for path, _, _ in self._entries():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._write_size(0)
+
+    def size(self) -> int:
+        with self._locked():
+            return self._read_size()
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self._lock_path, "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_size(self) -> int:
+        """Total size of the entries, as recorded by the last writer, or scanned if not recorded yet."""
+        try:
+            with open(self._size_path) as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            size = self._scan_size()
+            self._write_size(size)
+            return size
+
+    def _write_size(self, size: int):
+        with open(self._size_path, "w") as f:
+            f.write(str(max(size, 0)))
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                # temporary files, and the size and lock files
+                if name.startswith("."):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_mtime, stat.st_size
+
+    def _scan_size(self) -> int:
+        return sum(size for _, _, size in self._entries())
+
+    def _evict(self) -> int:
+        """Remove least recently used entries until the cache is below 90% of `max_bytes`.
+        The directory is rescanned so that entries written by other processes are accounted for."""
+        entries = sorted(self._entries(), key=lambda e: e[1])
+        total = sum(size for _, _, size in entries)
+        target = int(self.max_bytes * 0.9)
+        removed = 0
+        for path, _, size in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        logger.info(f"Evicted {removed} entries from disk cache {self.directory}")
+        return total
@@ -0,0 +1,148 @@
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from physrisk_api.app import json_backend
+
+# approximate per-entry bookkeeping overhead (key tuple, dict slot) in bytes, used for the memory bound
+ENTRY_OVERHEAD = 200
+
+ITEM_KEY_FIELDS = ("hazard_type", "event_type", "indicator_id", "indicator_model_gcm", "path", "scenario", "year")
+
+
+class HazardPointCache:
+    """Per-location cache of `get_hazard_data` results.
+
+    An incoming request is split into individual (item parameters, latitude, longitude) points. Coordinates are
+    quantized to `resolution` degrees and the quantized coordinates are what is sent to physrisk, so that every
+    point in the same cell shares one cached intensity curve. Points already cached are answered from memory;
+    the misses are sent to physrisk as one reduced request and the results merged back in the original order.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024**2, resolution: float = 1e-5):
+        self.max_bytes = max_bytes
+        self.resolution = resolution
+        self._entries: "OrderedDict[Tuple, Tuple[Dict[str, Any], Dict[str, Any], int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, request_dict: Dict[str, Any], fetch: Callable[[Dict[str, Any]], str]) -> str:
+        """Answer a `get_hazard_data` request, calling `fetch` (i.e. `Requester.get`) for cache misses only.
+
+        Args:
+            request_dict (Dict[str, Any]): get_hazard_data request, including 'group_ids'.
+            fetch (Callable[[Dict[str, Any]], str]): Function returning the JSON response for a request dict.
+
+        Returns:
+            str: JSON response, as returned by `Requester.get`.
+        """
+        request_key = json.dumps({k: v for k, v in request_dict.items() if k != "items"}, sort_keys=True)
+        items = request_dict["items"]
+        point_keys: List[List[Tuple]] = []
+        point_coords: List[List[Tuple[float, float]]] = []
+        for item in items:
+            item_key = (request_key,) + tuple(item.get(f) for f in ITEM_KEY_FIELDS)
+            coords = [self._quantize(lat, lon) for lat, lon in zip(item["latitudes"], item["longitudes"])]
+            point_coords.append([(q[0] * self.resolution, q[1] * self.resolution) for q in coords])
+            point_keys.append([item_key + q for q in coords])
+
+        found = self._lookup(point_keys)
+        missing_items, missing_keys = self._missing(items, point_keys, point_coords, found)
+
+        if missing_items:
+            resp_items = json_backend.loads(fetch({**request_dict, "items": missing_items})).get("items") or []
+            if len(resp_items) != len(missing_items) or any(
+                len(resp_item["intensity_curve_set"]) != len(keys) for resp_item, keys in zip(resp_items, missing_keys)
+            ):
+                # unexpected response shape: do not attempt to split it, just answer the original request
+                return fetch(request_dict)
+            with self._lock:
+                for resp_item, keys in zip(resp_items, missing_keys):
+                    meta = {k: v for k, v in resp_item.items() if k not in ("intensity_curve_set", "request_item_id")}
+                    for key, curve in zip(keys, resp_item["intensity_curve_set"]):
+                        found[key] = (meta, curve)
+                        self._insert(key, meta, curve)
+
+        resp_items = []
+        for item, keys in zip(items, point_keys):
+            meta = found[keys[0]][0] if keys else {}
+            resp_items.append(
+                {
+                    "intensity_curve_set": [found[key][1] for key in keys],
+                    "request_item_id": item["request_item_id"],
+                    **meta,
+                }
+            )
+        return json_backend.dumps({"items": resp_items}).decode()
+
+    def _lookup(self, point_keys: List[List[Tuple]]) -> Dict[Tuple, Tuple[Dict[str, Any], Dict[str, Any]]]:
+        found = {}
+        with self._lock:
+            for keys in point_keys:
+                for key in keys:
+                    entry = self._entries.get(key)
+                    if entry is not None:
+                        self._entries.move_to_end(key)
+                        found[key] = entry[:2]
+                        self.hits += 1
+                    else:
+                        self.misses += 1
+        return found
+
+    @staticmethod
+    def _missing(items, point_keys, point_coords, found):
+        """Items of a reduced request holding only the points that missed (each at most once), and their keys."""
+        missing_items = []
+        missing_keys = []
+        requested = set()
+        for item, keys, coords in zip(items, point_keys, point_coords):
+            item_missing = [
+                (key, coord) for key, coord in zip(keys, coords) if key not in found and key not in requested
+            ]
+            if not item_missing:
+                continue
+            requested.update(key for key, _ in item_missing)
+            missing_keys.append([key for key, _ in item_missing])
+            missing_items.append(
+                {
+                    **item,
+                    "latitudes": [coord[0] for _, coord in item_missing],
+                    "longitudes": [coord[1] for _, coord in item_missing],
+                }
+            )
+        return missing_items, missing_keys
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+    def _quantize(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        return round(float(latitude) / self.resolution), round(float(longitude) / self.resolution)
+
+    def _insert(self, key: Tuple, meta: Dict[str, Any], curve: Dict[str, Any]):
+        # caller must hold self._lock
+        size = ENTRY_OVERHEAD + 8 * sum(len(v) for v in curve.values() if isinstance(v, list))
+        previous: Optional[Tuple[Dict[str, Any], Dict[str, Any], int]] = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= previous[2]
+        self._entries[key] = (meta, curve, size)
+        self._bytes += size
+        while self._entries and self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted[2]
@@ -0,0 +1,46 @@
+import hashlib
+
+from flask import Response, request
+
+# response header naming the caller's data-access group, on which the proxy tier keys its cache
+DATA_ACCESS_HEADER = "X-Data-Access"
+# response header giving the proxy tier the freshness lifetime of a response that is private to clients
+ACCEL_EXPIRES_HEADER = "X-Accel-Expires"
+
+
+def compute_etag(*parts: str) -> str:
+    """Strong entity tag derived from the given parts, e.g. a cache key and the dataset version."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()[:32]
+
+
+def is_not_modified(etag: str) -> bool:
+    """True if the current request's If-None-Match header matches `etag`, by weak comparison: a client may hold
+    the weakly tagged compressed body of a response."""
+    return request.if_none_match.contains_weak(etag)
+
+
+def set_cache_headers(response: Response, etag: str, max_age: int, weak: bool = False) -> Response:
+    """Add validator and freshness headers so that browsers and the proxy tier can cache the response.
+
+    Responses depend on the caller's data-access group, read from the Authorization header, so they are private
+    to clients and any shared caches between them. The proxy tier of this app keys its cache on the group instead
+    (see nginx/physrisk-api.conf), taking the freshness lifetime from the X-Accel-Expires header, which nginx does
+    not pass on. The entity tag must be `weak` if the response may be sent with different content encodings.
+    """
+    response.set_etag(etag, weak=weak)
+    if max_age > 0:
+        response.cache_control.private = True
+        response.cache_control.max_age = max_age
+        response.headers[ACCEL_EXPIRES_HEADER] = str(max_age)
+    else:
+        response.cache_control.no_cache = True
+    response.vary.add("Authorization")
+    return response
+
+
+def not_modified_response(etag: str, max_age: int, weak: bool = False) -> Response:
+    return set_cache_headers(Response(status=304), etag, max_age, weak=weak)
@@ -0,0 +1,434 @@
+"""Asynchronous jobs for long-running requests, such as impact calculations for large portfolios.
+
+A submitted job is queued and run on a bounded pool of threads. Portfolio requests are run in chunks of assets,
+so that a job reports its progress and the results of the chunks completed so far can be retrieved before the
+job finishes. Jobs, their chunk results and final results are held in a `JobStore`: in memory, for a single
+server process, or in a SQLite database, which all processes of a server on one node can share. Jobs are evicted
+once they have not been updated for a configured time.
+
+Changes of a job's status are conditional on its current status, so that e.g. a job cancelled while it is being
+started is not then run. While a process has jobs queued or running, it updates them periodically; a queued or
+running job not updated for longer than a configured time (e.g. of a process that died) is marked as failed.
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field, fields, replace
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set
+
+from flask import Flask
+
+from physrisk_api.app import json_backend
+from physrisk_api.app.parallel import merge_impact_responses
+from physrisk_api.app.portfolio import ASSET_RESULT_KEYS, split_request
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+ACTIVE_STATUSES = (QUEUED, RUNNING)
+
+
+# requests that may be run as jobs
+JOB_REQUEST_IDS = {"get_hazard_data", "get_hazard_data_availability", "get_asset_exposure", "get_asset_impact"}
+
+
+class QueueFullError(Exception):
+    pass
+
+
+@dataclass
+class Job:
+    id: str
+    request_id: str
+    request: str
+    status: str = QUEUED
+    created: float = field(default_factory=time.time)
+    updated: float = field(default_factory=time.time)
+    done: int = 0
+    total: int = 0
+    error: Optional[str] = None
+    result: Optional[str] = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Status of the job, without the request and result."""
+        return {
+            "job_id": self.id,
+            "request_id": self.request_id,
+            "status": self.status,
+            "created": self.created,
+            "updated": self.updated,
+            "progress": {"done": self.done, "total": self.total},
+            "error": self.error,
+        }
+
+
+class JobStore(ABC):
+    @abstractmethod
+    def create(self, job: Job): ...
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[Job]: ...
+
+    @abstractmethod
+    def status(self, job_id: str) -> Optional[Job]:
+        """Job without its request and result, which may be large and are not needed to report its status."""
+
+    @abstractmethod
+    def update(self, job_id: str, status_in: Optional[Iterable[str]] = None, **values) -> bool:
+        """Update a job, only if its status is one of `status_in` if given; return True if it was updated."""
+
+    @abstractmethod
+    def add_chunk(self, job_id: str, index: int, response: str): ...
+
+    @abstractmethod
+    def chunks(self, job_id: str) -> List[str]:
+        """Responses of the chunks completed so far, in order."""
+
+    @abstractmethod
+    def count_active(self) -> int: ...
+
+    @abstractmethod
+    def evict(self, before: float) -> int:
+        """Remove jobs last updated before the given time, returning the number removed."""
+
+    @abstractmethod
+    def fail_stale(self, before: float, error: str) -> int:
+        """Mark queued or running jobs last updated before the given time as failed, returning their number."""
+
+
+class MemoryJobStore(JobStore):
+    def __init__(self):
+        self._jobs: Dict[str, Job] = {}
+        self._chunks: Dict[str, List[str]] = {}
+        self._lock = threading.Lock()
+
+    def create(self, job: Job):
+        with self._lock:
+            self._jobs[job.id] = job
+            self._chunks[job.id] = []
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return Job(**asdict(job)) if job is not None else None
+
+    def status(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return replace(job, request="", result=None) if job is not None else None
+
+    def update(self, job_id: str, status_in: Optional[Iterable[str]] = None, **values) -> bool:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or (status_in is not None and job.status not in status_in):
+                return False
+            for name, value in {"updated": time.time(), **values}.items():
+                setattr(job, name, value)
+            return True
+
+    def add_chunk(self, job_id: str, index: int, response: str):
+        with self._lock:
+            if job_id in self._chunks:
+                self._chunks[job_id].append(response)
+
+    def chunks(self, job_id: str) -> List[str]:
+        with self._lock:
+            return list(self._chunks.get(job_id, []))
+
+    def count_active(self) -> int:
+        with self._lock:
+            return sum(job.status in ACTIVE_STATUSES for job in self._jobs.values())
+
+    def evict(self, before: float) -> int:
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items() if job.updated < before]
+            for job_id in expired:
+                del self._jobs[job_id]
+                del self._chunks[job_id]
+            return len(expired)
+
+    def fail_stale(self, before: float, error: str) -> int:
+        with self._lock:
+            stale = [job for job in self._jobs.values() if job.status in ACTIVE_STATUSES and job.updated < before]
+            for job in stale:
+                job.status, job.error, job.updated = FAILED, error, time.time()
+            return len(stale)
+
+
+class SQLiteJobStore(JobStore):
+    """Job store in a SQLite database file, which can be shared by the processes of a server."""
+
+    _COLUMNS = [f.name for f in fields(Job)]
+    _STATUS_COLUMNS = [name for name in _COLUMNS if name not in ("request", "result")]
+
+    def __init__(self, path: str):
+        self.path = path
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, request_id TEXT, request TEXT, status TEXT, "
+                "created REAL, updated REAL, done INTEGER, total INTEGER, error TEXT, result TEXT)"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS job_chunks (job_id TEXT, idx INTEGER, response TEXT, "
+                "PRIMARY KEY (job_id, idx))"
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # a connection per operation, as connections cannot be shared between threads
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def create(self, job: Job):
+        values = asdict(job)
+        with self._connect() as db:
+            db.execute(
+                f"INSERT INTO jobs ({', '.join(self._COLUMNS)}) VALUES ({', '.join('?' * len(self._COLUMNS))})",
+                [values[name] for name in self._COLUMNS],
+            )
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._connect() as db:
+            row = db.execute(f"SELECT {', '.join(self._COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return Job(**dict(zip(self._COLUMNS, row))) if row is not None else None
+
+    def status(self, job_id: str) -> Optional[Job]:
+        with self._connect() as db:
+            row = db.execute(f"SELECT {', '.join(self._STATUS_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return Job(request="", **dict(zip(self._STATUS_COLUMNS, row))) if row is not None else None
+
+    def update(self, job_id: str, status_in: Optional[Iterable[str]] = None, **values) -> bool:
+        values = {"updated": time.time(), **values}
+        if not set(values) <= set(self._COLUMNS):
+            raise ValueError(f"Unknown job fields: {set(values) - set(self._COLUMNS)}")
+        sql = f"UPDATE jobs SET {', '.join(f'{name} = ?' for name in values)} WHERE id = ?"
+        params = [*values.values(), job_id]
+        if status_in is not None:
+            statuses = list(status_in)
+            sql += f" AND status IN ({', '.join('?' * len(statuses))})"
+            params += statuses
+        with self._connect() as db:
+            return db.execute(sql, params).rowcount > 0
+
+    def add_chunk(self, job_id: str, index: int, response: str):
+        with self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO job_chunks VALUES (?, ?, ?)", (job_id, index, response))
+
+    def chunks(self, job_id: str) -> List[str]:
+        with self._connect() as db:
+            rows = db.execute("SELECT response FROM job_chunks WHERE job_id = ? ORDER BY idx", (job_id,)).fetchall()
+        return [row[0] for row in rows]
+
+    def count_active(self) -> int:
+        with self._connect() as db:
+            return db.execute("SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)", ACTIVE_STATUSES).fetchone()[0]
+
+    def evict(self, before: float) -> int:
+        with self._connect() as db:
+            db.execute("DELETE FROM job_chunks WHERE job_id IN (SELECT id FROM jobs WHERE updated < ?)", (before,))
+            return db.execute("DELETE FROM jobs WHERE updated < ?", (before,)).rowcount
+
+    def fail_stale(self, before: float, error: str) -> int:
+        with self._connect() as db:
+            return db.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated = ? WHERE status IN (?, ?) AND updated < ?",
+                (FAILED, error, time.time(), *ACTIVE_STATUSES, before),
+            ).rowcount
+
+
+def create_job_store(backend: str, path: Optional[str] = None) -> JobStore:
+    """Job store for backend 'memory' or 'sqlite' (in the database file at `path`)."""
+    if backend == "memory":
+        return MemoryJobStore()
+    if backend == "sqlite":
+        if not path:
+            raise ValueError("A database path is required for the 'sqlite' job store")
+        return SQLiteJobStore(path)
+    raise ValueError(f"Job store backend must be 'memory' or 'sqlite'; got '{backend}'")
+
+
+def merge_responses(request_id: str, responses: List[str], chunk_requests: List[Dict[str, Any]]) -> Optional[str]:
+    """Response for consecutive chunks of a portfolio request, or None if their responses cannot be merged."""
+    if len(responses) == 1:
+        return responses[0]
+    if request_id == "get_asset_impact":
+        return merge_impact_responses(responses, chunk_requests)
+    result_key = ASSET_RESULT_KEYS[request_id]
+    parsed = [json_backend.loads(response) for response in responses]
+    merged = {**parsed[0], result_key: [result for response in parsed for result in response.get(result_key) or []]}
+    return json_backend.dumps(merged).decode()
+
+
+class JobManager:
+    """Runs jobs on a pool of `workers` threads, with at most `max_active` jobs queued or running at once.
+
+    Jobs queued or running are updated every `stale_after` / 5 seconds, and those of any process not updated for
+    `stale_after` seconds are marked as failed.
+    """
+
+    def __init__(
+        self,
+        app: Flask,
+        store: JobStore,
+        workers: int = 2,
+        max_active: int = 100,
+        ttl: float = 24 * 3600,
+        chunk_size: int = 500,
+        stale_after: float = 300,
+    ):
+        self.app = app
+        self.store = store
+        self.max_active = max_active
+        self.ttl = ttl
+        self.chunk_size = chunk_size
+        self.stale_after = stale_after
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._submit_lock = threading.Lock()
+        # jobs of this process queued or running, kept fresh by the heartbeat thread while there are any
+        self._active: Set[str] = set()
+        self._active_lock = threading.Lock()
+        self._heartbeat: Optional[threading.Thread] = None
+        self.fail_stale()
+
+    def submit(self, request_id: str, request_dict: Dict[str, Any]) -> Job:
+        """Queue a job, raising QueueFullError if `max_active` jobs are already queued or running."""
+        self.evict()
+        with self._submit_lock:
+            if self.store.count_active() >= self.max_active:
+                raise QueueFullError(f"{self.max_active} jobs are already queued or running")
+            job = Job(id=uuid.uuid4().hex, request_id=request_id, request=json.dumps(request_dict))
+            self.store.create(job)
+        self._track(job.id)
+        self._executor.submit(self._run, job.id, request_id, request_dict)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        self.evict()
+        return self.store.get(job_id)
+
+    def status(self, job_id: str) -> Optional[Job]:
+        """Job without its request and result (see `JobStore.status`)."""
+        self.evict()
+        return self.store.status(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Cancel a queued or running job; a running job stops once its current chunk is complete."""
+        if self.store.update(job_id, status_in=ACTIVE_STATUSES, status=CANCELLED):
+            logger.info(f"Cancelled job {job_id}")
+        return self.store.status(job_id)
+
+    def partial_result(self, job: Job) -> Optional[str]:
+        """Merged results of the chunks of a job completed so far, or None if they cannot be merged."""
+        responses = self.store.chunks(job.id)
+        if not responses:
+            return None
+        chunk_requests = list(self._split(job.request_id, json_backend.loads(job.request)))
+        return merge_responses(job.request_id, responses, chunk_requests[: len(responses)])
+
+    def evict(self):
+        evicted = self.store.evict(before=time.time() - self.ttl)
+        if evicted:
+            logger.info(f"Evicted {evicted} expired jobs")
+        self.fail_stale()
+
+    def fail_stale(self):
+        failed = self.store.fail_stale(
+            before=time.time() - self.stale_after, error="Job was abandoned by the process running it"
+        )
+        if failed:
+            logger.warning(f"Marked {failed} abandoned jobs as failed")
+
+    def _track(self, job_id: str):
+        with self._active_lock:
+            self._active.add(job_id)
+            if self._heartbeat is None or not self._heartbeat.is_alive():
+                self._heartbeat = threading.Thread(target=self._beat, name="job-heartbeat", daemon=True)
+                self._heartbeat.start()
+
+    def _beat(self):
+        while True:
+            time.sleep(self.stale_after / 5)
+            with self._active_lock:
+                active = list(self._active)
+                if not active:
+                    self._heartbeat = None
+                    return
+            for job_id in active:
+                self.store.update(job_id, status_in=ACTIVE_STATUSES)
+
+    def _split(self, request_id: str, request_dict: Dict[str, Any]) -> List[Dict[str, Any]]:
+        if request_id in ASSET_RESULT_KEYS:
+            return list(split_request(request_dict, self.chunk_size))
+        return [request_dict]
+
+    def _cancelled(self, job_id: str) -> bool:
+        job = self.store.status(job_id)
+        return job is None or job.status == CANCELLED
+
+    def _run(self, job_id: str, request_id: str, request_dict: Dict[str, Any]):
+        try:
+            self._run_job(job_id, request_id, request_dict)
+        finally:
+            with self._active_lock:
+                self._active.discard(job_id)
+
+    def _run_job(self, job_id: str, request_id: str, request_dict: Dict[str, Any]):
+        chunk_requests = self._split(request_id, request_dict)
+        if not self.store.update(job_id, status_in=(QUEUED,), status=RUNNING, total=len(chunk_requests)):
+            # cancelled (or abandoned) before it started
+            return
+        try:
+            with self.app.app_context():
+                requester = self.app.container.requester()
+
+                def fetch(d: Dict[str, Any]) -> str:
+                    return requester.get(request_id=request_id, request_dict=d)
+
+                result = self._run_chunks(job_id, request_id, request_dict, chunk_requests, fetch)
+        except Exception as exc_info:
+            logger.error(f"Job {job_id} for '{request_id}' failed", exc_info=exc_info)
+            self.store.update(
+                job_id, status_in=(RUNNING,), status=FAILED, error=f"Failed to complete '{request_id}' request"
+            )
+            return
+        if result is not None:
+            self.store.update(job_id, status_in=(RUNNING,), status=SUCCEEDED, result=result)
+
+    def _run_chunks(
+        self,
+        job_id: str,
+        request_id: str,
+        request_dict: Dict[str, Any],
+        chunk_requests: List[Dict[str, Any]],
+        fetch: Callable[[Dict[str, Any]], str],
+    ) -> Optional[str]:
+        responses = []
+        for index, chunk_request in enumerate(chunk_requests):
+            if self._cancelled(job_id):
+                return None
+            responses.append(fetch(chunk_request))
+            self.store.add_chunk(job_id, index, responses[-1])
+            self.store.update(job_id, status_in=(RUNNING,), done=index + 1)
+        result = merge_responses(request_id, responses, chunk_requests)
+        if result is None:
+            # e.g. portfolio-level impacts, which need all assets at once
+            logger.info(f"Chunks of job {job_id} cannot be merged; running whole")
+            result = fetch(request_dict)
+        return result
@@ -0,0 +1,77 @@
+"""JSON encoding and decoding, using orjson when it is installed and the standard library otherwise."""
+
+import json
+import re
+from typing import Any, Union
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore
+
+# responses up to this size are parsed to check for results; larger ones are scanned instead
+RESULT_CHECK_PARSE_LIMIT = 64 * 1024
+
+_RESULT_PATTERN = re.compile(r'"(?:items|models|asset_impacts)":\s*\[\s*[^\s\]]|"risk_measures":\s*\{\s*"')
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # physrisk may emit NaN/Infinity, which only the standard library accepts
+            pass
+    return json.loads(data)
+
+
+def dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+        except TypeError:
+            pass
+    return json.dumps(obj).encode()
+
+
+def has_results(data: str) -> bool:
+    """Check whether a physrisk response holds a non-empty list of items, models or asset impacts, or risk
+    measures, without parsing the whole of a large response.
+
+    Large responses are scanned for the first element of one of these fields; a non-empty field of the same
+    name nested deeper in an otherwise empty response would also be reported as a result.
+    """
+    if len(data) <= RESULT_CHECK_PARSE_LIMIT:
+        resp_data = loads(data)
+        return bool(
+            resp_data.get("items")
+            or resp_data.get("models")
+            or resp_data.get("asset_impacts")
+            or resp_data.get("risk_measures")
+        )
+    return _RESULT_PATTERN.search(data) is not None
+
+
+class JSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that uses orjson, if installed, for request parsing and response serialization."""
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        # Flask's own calls only pass formatting options; anything else is left to the standard library
+        if orjson is not None and set(kwargs) <= {"indent", "separators"}:
+            option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+            if self.sort_keys:
+                option |= orjson.OPT_SORT_KEYS
+            if kwargs.get("indent"):
+                option |= orjson.OPT_INDENT_2
+            try:
+                return orjson.dumps(obj, default=self.default, option=option).decode()
+            except TypeError:
+                pass
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s: Union[str, bytes], **kwargs: Any) -> Any:
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return loads(s)
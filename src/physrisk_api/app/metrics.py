@@ -0,0 +1,193 @@
+"""Request latency instrumentation, exported in the Prometheus text format at /metrics.
+
+Each request's duration and response size are recorded in histograms by endpoint (the URL rule, e.g.
+'/api/get_asset_impact' or the image tile rule), together with the time spent in phases of the hot path: JWT
+verification ('jwt'), request body decoding and parsing ('parse'), physrisk calculation ('compute': a call of
+`requester.get`, or the rendering of an image tile), physrisk's serialization of its response to JSON
+('serialize', recorded by `TimedRequester` and so also included in 'compute') and response compression
+('compress'). Cache hits and misses are read from the caches' own counters when metrics are scraped, so cost
+nothing per request.
+
+Metrics are held per process: with several server worker processes, each process is scraped separately.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from flask import Flask, current_app, g, has_app_context, has_request_context, request
+from physrisk.requests import Requester
+
+from physrisk_api.app.override_providers import store_stats
+
+PROMETHEUS_MIMETYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+SIZE_BUCKETS = tuple(float(4**i) * 256 for i in range(11))  # 256 B to 256 MiB
+
+
+class Histogram:
+    """Histogram with fixed buckets, by label values."""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str], buckets: Sequence[float]):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # per label values: count in each bucket (not cumulative, the last for values above all buckets), sum
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues: str):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = ([0] * (len(self.buckets) + 1), [0.0])
+            series[0][index] += 1
+            series[1][0] += value
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            series = [(labelvalues, list(counts), total[0]) for labelvalues, (counts, total) in self._series.items()]
+        for labelvalues, counts, total in sorted(series):
+            labels = _labels(zip(self.labelnames, labelvalues))
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                le = _labels([*zip(self.labelnames, labelvalues), ("le", _format(bound))])
+                yield f"{self.name}_bucket{le} {cumulative}"
+            yield f"{self.name}_sum{labels} {_format(total)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Metrics:
+    def __init__(self):
+        self.request_duration = Histogram(
+            "physrisk_request_duration_seconds",
+            "Time to handle a request, until the response (or the start of a streamed response) is ready.",
+            ["endpoint", "method", "status"],
+            LATENCY_BUCKETS,
+        )
+        self.phase_duration = Histogram(
+            "physrisk_request_phase_seconds",
+            "Time spent in a phase of handling a request.",
+            ["endpoint", "phase"],
+            LATENCY_BUCKETS,
+        )
+        self.response_size = Histogram(
+            "physrisk_response_size_bytes",
+            "Size of response bodies as sent (after compression), where known before sending.",
+            ["endpoint"],
+            SIZE_BUCKETS,
+        )
+
+    @contextmanager
+    def time(self, phase: str, endpoint: Optional[str] = None) -> Iterator[None]:
+        """Record the time spent in a phase of the current request (or of the given endpoint)."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phase_duration.observe(time.perf_counter() - started, endpoint or current_endpoint(), phase)
+
+    def start_request(self):
+        g.metrics_started = time.perf_counter()
+
+    def end_request(self, response):
+        started = g.get("metrics_started")
+        if started is None:
+            return response
+        endpoint = current_endpoint()
+        self.request_duration.observe(
+            time.perf_counter() - started, endpoint, request.method, str(response.status_code)
+        )
+        if not response.is_streamed and response.content_length is not None:
+            self.response_size.observe(response.content_length, endpoint)
+        return response
+
+    def render(self, app: Flask) -> str:
+        lines = [
+            *self.request_duration.render(),
+            *self.phase_duration.render(),
+            *self.response_size.render(),
+            *_cache_metrics(app),
+        ]
+        return "\n".join(lines) + "\n"
+
+
+class TimedRequester(Requester):
+    """physrisk Requester recording the time spent serializing responses to JSON."""
+
+    def dumps(self, dict):
+        started = time.perf_counter()
+        try:
+            return super().dumps(dict)
+        finally:
+            record_phase("serialize", time.perf_counter() - started)
+
+
+def record_phase(phase: str, seconds: float):
+    """Record time spent in a phase, if in the context of an app with metrics (not e.g. in a worker process)."""
+    metrics = getattr(current_app, "metrics", None) if has_app_context() else None
+    if metrics is not None:
+        metrics.phase_duration.observe(seconds, current_endpoint(), phase)
+
+
+def current_endpoint() -> str:
+    """Endpoint label of the current request: its URL rule, so that the number of label values is bounded."""
+    if not has_request_context():
+        # e.g. asynchronous jobs
+        return "background"
+    rule = request.url_rule
+    return rule.rule if rule is not None else "unmatched"
+
+
+def _cache_metrics(app: Flask) -> Iterator[str]:
+    lookups: List[Tuple[Dict[str, str], int]] = []
+    sizes: List[Tuple[Dict[str, str], int]] = []
+
+    def add(cache: str, stats: Dict[str, Any], results: Dict[str, str]):
+        for result, key in results.items():
+            lookups.append(({"cache": cache, "result": result}, stats[key]))
+        if "bytes" in stats:
+            sizes.append(({"cache": cache}, stats["bytes"]))
+
+    add("tiles", app.tile_cache.stats(), {"hit": "hits", "disk_hit": "disk_hits", "miss": "misses"})
+    if app.hazard_cache is not None:
+        add("hazard_data", app.hazard_cache.stats(), {"hit": "hits", "miss": "misses"})
+    add("prepared_responses", app.response_cache.stats(), {"hit": "hits", "miss": "misses"})
+    for root, stats in sorted(store_stats.items()):
+        stats = stats.as_dict()
+        lookups.append(({"cache": "zarr_chunks", "store": root, "result": "hit"}, stats["cache_hits"]))
+        lookups.append(({"cache": "zarr_chunks", "store": root, "result": "miss"}, stats["requests"]))
+    yield "# HELP physrisk_cache_lookups_total Cache lookups, by result."
+    yield "# TYPE physrisk_cache_lookups_total counter"
+    for labels, value in lookups:
+        yield f"physrisk_cache_lookups_total{_labels(labels.items())} {value}"
+    yield "# HELP physrisk_cache_bytes Size of cache contents held in memory."
+    yield "# TYPE physrisk_cache_bytes gauge"
+    for labels, value in sizes:
+        yield f"physrisk_cache_bytes{_labels(labels.items())} {value}"
+
+
+def _labels(items) -> str:
+    items = list(items)
+    if not items:
+        return ""
+    escaped = (f'{name}="{_escape(str(value))}"' for name, value in items)
+    return "{" + ",".join(escaped) + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format(value: Any) -> str:
+    if isinstance(value, str):
+        return value
+    return repr(float(value))
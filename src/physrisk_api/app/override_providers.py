@@ -1,33 +1,268 @@
+import asyncio
 import logging
 import os
-from pathlib import PurePosixPath
+import threading
+import time
+from dataclasses import dataclass, field, replace
+from pathlib import Path, PurePosixPath
+from typing import Any, Dict, Optional
 
 import s3fs
+from dependency_injector import providers
+from fsspec.implementations.local import LocalFileSystem
+from fsspec.mapping import FSMap
+from physrisk.container import Container, DefaultVulnerabilityModelsFactory
+
+from physrisk_api.app.disk_cache import DiskCache
+from physrisk_api.app.synthetic_hazard import SyntheticHazardSettings, ensure_generated
 
 logger = logging.getLogger(__name__)
 
-def provide_s3_zarr_store():
+ZARR_PATH = "hazard/hazard.zarr"
+
+
+@dataclass
+class StoreStats:
+    """Request counters for a zarr store, updated by the store's filesystem."""
+
+    requests: int = 0
+    cache_hits: int = 0
+    misses: int = 0
+    errors: int = 0
+    bytes_read: int = 0
+    seconds: float = 0.0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def record(self, started: float, data: Optional[bytes] = None, missing: bool = False, error: bool = False):
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.requests += 1
+            self.misses += missing
+            self.errors += error
+            self.bytes_read += len(data) if data is not None else 0
+            self.seconds += elapsed
+
+    def record_cache_hit(self):
+        with self._lock:
+            self.cache_hits += 1
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "cache_hits": self.cache_hits,
+                "misses": self.misses,
+                "errors": self.errors,
+                "bytes_read": self.bytes_read,
+                "seconds": round(self.seconds, 3),
+            }
+
+
+class ChunkCache:
+    """Read-through cache of objects read from the hazard data store, held on local disk (or tmpfs).
+
+    Zarr chunks are immutable for a given dataset version, which is therefore part of the cache key. Entries are
+    written atomically and the directory can be shared by all worker processes on a node; see `DiskCache`.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, dataset_version: str):
+        self.disk_cache = DiskCache(directory, max_bytes=max_bytes)
+        self.dataset_version = dataset_version
+
+    def key(self, path: str, args: tuple, kwargs: dict) -> str:
+        return repr((self.dataset_version, path, args, sorted(kwargs.items())))
+
+
+class CountingS3FileSystem(s3fs.S3FileSystem):
+    """S3 filesystem recording each object read in `stats`. Chunk reads from zarr all go through `_cat_file`,
+    which is answered from `chunk_cache` if one is set."""
+
+    stats: StoreStats
+    chunk_cache: Optional[ChunkCache] = None
+
+    async def _cat_file(self, path, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        key = self.chunk_cache.key(path, args, kwargs) if self.chunk_cache is not None else None
+        if key is not None:
+            # disk I/O is kept off the filesystem's event loop so that concurrent fetches are not held up
+            data = await loop.run_in_executor(None, self.chunk_cache.disk_cache.get, key)
+            if data is not None:
+                self.stats.record_cache_hit()
+                return data
+        started = time.perf_counter()
+        try:
+            data = await super()._cat_file(path, *args, **kwargs)
+        except FileNotFoundError:
+            self.stats.record(started, missing=True)
+            raise
+        except Exception:
+            self.stats.record(started, error=True)
+            raise
+        self.stats.record(started, data)
+        if key is not None:
+            await loop.run_in_executor(None, self.chunk_cache.disk_cache.put, key, data)
+        return data
+
+
+class CountingLocalFileSystem(LocalFileSystem):
+    """Local filesystem recording each file read in `stats`; stands in for S3 when benchmarking, including
+    reads through `chunk_cache` if one is set."""
+
+    stats: StoreStats
+    chunk_cache: Optional[ChunkCache] = None
+
+    def cat_file(self, path, *args, **kwargs):
+        key = self.chunk_cache.key(path, args, kwargs) if self.chunk_cache is not None else None
+        if key is not None:
+            data = self.chunk_cache.disk_cache.get(key)
+            if data is not None:
+                self.stats.record_cache_hit()
+                return data
+        started = time.perf_counter()
+        try:
+            data = super().cat_file(path, *args, **kwargs)
+        except FileNotFoundError:
+            self.stats.record(started, missing=True)
+            raise
+        self.stats.record(started, data)
+        if key is not None:
+            self.chunk_cache.disk_cache.put(key, data)
+        return data
+
+
+@dataclass(frozen=True)
+class S3Settings:
+    """Settings of the filesystem behind the zarr store, read from environment variables."""
+
+    access_key: Optional[str] = field(default_factory=lambda: os.environ.get("OSC_S3_ACCESS_KEY"))
+    secret_key: Optional[str] = field(default_factory=lambda: os.environ.get("OSC_S3_SECRET_KEY"))
+    bucket: Optional[str] = field(default_factory=lambda: os.environ.get("OSC_S3_BUCKET"))
+    # e.g. a moto or MinIO server standing in for S3
+    endpoint_url: Optional[str] = field(default_factory=lambda: os.environ.get("OSC_S3_ENDPOINT_URL"))
+    # a local directory holding the zarr root; if set, S3 is not used at all
+    local_path: Optional[str] = field(default_factory=lambda: os.environ.get("OSC_ZARR_LOCAL_PATH"))
+    max_pool_connections: int = field(default_factory=lambda: int(os.environ.get("OSC_S3_MAX_POOL_CONNECTIONS", 64)))
+    # maximum number of chunks fetched concurrently by one zarr read
+    max_concurrency: int = field(default_factory=lambda: int(os.environ.get("OSC_S3_MAX_CONCURRENCY", 32)))
+    max_attempts: int = field(default_factory=lambda: int(os.environ.get("OSC_S3_MAX_ATTEMPTS", 5)))
+    connect_timeout: float = field(default_factory=lambda: float(os.environ.get("OSC_S3_CONNECT_TIMEOUT", 5)))
+    read_timeout: float = field(default_factory=lambda: float(os.environ.get("OSC_S3_READ_TIMEOUT", 30)))
+    # used for file-like reads (e.g. inventory files); zarr chunks are always read whole
+    cache_type: str = field(default_factory=lambda: os.environ.get("OSC_S3_CACHE_TYPE", "readahead"))
+    block_size: int = field(default_factory=lambda: int(os.environ.get("OSC_S3_BLOCK_SIZE", 5 * 1024**2)))
+    # optional read-through cache of chunks on local disk, shared by all processes using the same directory
+    chunk_cache_dir: Optional[str] = field(default_factory=lambda: os.environ.get("ZARR_CHUNK_CACHE_DIR"))
+    chunk_cache_max_bytes: int = field(
+        default_factory=lambda: int(os.environ.get("ZARR_CHUNK_CACHE_MAX_BYTES", 10 * 1024**3))
+    )
+    dataset_version: str = field(default_factory=lambda: os.environ.get("DATASET_VERSION", ZARR_PATH))
+
+
+_filesystems: Dict[S3Settings, Any] = {}
+_filesystems_lock = threading.Lock()
+
+# request counters of each store created, keyed by store root
+store_stats: Dict[str, StoreStats] = {}
+
+
+def get_filesystem(settings: S3Settings):
+    """Filesystem for the given settings, created once and then shared by all stores of the app."""
+    with _filesystems_lock:
+        fs = _filesystems.get(settings)
+        if fs is None:
+            fs = _create_filesystem(settings)
+            fs.stats = StoreStats()
+            if settings.chunk_cache_dir:
+                fs.chunk_cache = ChunkCache(
+                    settings.chunk_cache_dir, settings.chunk_cache_max_bytes, settings.dataset_version
+                )
+            _filesystems[settings] = fs
+        return fs
+
+
+def _create_filesystem(settings: S3Settings):
+    if settings.local_path:
+        return CountingLocalFileSystem(skip_instance_cache=True)
+    fs = CountingS3FileSystem(
+        anon=False,
+        key=settings.access_key,
+        secret=settings.secret_key,
+        endpoint_url=settings.endpoint_url,
+        default_block_size=settings.block_size,
+        default_cache_type=settings.cache_type,
+        config_kwargs={
+            "max_pool_connections": settings.max_pool_connections,
+            "connect_timeout": settings.connect_timeout,
+            "read_timeout": settings.read_timeout,
+            "retries": {"max_attempts": settings.max_attempts, "mode": "adaptive"},
+        },
+        # cache instances ourselves, keyed on all settings
+        skip_instance_cache=True,
+    )
+    # concurrency of multi-key reads such as zarr's getitems (not accepted by the S3FileSystem constructor)
+    fs.batch_size = settings.max_concurrency
+    return fs
+
+
+def provide_s3_zarr_store(settings: Optional[S3Settings] = None):
     """Example provider, used to override providers from physrisk Container.
 
+    The S3 filesystem is configured from OSC_S3_* environment variables (see `S3Settings`) and shared across
+    the app. If OSC_ZARR_LOCAL_PATH is set, the store reads from that local directory instead. If
+    ZARR_CHUNK_CACHE_DIR is set, chunks are cached in that directory after they are first read.
+
+    Args:
+        settings (Optional[S3Settings]): Settings to use instead of those from environment variables.
+
     Returns:
         MutableMapping: Zarr store.
     """
-    access_key = os.environ.get("OSC_S3_ACCESS_KEY")
-    secret_key = os.environ.get("OSC_S3_SECRET_KEY")
-    s3_bucket = os.environ.get("OSC_S3_BUCKET")
-    logger.debug(f"\n\nEMB - Using s3_bucket:{s3_bucket}\n\n")
+    settings = settings or S3Settings()
+    fs = get_filesystem(settings)
+    if settings.local_path:
+        root = settings.local_path
+    else:
+        root = str(PurePosixPath(settings.bucket, ZARR_PATH))
+    logger.debug(f"Using zarr store root:{root}")
 
-    zarr_path = "hazard/hazard.zarr"
-    logger.debug(f"EMB - Using zarr_path:{zarr_path}")
+    store = FSMap(root=root, fs=fs, check=False)
+    store_stats[root] = fs.stats
+    return store
 
-    s3 = s3fs.S3FileSystem(anon=False, key=access_key, secret=secret_key)
 
-    root = str(PurePosixPath(s3_bucket, zarr_path))
-    logger.debug(f"EMB - Using root:{root}")
+def provide_synthetic_zarr_store():
+    """Provider of a zarr store of synthetic hazard data, generated in SYNTHETIC_HAZARD_DIR if not there already
+    (see `physrisk_api.app.synthetic_hazard`). The store is read as a local store by `provide_s3_zarr_store`, so
+    that store statistics and the chunk cache apply as they would to S3.
 
-    store = s3fs.S3Map(
-        root=root,
-        s3=s3,
-        check=False,
-    )
-    return store
+    Returns:
+        MutableMapping: Zarr store.
+    """
+    synthetic = SyntheticHazardSettings()
+    root = ensure_generated(str(Path(synthetic.directory, ZARR_PATH)), synthetic)
+    return provide_s3_zarr_store(replace(S3Settings(), local_path=root))
+
+
+def create_container(requester_cls: Optional[type] = None) -> Container:
+    """physrisk Container with the providers of this app overridden.
+
+    The zarr store is that of `provide_s3_zarr_store`, or of `provide_synthetic_zarr_store` if
+    SYNTHETIC_HAZARD_DIR is set. The vulnerability models factory, which reads the embedded vulnerability
+    configuration when created, is a singleton rather than created anew for each use, so that the one loaded
+    by `warm_up_shared` is the one the requester holds.
+
+    Args:
+        requester_cls (Optional[type]): Subclass of physrisk's Requester to provide instead of Requester.
+    """
+    container = Container()
+    if SyntheticHazardSettings().directory:
+        container.override_providers(zarr_store=providers.Singleton(provide_synthetic_zarr_store))
+    else:
+        # this is not needed but demonstrates how to override providers in physrisk Container.
+        container.override_providers(zarr_store=providers.Singleton(provide_s3_zarr_store))
+    container.override_providers(vulnerability_models_factory=providers.Singleton(DefaultVulnerabilityModelsFactory))
+    if requester_cls is not None:
+        container.override_providers(requester=providers.Singleton(requester_cls, **container.requester.kwargs))
+    # container.override_providers(config =
+    # providers.Configuration(default={"zarr_sources": ["embedded", "hazard_test"]}))
+    return container
@@ -0,0 +1,164 @@
+"""Parallel execution of large get_asset_impact requests: the portfolio is split into chunks of assets, the chunks
+are run on a pool of worker processes, each with its own physrisk Container, and the chunk responses are merged
+back in input order.
+
+Chunk responses are merged only where the result is exactly that of a single call on the whole portfolio: asset
+impacts and per-asset risk measures are concatenated, and default asset IDs are renumbered. Portfolio-level
+outputs (portfolio impacts, portfolio risk measures) depend on all assets together; if any chunk has them, or if
+the chunks' risk measure definitions differ, the request is run again as a single call.
+"""
+
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor
+from itertools import repeat
+from typing import Any, Callable, Dict, List, Optional
+
+from physrisk_api.app import json_backend
+from physrisk_api.app.portfolio import split_request
+
+logger = logging.getLogger(__name__)
+
+# requests that may be split into chunks of assets
+CHUNKED_REQUEST_IDS = {"get_asset_impact"}
+
+# fields of the risk measures that must be the same for all chunks
+_SHARED_MEASURE_FIELDS = ("score_based_measure_set_defn", "measures_definitions", "scenarios")
+
+_container = None
+
+
+def _init_worker():
+    global _container
+    from physrisk_api.app.override_providers import create_container
+
+    _container = create_container()
+
+
+def _run_chunk(request_id: str, request_dict: Dict[str, Any]) -> str:
+    return _container.requester().get(request_id=request_id, request_dict=request_dict)
+
+
+def _merge_measures_for_assets(chunks: List[List[Dict[str, Any]]]) -> Optional[List[Dict[str, Any]]]:
+    keys = [entry["key"] for entry in chunks[0]]
+    if any([entry["key"] for entry in chunk] != keys for chunk in chunks[1:]):
+        return None
+    merged = []
+    for entries in zip(*chunks):
+        entry = dict(entries[0])
+        for name, value in entry.items():
+            if isinstance(value, list):
+                entry[name] = [v for e in entries for v in e.get(name) or []]
+            elif name != "key" and any(e.get(name) != value for e in entries):
+                return None
+        merged.append(entry)
+    return merged
+
+
+def _merge_risk_measures(
+    responses: List[Dict[str, Any]], chunk_requests: List[Dict[str, Any]]
+) -> Optional[Dict[str, Any]]:
+    measures = [response.get("risk_measures") for response in responses]
+    if all(m is None for m in measures):
+        return None
+    if any(m is None or m.get("measures_for_portfolio") for m in measures):
+        raise _NotMergeable()
+    first = measures[0]
+    if any(m.get(name) != first.get(name) for m in measures[1:] for name in _SHARED_MEASURE_FIELDS):
+        raise _NotMergeable()
+    measures_for_assets = _merge_measures_for_assets([m.get("measures_for_assets", []) for m in measures])
+    if measures_for_assets is None:
+        raise _NotMergeable()
+    asset_ids = []
+    start = 0
+    for m, chunk in zip(measures, chunk_requests):
+        items = chunk["assets"]["items"]
+        # assets without an ID are named by their position in the request
+        asset_ids.extend(
+            f"asset_{start + i}" if item.get("id") is None else asset_id
+            for i, (item, asset_id) in enumerate(zip(items, m["asset_ids"]))
+        )
+        start += len(items)
+    return {**first, "measures_for_assets": measures_for_assets, "asset_ids": asset_ids}
+
+
+class _NotMergeable(Exception):
+    pass
+
+
+def merge_impact_responses(responses: List[str], chunk_requests: List[Dict[str, Any]]) -> Optional[str]:
+    """Merge the get_asset_impact responses of consecutive chunks of a portfolio into the response for the whole
+    portfolio, or return None if they cannot be merged exactly."""
+    parsed = [json_backend.loads(response) for response in responses]
+    if any(response.get("portfolio_impacts") for response in parsed):
+        return None
+    merged: Dict[str, Any] = dict(parsed[0])
+    if any("asset_impacts" in response for response in parsed):
+        merged["asset_impacts"] = [impact for response in parsed for impact in response.get("asset_impacts") or []]
+    try:
+        risk_measures = _merge_risk_measures(parsed, chunk_requests)
+    except _NotMergeable:
+        return None
+    if risk_measures is not None:
+        merged["risk_measures"] = risk_measures
+    return json_backend.dumps(merged).decode()
+
+
+class ImpactPool:
+    """Pool of worker processes running large portfolio requests in chunks of `chunk_size` assets.
+
+    Worker processes are started on first use, and each builds its own physrisk Container. They are started
+    with 'spawn' rather than forked from a multi-threaded server process.
+    """
+
+    def __init__(
+        self,
+        processes: int,
+        chunk_size: int,
+        executor_factory: Optional[Callable[[], Executor]] = None,
+        run_chunk: Callable[[str, Dict[str, Any]], str] = _run_chunk,
+    ):
+        self.processes = processes
+        self.chunk_size = chunk_size
+        self.run_chunk = run_chunk
+        self._executor_factory = executor_factory or self._process_pool
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+
+    def _process_pool(self) -> Executor:
+        return ProcessPoolExecutor(
+            max_workers=self.processes, mp_context=multiprocessing.get_context("spawn"), initializer=_init_worker
+        )
+
+    def executor(self) -> Executor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = self._executor_factory()
+            return self._executor
+
+    def get(self, request_id: str, request_dict: Dict[str, Any], fetch: Callable[[Dict[str, Any]], str]) -> str:
+        """Response to a request, computed in chunks on the pool if the request is large enough, otherwise (or if
+        chunk responses cannot be merged exactly) by `fetch`."""
+        items = (request_dict.get("assets") or {}).get("items") or []
+        if request_id not in CHUNKED_REQUEST_IDS or len(items) <= self.chunk_size:
+            return fetch(request_dict)
+        chunk_requests = list(split_request(request_dict, self.chunk_size))
+        responses = list(self.executor().map(self.run_chunk, repeat(request_id), chunk_requests))
+        merged = merge_impact_responses(responses, chunk_requests)
+        if merged is None:
+            logger.info(f"Responses for {len(chunk_requests)} chunks of '{request_id}' cannot be merged; running whole")
+            return fetch(request_dict)
+        return merged
+
+    def restart(self) -> Optional[threading.Thread]:
+        """Replace the worker processes, e.g. to pick up a reset Container. Requests already running finish on the
+        old workers, which are then stopped by the thread returned; later requests run on new workers."""
+        with self._lock:
+            executor = self._executor
+            if executor is None:
+                return None
+            self._executor = self._executor_factory()
+        thread = threading.Thread(target=executor.shutdown, name="impact-pool-shutdown", daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,46 @@
+from typing import Any, Callable, Dict, Iterator
+
+from physrisk_api.app import json_backend
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+
+# For requests on portfolios of assets, the response key holding one result per asset.
+ASSET_RESULT_KEYS = {
+    "get_asset_exposure": "items",
+    "get_asset_impact": "asset_impacts",
+}
+
+
+def split_request(request_dict: Dict[str, Any], chunk_size: int) -> Iterator[Dict[str, Any]]:
+    """Split a portfolio request into requests for consecutive chunks of at most `chunk_size` assets."""
+    assets = request_dict["assets"]["items"]
+    for start in range(0, max(len(assets), 1), chunk_size):
+        yield {**request_dict, "assets": {**request_dict["assets"], "items": assets[start : start + chunk_size]}}
+
+
+def iter_ndjson(
+    fetch: Callable[[Dict[str, Any]], str], request_id: str, request_dict: Dict[str, Any], chunk_size: int
+) -> Iterator[bytes]:
+    """Run a portfolio request chunk by chunk, yielding one newline-delimited JSON line per asset result.
+
+    Only one chunk's response is held in memory at a time. Other non-empty parts of a chunk's response
+    (e.g. 'risk_measures') are yielded as an extra line after that chunk's assets, together with the chunk's
+    asset index range.
+
+    Args:
+        fetch (Callable[[Dict[str, Any]], str]): Function returning the JSON response for a request dict.
+        request_id (str): Request identifier, e.g. 'get_asset_exposure'.
+        request_dict (Dict[str, Any]): The full portfolio request.
+        chunk_size (int): Number of assets per call to physrisk.
+    """
+    result_key = ASSET_RESULT_KEYS[request_id]
+    start = 0
+    for chunk in split_request(request_dict, chunk_size):
+        resp_data = json_backend.loads(fetch(chunk))
+        for result in resp_data.pop(result_key, None) or []:
+            yield json_backend.dumps(result) + b"\n"
+        end = start + len(chunk["assets"]["items"])
+        extra = {k: v for k, v in resp_data.items() if v}
+        if extra:
+            yield json_backend.dumps({"chunk": {"start": start, "end": end}, **extra}) + b"\n"
+        start = end
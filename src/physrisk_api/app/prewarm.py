@@ -0,0 +1,212 @@
+"""Pre-warming of the tile cache for the zoom levels and regions that users look at most.
+
+Targets are read from a JSON file, given by TILE_PREWARM_CONFIG, holding a list of objects such as:
+
+    {
+        "resource": "inundation/river_tudelft/v2/flood_depth_unprot_{scenario}_{year}",
+        "scenarios": ["historical", "rcp8p5"],
+        "years": [1985, 2050],
+        "bbox": [5.0, 47.0, 15.0, 55.0],
+        "zooms": [0, 1, 2, 3, 4, 5, 6, 7, 8],
+        "min_value": 0.0,
+        "max_value": 5.0
+    }
+
+where `bbox` is [min longitude, min latitude, max longitude, max latitude]. Tiles are rendered through the same
+cache as the /api/tiles endpoint, so that the first users after a deploy or /api/reset do not pay the render
+latency. Pre-warming runs in the background once an app has warmed up (see physrisk_api.app.warmup), or on demand
+with `flask --app physrisk_api.app prewarm-tiles CONFIG`; run on demand, it is only of use to servers sharing the
+on-disk tier of the tile cache (TILE_CACHE_DIR).
+"""
+
+import logging
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import click
+from flask import Flask, current_app
+
+from physrisk_api.app import json_backend
+from physrisk_api.app.tile_cache import image_request
+
+logger = logging.getLogger(__name__)
+
+# latitude limit of the Web Mercator tiling
+MAX_LATITUDE = 85.0511
+
+
+def tile_xy(latitude: float, longitude: float, zoom: int) -> Tuple[int, int]:
+    """Web Mercator (x, y) of the tile at zoom level `zoom` containing the given point."""
+    n = 2**zoom
+    lat_rad = math.radians(max(-MAX_LATITUDE, min(MAX_LATITUDE, latitude)))
+    x = int((longitude + 180.0) / 360.0 * n)
+    y = int((1.0 - math.log(math.tan(lat_rad) + 1 / math.cos(lat_rad)) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+@dataclass
+class PrewarmTarget:
+    resource: str
+    scenarios: List[str]
+    years: List[int]
+    # min longitude, min latitude, max longitude, max latitude
+    bbox: Tuple[float, float, float, float] = (-180.0, -MAX_LATITUDE, 180.0, MAX_LATITUDE)
+    zooms: List[int] = field(default_factory=lambda: list(range(9)))
+    colormap: Optional[str] = None
+    min_value: Optional[float] = None
+    max_value: Optional[float] = None
+    # groups of the users the tiles are rendered for; 'osc' is the default access level
+    group_ids: List[str] = field(default_factory=lambda: ["osc"])
+    format: str = "png"
+
+    def __post_init__(self):
+        # as parsed from the query of a tile request, so that pre-warmed tiles have the same cache keys; a JSON
+        # config may give e.g. a value of 0 rather than 0.0, or a year as a string
+        self.years = [int(year) for year in self.years]
+        self.bbox = tuple(float(value) for value in self.bbox)  # type: ignore
+        self.zooms = [int(zoom) for zoom in self.zooms]
+        self.min_value = float(self.min_value) if self.min_value is not None else None
+        self.max_value = float(self.max_value) if self.max_value is not None else None
+
+    def tiles(self) -> Iterator[Tuple[int, int, int]]:
+        min_lon, min_lat, max_lon, max_lat = self.bbox
+        for z in self.zooms:
+            x0, y0 = tile_xy(max_lat, min_lon, z)
+            x1, y1 = tile_xy(min_lat, max_lon, z)
+            for x in range(x0, x1 + 1):
+                for y in range(y0, y1 + 1):
+                    yield (x, y, z)
+
+    def requests(self) -> Iterator[Dict[str, Any]]:
+        for scenario in self.scenarios:
+            for year in self.years:
+                for tile in self.tiles():
+                    yield image_request(
+                        self.resource,
+                        tile,
+                        scenario,
+                        year,
+                        self.group_ids,
+                        colormap=self.colormap,
+                        min_value=self.min_value,
+                        max_value=self.max_value,
+                    )
+
+
+def load_targets(path: str) -> List[PrewarmTarget]:
+    with open(path, "rb") as f:
+        return [PrewarmTarget(**target) for target in json_backend.loads(f.read())]
+
+
+@dataclass
+class PrewarmProgress:
+    total: int = 0
+    done: int = 0
+    failed: int = 0
+    seconds: float = 0.0
+    finished: bool = False
+    _started: float = field(default_factory=time.perf_counter, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def record(self, ok: bool) -> int:
+        with self._lock:
+            self.done += 1
+            self.failed += not ok
+            self.seconds = time.perf_counter() - self._started
+            return self.done
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "total": self.total,
+                "done": self.done,
+                "failed": self.failed,
+                "seconds": round(self.seconds, 3),
+                "finished": self.finished,
+            }
+
+
+def _render(app: Flask, request_dict: Dict[str, Any], format: str) -> bool:
+    try:
+        with app.app_context():
+            requester = app.container.requester()
+            key = app.tile_cache.key(request_dict, format)
+            app.tile_cache.get_or_render(key, lambda: requester.get_image(request_dict))
+        return True
+    except Exception as exc_info:
+        logger.debug(f"Failed to pre-warm tile {request_dict}", exc_info=exc_info)
+        return False
+
+
+def prewarm_tiles(
+    app: Flask,
+    targets: List[PrewarmTarget],
+    workers: int = 2,
+    progress: Optional[PrewarmProgress] = None,
+    stop: Optional[threading.Event] = None,
+) -> PrewarmProgress:
+    """Render the tiles of all targets into the app's tile cache, using at most `workers` threads.
+
+    Tiles already cached are not rendered again. Progress is logged at every tenth of the total and kept in
+    `progress`; setting `stop` abandons the tiles not yet started.
+    """
+    progress = progress or PrewarmProgress()
+    stop = stop or threading.Event()
+    jobs = [(request_dict, target.format) for target in targets for request_dict in target.requests()]
+    progress.total = len(jobs)
+    log_every = max(len(jobs) // 10, 1)
+
+    def run(job) -> None:
+        if stop.is_set():
+            return
+        done = progress.record(_render(app, *job))
+        if done % log_every == 0 or done == progress.total:
+            logger.info(f"Pre-warmed {done}/{progress.total} tiles ({progress.failed} failed)")
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tile-prewarm") as executor:
+        list(executor.map(run, jobs))
+    progress.finished = True
+    return progress
+
+
+class PrewarmJob:
+    """Pre-warming running in a background thread."""
+
+    def __init__(self, app: Flask, targets: List[PrewarmTarget], workers: int):
+        self.progress = PrewarmProgress()
+        self.stop = threading.Event()
+        self.thread = threading.Thread(
+            target=prewarm_tiles, args=(app, targets, workers, self.progress, self.stop), daemon=True
+        )
+        self.thread.start()
+
+
+def start_prewarm(app: Flask) -> Optional[PrewarmJob]:
+    """Start pre-warming the app's tile cache in the background if TILE_PREWARM_CONFIG is set, stopping any
+    pre-warming already running."""
+    config_path = app.config.get("TILE_PREWARM_CONFIG")
+    if not config_path:
+        return None
+    if app.tile_prewarm is not None:
+        app.tile_prewarm.stop.set()
+    try:
+        targets = load_targets(config_path)
+    except Exception as exc_info:
+        app.logger.error(f"Cannot load tile pre-warming targets from {config_path}", exc_info=exc_info)
+        return None
+    app.tile_prewarm = PrewarmJob(app, targets, app.config["TILE_PREWARM_WORKERS"])
+    return app.tile_prewarm
+
+
+@click.command("prewarm-tiles")
+@click.argument("config_path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--workers", default=None, type=int, help="Number of tiles rendered concurrently.")
+def prewarm_tiles_command(config_path: str, workers: Optional[int]):
+    """Render the tiles listed in CONFIG_PATH into the tile cache."""
+    app = current_app._get_current_object()
+    progress = prewarm_tiles(app, load_targets(config_path), workers or app.config["TILE_PREWARM_WORKERS"])
+    click.echo(f"Pre-warmed {progress.done} tiles in {progress.seconds:.1f}s; {progress.failed} failed")
@@ -0,0 +1,146 @@
+"""On-demand sampling profiler for live requests.
+
+Profiling is enabled only if a key is configured (PROFILING_KEY). A request is profiled if it has the key in the
+X-Profile-Key header, or else at random with the configured sampling rate (PROFILING_SAMPLE_RATE, 0 by default).
+While the handler of a profiled request runs, a sampling thread records the stack of the request's thread at
+fixed intervals. Time spent waiting for zarr reads, in vulnerability models or serializing therefore shows in
+the stacks in proportion to its duration, at a cost only to profiled requests. Work done in other processes
+(e.g. the impact pool) is not sampled, and a streamed response is profiled only until streaming starts.
+
+Profiles are kept in a bounded ring buffer, listed at /debug/profiles and fetched as collapsed stacks (one line
+per distinct stack with its sample count, as read by flamegraph.pl and speedscope) at /debug/profiles/<id>;
+both require the key. The ID of a request's profile is returned in its X-Profile-Id header.
+"""
+
+import functools
+import hmac
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from types import FrameType
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional
+
+from flask import current_app, request
+
+PROFILE_KEY_HEADER = "X-Profile-Key"
+PROFILE_ID_HEADER = "X-Profile-Id"
+
+
+@dataclass
+class Profile:
+    id: str
+    path: str
+    started: float
+    duration: float = 0.0
+    stacks: Counter = field(default_factory=Counter)
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Summary of the profile, without the stacks."""
+        return {
+            "id": self.id,
+            "path": self.path,
+            "started": self.started,
+            "duration": round(self.duration, 6),
+            "samples": sum(self.stacks.values()),
+        }
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def collapse(frame: Optional[FrameType]) -> str:
+    """Stack of a frame, outermost call first, with frames separated by ';'."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class _Sampler(threading.Thread):
+    def __init__(self, thread_id: int, interval: float, stacks: Counter):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = stacks
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[collapse(frame)] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class Profiler:
+    """Samples the stacks of profiled requests and keeps the last `max_profiles` profiles.
+
+    Args:
+        key (str): Key that a request must present to be profiled on demand or to read profiles.
+        sample_rate (float): Fraction of requests profiled at random.
+        interval (float): Seconds between samples of a profiled request's stack.
+        max_profiles (int): Number of profiles kept.
+    """
+
+    def __init__(self, key: str, sample_rate: float = 0.0, interval: float = 0.005, max_profiles: int = 32):
+        self.key = key
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self._profiles: "deque[Profile]" = deque(maxlen=max_profiles)
+        self._lock = threading.Lock()
+
+    def authorized(self, headers: Mapping[str, str]) -> bool:
+        return hmac.compare_digest(headers.get(PROFILE_KEY_HEADER, ""), self.key)
+
+    def should_profile(self, headers: Mapping[str, str]) -> bool:
+        return self.authorized(headers) or (self.sample_rate > 0 and random.random() < self.sample_rate)
+
+    @contextmanager
+    def profile(self, path: str) -> Iterator[Profile]:
+        """Sample the stack of the calling thread until the end of the block."""
+        profile = Profile(id=uuid.uuid4().hex, path=path, started=time.time())
+        sampler = _Sampler(threading.get_ident(), self.interval, profile.stacks)
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            yield profile
+        finally:
+            sampler.stop()
+            profile.duration = time.perf_counter() - started
+            with self._lock:
+                self._profiles.append(profile)
+
+    def profiles(self) -> List[Profile]:
+        """Profiles kept, most recent first."""
+        with self._lock:
+            return list(reversed(self._profiles))
+
+    def get(self, profile_id: str) -> Optional[Profile]:
+        with self._lock:
+            return next((p for p in self._profiles if p.id == profile_id), None)
+
+
+def profiled(view: Callable) -> Callable:
+    """Decorator of a view function profiling it when the app's profiler selects the request."""
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        profiler: Optional[Profiler] = current_app.profiler
+        if profiler is None or not profiler.should_profile(request.headers):
+            return view(*args, **kwargs)
+        with profiler.profile(request.path) as profile:
+            response = current_app.make_response(view(*args, **kwargs))
+        response.headers[PROFILE_ID_HEADER] = profile.id
+        return response
+
+    return wrapper
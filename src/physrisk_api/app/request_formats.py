@@ -0,0 +1,133 @@
+"""Decoding of request bodies: gzip or zstd Content-Encoding, and portfolios of assets in a columnar format.
+
+Portfolio requests ('get_asset_exposure', 'get_asset_impact') may be sent as an Arrow IPC stream or file, or a
+Parquet file, with one row per asset and one column per asset field ('latitude', 'longitude', 'asset_class',
+'type', 'location', 'capacity', ...); struct columns become nested objects such as 'attributes'. The rest of the
+request (e.g. 'scenario', 'year', 'include_measures') is given as JSON in the schema metadata under the key
+'request'. Columns are converted to the asset items of a request dict column by column, since physrisk parses
+requests from dicts; null values are omitted, so that physrisk's defaults apply.
+
+Arrow and Parquet require 'pyarrow' and zstd requires 'zstandard' (see the 'columnar' and 'compression' extras).
+"""
+
+import io
+import zlib
+from typing import Any, Dict, List, Optional
+
+from physrisk_api.app import json_backend
+from physrisk_api.app.portfolio import ASSET_RESULT_KEYS
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover
+    pa = None  # type: ignore
+    pq = None  # type: ignore
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None  # type: ignore
+
+ARROW_STREAM_MIMETYPE = "application/vnd.apache.arrow.stream"
+ARROW_FILE_MIMETYPE = "application/vnd.apache.arrow.file"
+PARQUET_MIMETYPE = "application/vnd.apache.parquet"
+COLUMNAR_MIMETYPES = {ARROW_STREAM_MIMETYPE, ARROW_FILE_MIMETYPE, PARQUET_MIMETYPE, "application/x-parquet"}
+
+# schema metadata key holding the JSON of the rest of a columnar request
+REQUEST_METADATA_KEY = b"request"
+
+
+class UnsupportedRequestFormat(ValueError):
+    """The request's Content-Encoding or Content-Type is not supported (or its library is not installed)."""
+
+
+class RequestTooLarge(ValueError):
+    """The request body is larger than allowed once decompressed."""
+
+
+def decode_body(data: bytes, content_encoding: Optional[str], max_size: int) -> bytes:
+    """Request body decompressed according to its Content-Encoding, of at most `max_size` bytes."""
+    encoding = (content_encoding or "identity").strip().lower()
+    if encoding == "identity":
+        decoded = data
+    elif encoding in ("gzip", "x-gzip"):
+        decoded = _gunzip(data, max_size + 1)
+    elif encoding == "zstd" and zstandard is not None:
+        # a body may hold several frames, e.g. if compressed as it was streamed
+        with zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data), read_across_frames=True) as reader:
+            decoded = _read(reader, max_size + 1)
+    else:
+        raise UnsupportedRequestFormat(f"Unsupported request Content-Encoding '{encoding}'")
+    if len(decoded) > max_size:
+        raise RequestTooLarge(f"Request body is larger than {max_size} bytes")
+    return decoded
+
+
+def _gunzip(data: bytes, limit: int) -> bytes:
+    """Decompressed gzip data, of all its members (as e.g. concatenated gzip files have several), up to `limit`
+    bytes."""
+    parts: List[bytes] = []
+    size = 0
+    while data and size < limit:
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        parts.append(decompressor.decompress(data, limit - size))
+        size += len(parts[-1])
+        if size < limit and not decompressor.eof:
+            raise ValueError("Truncated gzip request body")
+        data = decompressor.unused_data
+    return b"".join(parts)
+
+
+def _read(reader: io.RawIOBase, limit: int) -> bytes:
+    """Up to `limit` bytes from a reader, which may return fewer than asked for before its end."""
+    parts: List[bytes] = []
+    size = 0
+    while size < limit:
+        part = reader.read(limit - size)
+        if not part:
+            break
+        parts.append(part)
+        size += len(part)
+    return b"".join(parts)
+
+
+def parse_request(request_id: str, data: bytes, mimetype: Optional[str]) -> Dict[str, Any]:
+    """Request dict from a decoded body: JSON, or a columnar portfolio of assets for portfolio requests."""
+    if mimetype not in COLUMNAR_MIMETYPES:
+        return json_backend.loads(data)
+    if request_id not in ASSET_RESULT_KEYS:
+        raise UnsupportedRequestFormat(f"'{request_id}' requests cannot be sent as '{mimetype}'")
+    if pa is None:
+        raise UnsupportedRequestFormat(f"'{mimetype}' requests require pyarrow")
+    table = read_table(data, mimetype)
+    metadata = table.schema.metadata or {}
+    request_dict = json_backend.loads(metadata[REQUEST_METADATA_KEY]) if REQUEST_METADATA_KEY in metadata else {}
+    request_dict["assets"] = {**request_dict.get("assets", {}), "items": asset_items(table)}
+    return request_dict
+
+
+def read_table(data: bytes, mimetype: str) -> "pa.Table":
+    if mimetype == ARROW_STREAM_MIMETYPE:
+        return pa.ipc.open_stream(data).read_all()
+    if mimetype == ARROW_FILE_MIMETYPE:
+        return pa.ipc.open_file(pa.BufferReader(data)).read_all()
+    return pq.read_table(pa.BufferReader(data))
+
+
+def asset_items(table: "pa.Table") -> List[Dict[str, Any]]:
+    """Asset items of a table, one per row, without null values."""
+    dense, sparse = {}, {}
+    for name, column in zip(table.column_names, table.columns):
+        if column.null_count == len(column):
+            continue
+        (sparse if column.null_count else dense)[name] = column.to_pylist()
+    if dense:
+        items = [dict(zip(dense, values)) for values in zip(*dense.values())]
+    else:
+        items = [{} for _ in range(table.num_rows)]
+    for name, values in sparse.items():
+        for item, value in zip(items, values):
+            if value is not None:
+                item[name] = value
+    return items
@@ -0,0 +1,67 @@
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict
+
+from physrisk_api.app.json_backend import has_results
+
+# requests whose responses depend only on the request and the physrisk Container's inventory
+PREPARED_REQUEST_IDS = {"get_hazard_data_availability"}
+
+
+@dataclass(frozen=True)
+class PreparedResponse:
+    """A response serialized and compressed once, to be served many times."""
+
+    data: bytes
+    gzipped: bytes
+    etag: str
+    has_results: bool
+
+    @classmethod
+    def from_json(cls, data: str) -> "PreparedResponse":
+        encoded = data.encode()
+        return cls(
+            data=encoded,
+            gzipped=gzip.compress(encoded, compresslevel=9),
+            etag=hashlib.sha256(encoded).hexdigest()[:32],
+            has_results=has_results(data),
+        )
+
+
+class ResponseCache:
+    """Responses to requests that only change when the physrisk Container is reset, such as hazard data
+    availability: each is computed once per Container generation and then served from memory. The cache must
+    be cleared whenever the Container is reset."""
+
+    def __init__(self, max_entries: int = 64):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, PreparedResponse]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compute(self, key: str, compute: Callable[[], str]) -> PreparedResponse:
+        with self._lock:
+            prepared = self._entries.get(key)
+            if prepared is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return prepared
+            self.misses += 1
+        prepared = PreparedResponse.from_json(compute())
+        with self._lock:
+            self._entries[key] = prepared
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return prepared
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
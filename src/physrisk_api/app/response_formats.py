@@ -0,0 +1,155 @@
+"""Columnar (Arrow IPC stream or Parquet) responses to portfolio requests.
+
+Results have one row per asset and hazard type (and, for impacts, per scenario, year and impact type), with the
+asset's position in the request in 'asset_index'. Exposure rows hold the exposure category and value; impact
+rows hold the impact mean and standard deviations and the impact exceedance curve as lists of exceedance
+probabilities and values. 'year' is an integer in both, null for impacts without a year. Rows are built directly
+from physrisk's response models, without serializing them to JSON, one record batch (or Parquet row group) per
+chunk of assets.
+
+Requires 'pyarrow' (see the 'columnar' extra).
+"""
+
+import io
+from typing import Any, Dict, Iterator, List, Optional
+
+from physrisk.api.v1.exposure_req_resp import AssetExposureRequest
+from physrisk.api.v1.impact_req_resp import AssetImpactRequest
+from physrisk.requests import Requester
+
+from physrisk_api.app.portfolio import split_request
+from physrisk_api.app.request_formats import ARROW_STREAM_MIMETYPE, PARQUET_MIMETYPE
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover
+    pa = None  # type: ignore
+    pq = None  # type: ignore
+
+COLUMNAR_RESPONSE_MIMETYPES = [ARROW_STREAM_MIMETYPE, PARQUET_MIMETYPE]
+
+
+def columnar_available() -> bool:
+    return pa is not None
+
+
+def exposure_schema() -> "pa.Schema":
+    return pa.schema(
+        [
+            ("asset_index", pa.int64()),
+            ("asset_id", pa.string()),
+            ("hazard_type", pa.string()),
+            ("scenario", pa.string()),
+            ("year", pa.int64()),
+            ("category", pa.string()),
+            ("value", pa.float64()),
+            ("path", pa.string()),
+        ]
+    )
+
+
+def impact_schema() -> "pa.Schema":
+    return pa.schema(
+        [
+            ("asset_index", pa.int64()),
+            ("asset_id", pa.string()),
+            ("hazard_type", pa.string()),
+            ("scenario", pa.string()),
+            ("year", pa.int64()),
+            ("impact_type", pa.string()),
+            ("hazard_indicator_id", pa.string()),
+            ("impact_mean", pa.float64()),
+            ("impact_std_deviation", pa.float64()),
+            ("impact_semi_std_deviation", pa.float64()),
+            ("exceedance_probabilities", pa.list_(pa.float64())),
+            ("exceedance_values", pa.list_(pa.float64())),
+        ]
+    )
+
+
+def _year(year: str) -> Optional[int]:
+    # impact keys hold the year as a string, which may be empty, e.g. for the historical scenario
+    try:
+        return int(year)
+    except (TypeError, ValueError):
+        return None
+
+
+def exposure_batch(requester: Requester, request_dict: Dict[str, Any], start: int) -> "pa.RecordBatch":
+    request = AssetExposureRequest(**request_dict)
+    response = requester.get_asset_exposures(request)
+    columns: Dict[str, List[Any]] = {name: [] for name in exposure_schema().names}
+    for index, item in enumerate(response.items, start):
+        for hazard_type, exposure in item.exposures.items():
+            columns["asset_index"].append(index)
+            columns["asset_id"].append(item.asset_id)
+            columns["hazard_type"].append(hazard_type)
+            columns["scenario"].append(request.scenario)
+            columns["year"].append(request.year)
+            columns["category"].append(exposure.category)
+            columns["value"].append(exposure.value)
+            columns["path"].append(exposure.path)
+    return pa.RecordBatch.from_pydict(columns, schema=exposure_schema())
+
+
+def impact_batch(requester: Requester, request_dict: Dict[str, Any], start: int) -> "pa.RecordBatch":
+    response = requester.get_asset_impacts(AssetImpactRequest(**request_dict))
+    columns: Dict[str, List[Any]] = {name: [] for name in impact_schema().names}
+    for index, asset_impacts in enumerate(response.asset_impacts or [], start):
+        for impact in asset_impacts.impacts:
+            exceedance = impact.impact_exceedance
+            columns["asset_index"].append(index)
+            columns["asset_id"].append(asset_impacts.asset_id)
+            columns["hazard_type"].append(impact.key.hazard_type)
+            columns["scenario"].append(impact.key.scenario_id)
+            columns["year"].append(_year(impact.key.year))
+            columns["impact_type"].append(impact.impact_type)
+            columns["hazard_indicator_id"].append(impact.hazard_indicator_id)
+            columns["impact_mean"].append(impact.impact_mean)
+            columns["impact_std_deviation"].append(impact.impact_std_deviation)
+            columns["impact_semi_std_deviation"].append(impact.impact_semi_std_deviation)
+            columns["exceedance_probabilities"].append(
+                None if exceedance is None else exceedance.exceed_probabilities.tolist()
+            )
+            columns["exceedance_values"].append(None if exceedance is None else exceedance.values.tolist())
+    return pa.RecordBatch.from_pydict(columns, schema=impact_schema())
+
+
+_BATCHES = {"get_asset_exposure": exposure_batch, "get_asset_impact": impact_batch}
+_SCHEMAS = {"get_asset_exposure": exposure_schema, "get_asset_impact": impact_schema}
+
+
+def iter_columnar(
+    requester: Requester, request_id: str, request_dict: Dict[str, Any], chunk_size: int, mimetype: str
+) -> Iterator[bytes]:
+    """Run a portfolio request chunk by chunk, yielding the Arrow IPC stream or Parquet file of its results as
+    each chunk completes.
+
+    Args:
+        requester (Requester): physrisk Requester.
+        request_id (str): Request identifier: 'get_asset_exposure' or 'get_asset_impact'.
+        request_dict (Dict[str, Any]): The full portfolio request.
+        chunk_size (int): Number of assets per call to physrisk.
+        mimetype (str): ARROW_STREAM_MIMETYPE or PARQUET_MIMETYPE.
+    """
+    batch = _BATCHES[request_id]
+    schema = _SCHEMAS[request_id]()
+    sink = io.BytesIO()
+    # created up front so that a request without results still yields a valid, empty stream or file
+    writer = pa.ipc.new_stream(sink, schema) if mimetype == ARROW_STREAM_MIMETYPE else pq.ParquetWriter(sink, schema)
+    start = 0
+    for chunk in split_request(request_dict, chunk_size):
+        record_batch = batch(requester, chunk, start)
+        start += len(chunk["assets"]["items"])
+        writer.write_batch(record_batch)
+        yield _drain(sink)
+    writer.close()
+    yield _drain(sink)
+
+
+def _drain(sink: io.BytesIO) -> bytes:
+    data = sink.getvalue()
+    sink.seek(0)
+    sink.truncate()
+    return data
@@ -1,6 +1,9 @@
-from flask import Blueprint
+from flask import Blueprint, abort, current_app, request
 
 from .api import api
+from .metrics import PROMETHEUS_MIMETYPE
+from .profiling import Profiler
+from .warmup import check_ready
 
 main = Blueprint("main", __name__, url_prefix="/")
 
@@ -8,6 +11,65 @@ main = Blueprint("main", __name__, url_prefix="/")
 main.register_blueprint(api)
 
 
+@main.before_request
+def start_request_metrics():
+    current_app.metrics.start_request()
+
+
+# after_request functions run in reverse order of registration: the response is recorded once compressed
+@main.after_request
+def end_request_metrics(response):
+    return current_app.metrics.end_request(response)
+
+
+@main.after_request
+def compress_response(response):
+    """Compress the response body in the encoding negotiated from the request's Accept-Encoding."""
+    compressor = current_app.compressor
+    if compressor is None:
+        return response
+    with current_app.metrics.time("compress"):
+        return compressor.compress_response(response, request.accept_encodings)
+
+
 @main.get("/")
 def home():
     return "Hello World!"
+
+
+@main.get("/metrics")
+def metrics():
+    """Request latency, response size and cache metrics, in the Prometheus text format."""
+    return current_app.response_class(current_app.metrics.render(current_app), mimetype=PROMETHEUS_MIMETYPE)
+
+
+@main.get("/debug/profiles")
+def list_profiles():
+    """Profiles of recent requests, most recent first; see physrisk_api.app.profiling."""
+    return {"profiles": [profile.as_dict() for profile in _profiler().profiles()]}
+
+
+@main.get("/debug/profiles/<profile_id>")
+def get_profile(profile_id):
+    """A profile as collapsed stacks, e.g. for flamegraph.pl or speedscope."""
+    profile = _profiler().get(profile_id)
+    if profile is None:
+        abort(404)
+    return current_app.response_class(profile.collapsed(), mimetype="text/plain")
+
+
+def _profiler() -> Profiler:
+    profiler = current_app.profiler
+    if profiler is None:
+        abort(404)
+    if not profiler.authorized(request.headers):
+        abort(403)
+    return profiler
+
+
+@main.get("/ready")
+def ready():
+    """Readiness check: succeeds only once the physrisk container has been warmed up."""
+    if not check_ready(current_app._get_current_object()):
+        return {"status": "warming up"}, 503
+    return {"status": "ready"}
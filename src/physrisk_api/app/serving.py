@@ -0,0 +1,135 @@
+"""Entry point for serving the API, selecting the server from environment variables:
+
+- SERVER_MODE: 'waitress' (default), 'gunicorn', 'uvicorn' or 'development' (Flask's debug server).
+- SERVER_HOST, SERVER_PORT: bind address (default 0.0.0.0:8081).
+- SERVER_WORKERS: worker processes, for gunicorn and uvicorn (default: number of CPUs).
+- SERVER_THREADS: request threads per worker (default 8).
+- SERVER_BACKLOG: maximum number of pending connections (default 2048).
+- SERVER_TIMEOUT: seconds before a silent gunicorn worker is restarted, or an idle waitress channel is closed
+  (default 300).
+- SERVER_PRELOAD: for gunicorn, create the app and load the physrisk inventory and models in the master process
+  before forking, so that workers share them copy-on-write (default 1; set to 0 to disable).
+
+Each worker warms up its physrisk Container before it accepts traffic; /ready reports whether it has.
+"""
+
+import logging
+import os
+from dataclasses import dataclass, field
+
+from physrisk_api.app import create_app
+from physrisk_api.app.warmup import warm_up, warm_up_shared
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.environ.get(name, default))
+
+
+@dataclass
+class ServerConfig:
+    mode: str = field(default_factory=lambda: os.environ.get("SERVER_MODE", "waitress").lower())
+    host: str = field(default_factory=lambda: os.environ.get("SERVER_HOST", "0.0.0.0"))
+    port: int = field(default_factory=lambda: _env_int("SERVER_PORT", 8081))
+    workers: int = field(default_factory=lambda: _env_int("SERVER_WORKERS", os.cpu_count() or 1))
+    threads: int = field(default_factory=lambda: _env_int("SERVER_THREADS", 8))
+    backlog: int = field(default_factory=lambda: _env_int("SERVER_BACKLOG", 2048))
+    timeout: int = field(default_factory=lambda: _env_int("SERVER_TIMEOUT", 300))
+    preload: bool = field(default_factory=lambda: _env_int("SERVER_PRELOAD", 1) != 0)
+
+
+def create_warm_app():
+    """Application factory for servers that create the app in each worker process."""
+    app = create_app()
+    warm_up(app)
+    return app
+
+
+def create_asgi_app():
+    """ASGI application factory for uvicorn, running the WSGI app on a pool of SERVER_THREADS threads."""
+    from uvicorn.middleware.wsgi import WSGIMiddleware
+
+    return WSGIMiddleware(create_warm_app(), workers=ServerConfig().threads)
+
+
+def serve_development(config: ServerConfig):
+    app = create_app()
+    app.run(host=config.host, port=config.port, debug=True)
+
+
+def serve_waitress(config: ServerConfig):
+    import waitress
+
+    if config.workers > 1:
+        logger.warning("waitress serves from a single process; SERVER_WORKERS is ignored")
+    waitress.serve(
+        create_warm_app(),
+        host=config.host,
+        port=config.port,
+        threads=config.threads,
+        backlog=config.backlog,
+        channel_timeout=config.timeout,
+    )
+
+
+def serve_gunicorn(config: ServerConfig):
+    from gunicorn.app.base import BaseApplication
+
+    class Application(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"{config.host}:{config.port}")
+            self.cfg.set("workers", config.workers)
+            self.cfg.set("threads", config.threads)
+            self.cfg.set("worker_class", "gthread")
+            self.cfg.set("backlog", config.backlog)
+            self.cfg.set("timeout", config.timeout)
+            self.cfg.set("preload_app", config.preload)
+            if config.preload:
+                # the app is shared from the master; finish warming up in each worker before it accepts connections
+                self.cfg.set("post_worker_init", lambda worker: warm_up(worker.wsgi))
+
+        def load(self):
+            if config.preload:
+                # called once, in the master process before forking
+                app = create_app()
+                warm_up_shared(app)
+                return app
+            # called in each worker, before the worker accepts connections
+            return create_warm_app()
+
+    Application().run()
+
+
+def serve_uvicorn(config: ServerConfig):
+    import uvicorn
+
+    uvicorn.run(
+        "physrisk_api.app.serving:create_asgi_app",
+        factory=True,
+        host=config.host,
+        port=config.port,
+        workers=config.workers,
+        backlog=config.backlog,
+    )
+
+
+SERVERS = {
+    "development": serve_development,
+    "waitress": serve_waitress,
+    "gunicorn": serve_gunicorn,
+    "uvicorn": serve_uvicorn,
+}
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    config = ServerConfig()
+    if config.mode not in SERVERS:
+        raise ValueError(f"SERVER_MODE must be one of {', '.join(SERVERS)}; got '{config.mode}'")
+    logger.info(f"Starting physrisk_api with {config}")
+    SERVERS[config.mode](config)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import hashlib
+import json
+import threading
+from collections import defaultdict
+from typing import Any, Callable, Dict, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# requests sent identically by many clients at once (e.g. on dashboard load), and small enough for keying them by
+# their normalized content to be cheap; portfolio requests are neither, so are not coalesced
+COALESCED_REQUEST_IDS = {"get_hazard_data_availability"}
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Coalesces identical concurrent calls: while a call for a key is in flight, further calls for the same key
+    wait for it and share its result (or exception) rather than repeating the work.
+
+    Nothing is kept once a call completes; results are only shared between calls that overlap in time.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Tuple[str, str], _Call] = {}
+        self._lock = threading.Lock()
+        self._executed: Dict[str, int] = defaultdict(int)
+        self._coalesced: Dict[str, int] = defaultdict(int)
+
+    @staticmethod
+    def key(request_id: str, request_dict: Dict[str, Any]) -> str:
+        """Key for a request: a digest of the request ID and the normalized request, including the caller's groups."""
+        canonical = json.dumps({"request_id": request_id, **request_dict}, sort_keys=True, default=str)
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    def do(self, kind: str, key: str, fn: Callable[[], T]) -> T:
+        """Result of `fn`, shared with any other call for the same `kind` and `key` in flight at the same time.
+
+        Args:
+            kind (str): Kind of call, e.g. 'requests' or 'images', for which counts are reported separately.
+            key (str): Key identifying calls that have the same result.
+            fn (Callable[[], T]): Function computing the result.
+        """
+        with self._lock:
+            call = self._calls.get((kind, key))
+            leader = call is None
+            if leader:
+                call = self._calls[(kind, key)] = _Call()
+                self._executed[kind] += 1
+            else:
+                self._coalesced[kind] += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[(kind, key)]
+            call.done.set()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {
+                kind: {
+                    "executed": self._executed[kind],
+                    "coalesced": self._coalesced[kind],
+                    "in_flight": sum(k == kind for k, _ in self._calls),
+                }
+                for kind in sorted(self._executed)
+            }
@@ -0,0 +1,345 @@
+"""Synthetic hazard indicator data, so that the API can be run, tested and benchmarked without the hazard bucket.
+
+`generate` writes a local zarr store with the layout of hazard/hazard.zarr. It writes an array for every
+scenario and year that physrisk can read of each resource of the inventory: by default the resources selected
+for each hazard indicator and those requested by the exposure measure, which are the ones used by exposure and
+impact calculations. Arrays are global at the
+given resolution (EPSG:4326) and carry the attributes that physrisk reads ('transform_mat3x3', 'crs', 'units' and
+the index dimension with its values). The index is the return period for acute hazards, or the indicator's
+thresholds (if its map lists several), and arrays are chunked by index value and in square spatial chunks, as
+in the real data.
+
+For each map resource, the map arrays are written as well in EPSG:3857. A pyramid resource gets one zoom level
+for each level up to `max_zoom`, of 256 * 2**level pixels square in chunks of 512 (the size of a tile), and any
+other resource a single level close to the resolution of the data. To keep pyramids small, maps hold only the
+last index value (the one displayed by default).
+
+Values are a smooth random field scaled to the range of the resource's colormap, increasing with return period
+and decreasing with threshold. Data arrays add per-pixel noise, so that their chunks compress about as poorly as
+real data; maps do not, which keeps pyramids small. The same settings always give the same data.
+
+Settings are read from SYNTHETIC_HAZARD_* environment variables (see `SyntheticHazardSettings`); the provider
+override `provide_synthetic_zarr_store` (physrisk_api.app.override_providers) generates the store on first use.
+The store can also be generated from the command line:
+
+    python -m physrisk_api.app.synthetic_hazard /path/to/hazard/hazard.zarr [--resolution 0.5] [--max-zoom 3]
+"""
+
+import argparse
+import logging
+import math
+import os
+import shutil
+import time
+import uuid
+import zlib
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import zarr
+from physrisk.container import Container
+from physrisk.data.inventory import Inventory
+from physrisk.hazard_models.core_hazards import InventorySourcePaths
+from physrisk.kernel.assets import Asset
+from physrisk.kernel.exposure import JupterExposureMeasure
+from physrisk.kernel.hazards import IndicatorData, hazard_class, indicator_data
+
+logger = logging.getLogger(__name__)
+
+RETURN_PERIODS = [2, 5, 10, 25, 50, 100, 250, 500, 1000]
+# index dimensions of resources that differ from those of their kind of indicator, as in the real data; the
+# exposure measure requires single-valued wind speeds
+INDEX_OVERRIDES = {"wind/jupiter/v1/max_1min_{scenario}_{year}": ("return_period", [100], 1)}
+TILE_SIZE = 512
+# half the circumference of the earth in EPSG:3857
+MERCATOR_EXTENT = 20037508.342789244
+
+
+@dataclass(frozen=True)
+class SyntheticHazardSettings:
+    """Settings of a synthetic hazard dataset, read from environment variables."""
+
+    # directory holding the dataset, as hazard/hazard.zarr
+    directory: Optional[str] = field(default_factory=lambda: os.environ.get("SYNTHETIC_HAZARD_DIR"))
+    # grid spacing of the data arrays in degrees
+    resolution: float = field(default_factory=lambda: float(os.environ.get("SYNTHETIC_HAZARD_RESOLUTION", 0.5)))
+    # scenarios in addition to 'historical'; each is written for all of its years
+    scenarios: Tuple[str, ...] = field(
+        default_factory=lambda: tuple(os.environ.get("SYNTHETIC_HAZARD_SCENARIOS", "ssp585").split(","))
+    )
+    # highest zoom level of map pyramids; tiles of zoom level z are read from level z + 1
+    max_zoom: int = field(default_factory=lambda: int(os.environ.get("SYNTHETIC_HAZARD_MAX_ZOOM", 3)))
+    # spatial chunk size of the data arrays
+    chunk_size: int = field(default_factory=lambda: int(os.environ.get("SYNTHETIC_HAZARD_CHUNK_SIZE", 1000)))
+    # 'selected' for the resources that physrisk selects for each hazard indicator, or 'all'
+    resources: str = field(default_factory=lambda: os.environ.get("SYNTHETIC_HAZARD_RESOURCES", "selected"))
+    seed: int = field(default_factory=lambda: int(os.environ.get("SYNTHETIC_HAZARD_SEED", 0)))
+
+    def dataset(self) -> Dict[str, Any]:
+        """The settings that determine the data, as stored in the attributes of the zarr root."""
+        settings = asdict(self)
+        del settings["directory"]
+        settings["scenarios"] = list(self.scenarios)
+        return settings
+
+
+@dataclass(frozen=True)
+class IndexSpec:
+    name: str
+    values: List[Any]
+    # 1 if values increase with the index (return periods), -1 if they decrease (thresholds), else 0
+    trend: int
+
+
+def ensure_generated(root: str, settings: SyntheticHazardSettings, container: Optional[Container] = None) -> str:
+    """Generate the dataset at `root` unless it is there already, with the same settings.
+
+    The dataset is written to a temporary directory next to `root` and then renamed, so that processes
+    starting together do not read a partly written dataset; if several generate it, the first to finish wins.
+    A dataset generated with other settings is renamed aside before it is deleted, so that `root` is never
+    partly deleted.
+    """
+    if _generated_with(root) == settings.dataset():
+        return root
+    started = time.perf_counter()
+    unique = uuid.uuid4().hex
+    staging, retired = f"{root}.{unique}.tmp", f"{root}.{unique}.old"
+    try:
+        generate(staging, settings, container)
+        if _install(staging, root, retired, settings):
+            logger.info(f"Generated synthetic hazard data in {root} in {time.perf_counter() - started:.1f}s")
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+        shutil.rmtree(retired, ignore_errors=True)
+    return root
+
+
+def _install(staging: str, root: str, retired: str, settings: SyntheticHazardSettings) -> bool:
+    """Rename the dataset at `staging` to `root`, moving any dataset there with other settings to `retired`;
+    return False if another process installed a dataset with the same settings first."""
+    if _generated_with(root) == settings.dataset():
+        return False
+    try:
+        os.rename(root, retired)
+    except FileNotFoundError:
+        # no dataset yet, or another process moved it aside
+        pass
+    try:
+        os.rename(staging, root)
+    except OSError:
+        # another process renamed its copy first
+        if _generated_with(root) != settings.dataset():
+            raise
+        return False
+    return True
+
+
+def generate(root: str, settings: SyntheticHazardSettings, container: Optional[Container] = None):
+    """Write the synthetic dataset to a zarr store at `root`, replacing any store there."""
+    container = container or Container()
+    inventory: Inventory = container.inventory()
+    source_paths = container.source_paths()
+    group = zarr.open_group(zarr.DirectoryStore(root), mode="w")
+    for resource in _resources(inventory, source_paths, settings.resources):
+        try:
+            index = index_spec(resource)
+        except AttributeError:
+            logger.warning(f"Skipping resource {resource.path} of unknown hazard type {resource.hazard_type}")
+            continue
+        scale = _scale(resource)
+        for path, year in _data_paths(resource, settings.scenarios):
+            seed = _seed(resource.path, settings.seed)
+            write_data_array(group, path, resource, index, scale, _trend_factor(year), settings, seed)
+        if resource.map is None:
+            continue
+        map_index = _map_index(resource, index)
+        for path, year, zoom in _map_paths(resource, settings):
+            seed = _seed(resource.path, settings.seed)
+            write_map_array(group, path, zoom, resource, index, map_index, scale, _trend_factor(year), seed)
+    group.attrs["synthetic"] = settings.dataset()
+
+
+def index_spec(resource) -> IndexSpec:
+    """Index dimension of the data arrays of a resource."""
+    if resource.path in INDEX_OVERRIDES:
+        return IndexSpec(*INDEX_OVERRIDES[resource.path])
+    kind = indicator_data(hazard_class(resource.hazard_type), resource.indicator_id)
+    map_values = list(resource.map.index_values) if resource.map and resource.map.index_values else []
+    if kind == IndicatorData.EVENT:
+        return IndexSpec("return_period", sorted(set(RETURN_PERIODS) | set(map_values)), 1)
+    if len(map_values) > 1:
+        return IndexSpec("index", map_values, -1)
+    return IndexSpec("index", [0], 0)
+
+
+def write_data_array(group, path, resource, index: IndexSpec, scale, trend, settings, seed):
+    height, width = round(180 / settings.resolution), round(360 / settings.resolution)
+    lats = 90 - (np.arange(height) + 0.5) * settings.resolution
+    lons = -180 + (np.arange(width) + 0.5) * settings.resolution
+    transform = [settings.resolution, 0, -180, 0, -settings.resolution, 90, 0, 0, 1]
+    z = _create_array(
+        group, path, index, index.values, (height, width), settings.chunk_size, "epsg:4326", transform, resource
+    )
+    _write_values(z, lats, lons, resource, index, index.values, scale, trend, seed)
+
+
+def write_map_array(group, path, zoom, resource, index: IndexSpec, map_index: List[Any], scale, trend, seed):
+    size = 256 * 2**zoom
+    pixel = 2 * MERCATOR_EXTENT / size
+    # latitudes of the pixel centres of a web mercator grid
+    y = np.pi * (1 - 2 * (np.arange(size) + 0.5) / size)
+    lats = np.degrees(np.arctan(np.sinh(y)))
+    lons = -180 + (np.arange(size) + 0.5) * 360 / size
+    transform = [pixel, 0, -MERCATOR_EXTENT, 0, -pixel, MERCATOR_EXTENT, 0, 0, 1]
+    z = _create_array(group, path, index, map_index, (size, size), TILE_SIZE, "epsg:3857", transform, resource)
+    _write_values(z, lats, lons, resource, index, map_index, scale, trend, seed, noise=False)
+
+
+def field_values(lats: np.ndarray, lons: np.ndarray, seed: int, noise: bool = True) -> np.ndarray:
+    """Values in [0, 1] on the grid of `lats` by `lons`: a smooth random field, optionally with 10% noise."""
+    rng = np.random.default_rng(seed)
+    phases = rng.uniform(0, 2 * np.pi, 4)
+    lat, lon = np.radians(lats)[:, None], np.radians(lons)[None, :]
+    values = (
+        0.5
+        + 0.2 * np.sin(3 * lon + phases[0]) * np.cos(2 * lat + phases[1])
+        + 0.15 * np.sin(11 * lon + 7 * lat + phases[2])
+        + 0.15 * np.cos(17 * lon - 23 * lat + phases[3])
+    )
+    if noise:
+        values *= rng.uniform(0.9, 1.1, values.shape)
+    return np.clip(values, 0, 1)
+
+
+def _write_values(z, lats, lons, resource, index: IndexSpec, values: List[Any], scale, trend, seed, noise=True):
+    base = field_values(lats, lons, seed, noise) * trend
+    if index.trend == 1 and "Inundation" in resource.hazard_type:
+        # most places are not flooded at all
+        base[base < 0.4] = 0
+    # in steps of 1/255 of the range of the colormap, as many indicators are stored with limited precision
+    step = scale / 255
+    for i, value in enumerate(values):
+        z[i, :, :] = (np.round(base * _index_factor(index, value) * 255) * step).astype(np.float32)
+
+
+def _create_array(group, path, index: IndexSpec, values, shape, chunk_size, crs, transform, resource):
+    z = group.create_dataset(
+        path,
+        shape=(len(values), *shape),
+        chunks=(1, min(chunk_size, shape[0]), min(chunk_size, shape[1])),
+        dtype="f4",
+        fill_value=float("nan"),
+        overwrite=True,
+    )
+    z.attrs.update(
+        {
+            "crs": crs,
+            "transform_mat3x3": transform,
+            "units": resource.units or "default",
+            "dimensions": [index.name, "y", "x"],
+            f"{index.name}_values": list(values),
+        }
+    )
+    return z
+
+
+def _index_factor(index: IndexSpec, value) -> float:
+    position = index.values.index(value)
+    if index.trend == 1:
+        return math.log(value) / math.log(index.values[-1])
+    if index.trend == -1:
+        return 1 - position / len(index.values)
+    return 1.0
+
+
+def _map_index(resource, index: IndexSpec) -> List[Any]:
+    return list(resource.map.index_values or index.values)[-1:]
+
+
+def _scale(resource) -> float:
+    colormap = resource.map.colormap if resource.map is not None else None
+    return float(colormap.max_value) if colormap is not None and colormap.max_value else 1.0
+
+
+def _trend_factor(year: int) -> float:
+    """Change of hazard intensity in future years, with some margin within the range of the colormap."""
+    return 0.8 * (1 + max(0, year - 2020) / 400)
+
+
+def _seed(path: str, seed: int) -> int:
+    # not hash(), which differs between processes
+    return zlib.crc32(path.encode()) ^ seed
+
+
+def _resources(inventory: Inventory, source_paths, selection: str) -> Iterable[Any]:
+    if selection == "all" or not isinstance(source_paths, InventorySourcePaths):
+        return list(inventory.resources.values())
+    selected = {r.path: r for rs in source_paths.all_selected_resources_by_type_id.values() for r in rs}
+    # resources chosen by hints rather than selected, e.g. by the exposure measure
+    for request in JupterExposureMeasure().get_data_requests(Asset(0, 0), scenario="historical", year=1980):
+        if request.hint is not None and request.hint.path in inventory.resources:
+            selected[request.hint.path] = inventory.resources[request.hint.path]
+    return list(selected.values())
+
+
+def _scenario_paths(resource, scenarios: Iterable[str], map: bool = False, map_zoom=None):
+    for scenario in ("historical", *scenarios):
+        scenario_paths = InventorySourcePaths.scenario_paths_for_resource(resource, scenario, map, map_zoom)
+        for year in scenario_paths.years:
+            yield scenario_paths.path(year), year if year > 0 else 1980
+
+
+def _data_paths(resource, scenarios) -> Iterator[Tuple[str, int]]:
+    return iter(dict(_scenario_paths(resource, scenarios)).items())
+
+
+def _map_paths(resource, settings: SyntheticHazardSettings) -> Iterator[Tuple[str, int, int]]:
+    if resource.map.source == "map_array":
+        # a single array, of about the resolution of the data
+        zoom = max(0, round(math.log2(360 / settings.resolution / 256)))
+        for path, year in dict(_scenario_paths(resource, settings.scenarios, map=True)).items():
+            yield path, year, zoom
+        return
+    for zoom in range(settings.max_zoom + 1):
+        paths = dict(_scenario_paths(resource, settings.scenarios, map=True, map_zoom=zoom))
+        for path, year in paths.items():
+            yield path, year, zoom
+
+
+def _generated_with(root: str) -> Optional[Dict[str, Any]]:
+    if not (Path(root) / ".zgroup").exists():
+        return None
+    try:
+        return zarr.open_group(zarr.DirectoryStore(root), mode="r").attrs.get("synthetic")
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    defaults = SyntheticHazardSettings()
+    parser.add_argument("root", help="zarr store to write, e.g. /data/hazard/hazard.zarr")
+    parser.add_argument("--resolution", type=float, default=defaults.resolution, help="in degrees")
+    parser.add_argument("--scenarios", default=",".join(defaults.scenarios))
+    parser.add_argument("--max-zoom", type=int, default=defaults.max_zoom)
+    parser.add_argument("--chunk-size", type=int, default=defaults.chunk_size)
+    parser.add_argument("--resources", choices=["selected", "all"], default=defaults.resources)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    settings = SyntheticHazardSettings(
+        directory=None,
+        resolution=args.resolution,
+        scenarios=tuple(args.scenarios.split(",")),
+        max_zoom=args.max_zoom,
+        chunk_size=args.chunk_size,
+        resources=args.resources,
+        seed=args.seed,
+    )
+    ensure_generated(args.root, settings)
+
+
+if __name__ == "__main__":
+    main()
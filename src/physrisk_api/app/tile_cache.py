@@ -0,0 +1,124 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from physrisk_api.app.disk_cache import DiskCache
+
+
+def image_request(
+    resource: str,
+    tile: Optional[Tuple[int, int, int]],
+    scenario_id: Optional[str],
+    year: int,
+    group_ids: List[str],
+    colormap: Optional[str] = None,
+    min_value: Optional[float] = None,
+    max_value: Optional[float] = None,
+) -> Dict[str, Any]:
+    """Request dict for physrisk's get_image; `tile` is (x, y, z), or None for a whole-array image."""
+    return {
+        "resource": resource,
+        "tile": tile,
+        "colormap": colormap,
+        "scenario_id": scenario_id,
+        "year": year,
+        "group_ids": group_ids,
+        "max_value": max_value,
+        "min_value": min_value,
+    }
+
+
+class TileCache:
+    """Cache of rendered images, keyed on the full set of render parameters.
+
+    A bounded in-memory LRU tier is checked first, then (if configured) an on-disk tier; images found only
+    on disk are promoted into memory.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        max_bytes: int = 256 * 1024**2,
+        disk_dir: Optional[str] = None,
+        disk_max_bytes: int = 1024**3,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk = DiskCache(disk_dir, max_bytes=disk_max_bytes, suffix=".png") if disk_dir else None
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(request_dict: Dict[str, Any], format: str = "png") -> str:
+        """Key for an image request: a digest of all render parameters, including the caller's groups."""
+        canonical = json.dumps({"format": format, **request_dict}, sort_keys=True, default=str)
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            image = self._entries.get(key)
+            if image is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return image
+        image = self.disk.get(key) if self.disk is not None else None
+        with self._lock:
+            if image is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._insert(key, image)
+        return image
+
+    def put(self, key: str, image: bytes):
+        with self._lock:
+            self._insert(key, image)
+        if self.disk is not None:
+            self.disk.put(key, image)
+
+    def get_or_render(self, key: str, render: Callable[[], bytes]) -> bytes:
+        """Cached image for `key`, calling `render` and caching its result on a miss."""
+        image = self.get(key)
+        if image is None:
+            image = render()
+            self.put(key, image)
+        return image
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = self.disk_hits = self.misses = 0
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
+    def _insert(self, key: str, image: bytes):
+        # caller must hold self._lock
+        if len(image) > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= len(previous)
+        self._entries[key] = image
+        self._bytes += len(image)
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
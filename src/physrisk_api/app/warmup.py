@@ -0,0 +1,97 @@
+import gc
+import threading
+import time
+from typing import Optional
+
+from flask import Flask
+
+from physrisk_api.app.prewarm import start_prewarm
+
+_lock = threading.Lock()
+_start_lock = threading.Lock()
+
+
+def warm_up_shared(app: Flask) -> bool:
+    """Load the read-only parts of the physrisk Container: the hazard inventory, colormaps, source paths and the
+    vulnerability models factory with its impact function selectors built from embedded configuration. All are
+    singletons of the Container (see `create_container`), later held by the requester.
+
+    None of these open connections to the hazard data store, so this is safe to run in a server's master
+    process before it forks its workers. The loaded objects are then moved out of the garbage collector's
+    tracking so that forked workers keep sharing their memory pages copy-on-write.
+
+    Returns:
+        bool: True if warm-up succeeded.
+    """
+    start = time.perf_counter()
+    try:
+        with app.app_context():
+            container = app.container
+            container.inventory()
+            container.colormaps()
+            container.source_paths()
+            container.vulnerability_models_factory()
+    except Exception as exc_info:
+        app.logger.error("Failed to load physrisk inventory and models", exc_info=exc_info)
+        return False
+    gc.freeze()
+    app.logger.info(f"Loaded physrisk inventory and models in {time.perf_counter() - start:.2f}s")
+    return True
+
+
+def warm_up(app: Flask) -> bool:
+    """Build the physrisk objects that are otherwise created lazily by the first request, mark the app as ready and
+    start pre-warming the tile cache if configured.
+
+    Resolving the requester creates the hazard inventory, the zarr store and reader and the vulnerability model
+    factories held as singletons in the app's physrisk Container; parts already loaded by `warm_up_shared` are
+    reused. A failure (e.g. hazard data not reachable) is logged and left for the first request or the next
+    readiness check to retry, rather than preventing the server from starting.
+
+    If the app is reset while warming up (see `app.warm_up_generation`), the objects built may belong to the
+    Container's previous singletons, so they are built again before the app is marked as ready.
+
+    Returns:
+        bool: True if warm-up succeeded.
+    """
+    with _lock:
+        start = time.perf_counter()
+        while True:
+            generation = app.warm_up_generation
+            try:
+                with app.app_context():
+                    app.container.requester()
+            except Exception as exc_info:
+                app.logger.error("Failed to warm up physrisk container", exc_info=exc_info)
+                app.ready = False
+                return False
+            if app.warm_up_generation == generation:
+                break
+            app.logger.info("App reset while warming up; warming up again")
+        app.ready = True
+        app.logger.info(f"Warmed up physrisk container in {time.perf_counter() - start:.2f}s")
+        start_prewarm(app)
+        return True
+
+
+def start_warm_up(app: Flask) -> Optional[threading.Thread]:
+    """Warm up the app in a background thread, unless it is already warming up in one; return the thread started.
+
+    Used where waiting for warm-up, which may take as long as loading the hazard inventory and models, would block
+    a request: a readiness check or a reset.
+    """
+    with _start_lock:
+        if app.warm_up_thread is not None and app.warm_up_thread.is_alive():
+            return None
+        app.warm_up_thread = threading.Thread(target=warm_up, args=(app,), name="warm-up", daemon=True)
+        app.warm_up_thread.start()
+        return app.warm_up_thread
+
+
+def check_ready(app: Flask) -> bool:
+    """True once the app has been warmed up. If it has not, warm-up is started in the background unless already in
+    progress, and False returned at once."""
+    if app.ready:
+        return True
+    start_warm_up(app)
+    return False
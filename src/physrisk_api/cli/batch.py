@@ -0,0 +1,337 @@
+# Copyright 2024 Broda Group Software Inc.
+#
+# Use of this source code is governed by an MIT-style
+# license that can be found in the LICENSE file or at
+# https://opensource.org/licenses/MIT.
+
+"""
+Batch runs of asset exposure or impact requests over a portfolio file
+
+The portfolio is read from CSV, Parquet or JSON lines, with one asset per
+row: the columns asset_class, latitude, longitude and (optionally) type,
+location and capacity are Asset fields; any other column is an attribute.
+
+The portfolio is sent in chunks, several at a time, and the response to
+each chunk is written as one line of the output file (JSON lines):
+
+    {"chunk": 12, "start": 12000, "end": 13000, "result": {...}}
+
+Lines are written as chunks complete, so not necessarily in order. The
+output file is also the checkpoint: a run writing to an existing output
+file skips the chunks already in it, so an interrupted run can be resumed
+by running it again. The first line of the file records the settings of
+the run, which a resumed run must have too:
+
+    {"batch": {"input": "...", "input_sha256": "...", "kind": "exposure", ...}}
+"""
+
+import asyncio
+import csv
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+import httputilities
+import httpx
+from bgsexception import BgsException
+from physrisk_temp import Asset, AssetExposureRequest, AssetImpactRequest, Assets
+from tokens import TokenManager
+
+logger = logging.getLogger(__name__)
+
+ASSET_FIELDS = {"asset_class", "latitude", "longitude", "type", "location", "capacity"}
+
+SERVICES = {
+    "exposure": "/api/get_asset_exposure",
+    "impact": "/api/get_asset_impact",
+}
+
+# HTTP status codes worth retrying: the request may succeed later
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+_CHUNK_PATTERN = re.compile(rb'^\{"chunk": (\d+), "start": (\d+), "end": (\d+),')
+
+
+@dataclass
+class BatchSettings:
+    kind: str = "exposure"  # 'exposure' or 'impact'
+    scenario: str = "rcp8p5"
+    year: int = 2050
+    chunk_size: int = 1000
+    concurrency: int = 4
+    retries: int = 5
+    backoff: float = 1.0  # seconds before the first retry, doubled for each further retry
+    max_backoff: float = 60.0
+    timeout: float = 600.0
+
+
+#####
+# INPUT
+#####
+
+
+def _asset(row: Dict[str, Any]) -> Asset:
+    fields = {k: v for k, v in row.items() if k in ASSET_FIELDS and v not in (None, "")}
+    attributes = dict(row.get("attributes") or {})
+    attributes.update(
+        {k: str(v) for k, v in row.items() if k not in ASSET_FIELDS and k != "attributes" and v not in (None, "")}
+    )
+    return Asset(**fields, attributes=attributes or None)
+
+
+def _read_csv(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, newline="") as f:
+        yield from csv.DictReader(f)
+
+
+def _read_jsonl(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _read_parquet(path: str) -> Iterator[Dict[str, Any]]:
+    try:
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise BgsException("Reading Parquet portfolios requires pyarrow: pip install pyarrow", e)
+    for batch in pq.ParquetFile(path).iter_batches():
+        yield from batch.to_pylist()
+
+
+READERS = {
+    ".csv": _read_csv,
+    ".jsonl": _read_jsonl,
+    ".ndjson": _read_jsonl,
+    ".parquet": _read_parquet,
+}
+
+
+def read_portfolio(path: str) -> Iterator[Asset]:
+    """
+    Assets of a portfolio file, read one at a time
+
+    Parameters:
+    - path (str): CSV (.csv), JSON lines (.jsonl, .ndjson) or Parquet (.parquet) file
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in READERS:
+        raise BgsException(f"Unsupported portfolio file type '{extension}'; use one of {', '.join(READERS)}")
+    for row in READERS[extension](path):
+        yield _asset(row)
+
+
+def chunks(assets: Iterator[Asset], chunk_size: int) -> Iterator[List[Asset]]:
+    chunk: List[Asset] = []
+    for asset in assets:
+        chunk.append(asset)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+#####
+# CHECKPOINT
+#####
+
+
+def run_manifest(input_path: str, settings: BatchSettings) -> Dict[str, Any]:
+    """
+    Settings of a run that determine its output: the input (by content, so
+    that a changed file is not resumed) and how it is chunked and sent
+    """
+    digest = hashlib.sha256()
+    with open(input_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return {
+        "input": os.path.abspath(input_path),
+        "input_sha256": digest.hexdigest(),
+        "kind": settings.kind,
+        "scenario": settings.scenario,
+        "year": settings.year,
+        "chunk_size": settings.chunk_size,
+    }
+
+
+def completed_chunks(output_path: str, manifest: Dict[str, Any]) -> Set[int]:
+    """
+    Chunks already written to an output file by a run with the same
+    manifest. A partly written last line, left by an interrupted run, is
+    removed.
+
+    Raises:
+    - BgsException: If the file was written by a run with other settings,
+      or holds chunks that do not match the chunking of this run
+    """
+    done: Set[int] = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "rb+") as f:
+        end = 0
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            if end == 0:
+                _check_manifest(output_path, line, manifest)
+            else:
+                done.add(_check_chunk(output_path, line, manifest["chunk_size"]))
+            end += len(line)
+        f.truncate(end)
+    return done
+
+
+def _check_manifest(output_path: str, line: bytes, manifest: Dict[str, Any]) -> None:
+    try:
+        recorded = json.loads(line)["batch"]
+    except (ValueError, KeyError, TypeError):
+        raise BgsException(f"Cannot resume: {output_path} does not start with the settings of a batch run")
+    # the same input may be resumed from another directory
+    differences = sorted(k for k in manifest if k != "input" and recorded.get(k) != manifest[k])
+    if differences:
+        raise BgsException(
+            f"Cannot resume: {output_path} was written by a run with other {', '.join(differences)}; "
+            "use another output file, or remove it to start again"
+        )
+
+
+def _check_chunk(output_path: str, line: bytes, chunk_size: int) -> int:
+    match = _CHUNK_PATTERN.match(line)
+    if match is None:
+        raise BgsException(f"Cannot resume: unexpected line in {output_path}: {line[:80]!r}")
+    index, start, end = (int(group) for group in match.groups())
+    if start != index * chunk_size or not 0 < end - start <= chunk_size:
+        raise BgsException(f"Cannot resume: chunk {index} in {output_path} is not of the chunking of this run")
+    return index
+
+
+#####
+# RUN
+#####
+
+
+def _request_obj(settings: BatchSettings, assets: List[Asset]) -> Dict[str, Any]:
+    if settings.kind == "impact":
+        request = AssetImpactRequest(assets=Assets(items=assets), scenario=settings.scenario, year=settings.year)
+    else:
+        request = AssetExposureRequest(assets=Assets(items=assets), scenario=settings.scenario, year=settings.year)
+    return request.model_dump()
+
+
+def _status_code(e: BgsException) -> Optional[int]:
+    original = getattr(e, "original_exception", None)
+    if isinstance(original, httpx.HTTPStatusError):
+        return original.response.status_code
+    return None
+
+
+def _retryable(e: BgsException) -> bool:
+    status_code = _status_code(e)
+    if status_code is None:
+        # connection errors and timeouts
+        return isinstance(getattr(e, "original_exception", None), httpx.TransportError)
+    return status_code in RETRY_STATUS_CODES or status_code == 401
+
+
+async def _submit(
+    client: httputilities.HttpClient, token_manager: TokenManager, settings: BatchSettings, request_obj: Dict[str, Any]
+) -> Any:
+    service = SERVICES[settings.kind]
+    for attempt in range(settings.retries + 1):
+        token = await token_manager.atoken(client)
+        headers = {"Content-Type": "application/json", "Authorization": f"Bearer {token}"}
+        try:
+            return await client.request(service, "POST", obj=request_obj, headers=headers)
+        except BgsException as e:
+            if attempt == settings.retries or not _retryable(e):
+                raise
+            if _status_code(e) == 401:
+                token_manager.invalidate()
+            # exponential backoff with jitter, so that retries from concurrent chunks spread out
+            delay = min(settings.backoff * 2**attempt, settings.max_backoff) * random.uniform(0.5, 1.0)
+            logger.warning(f"Retrying {service} in {delay:.1f}s (attempt {attempt + 1}/{settings.retries}): {e}")
+            await asyncio.sleep(delay)
+
+
+async def run_batch(
+    host: str, port: int, token_manager: TokenManager, input_path: str, output_path: str, settings: BatchSettings
+) -> Dict[str, Any]:
+    """
+    Send the portfolio in input_path chunk by chunk, writing the responses
+    to output_path and skipping chunks already written there.
+
+    Returns:
+    - dict: Counts of chunks and assets sent and skipped, and the elapsed time
+    """
+    start_time = time.perf_counter()
+    manifest = run_manifest(input_path, settings)
+    done = completed_chunks(output_path, manifest)
+    if done:
+        logger.info(f"Resuming: {len(done)} chunks already in {output_path}")
+    summary = {"chunks": 0, "assets": 0, "skipped_chunks": 0, "skipped_assets": 0}
+    # bounded, so that no more of the portfolio is read than is about to be sent
+    queue: asyncio.Queue = asyncio.Queue(maxsize=settings.concurrency * 2)
+    timeout = httpx.Timeout(settings.timeout, connect=30.0)
+
+    async with httputilities.HttpClient(
+        host, port, timeout=timeout, max_concurrency=settings.concurrency, event_hooks=token_manager.event_hooks
+    ) as client:
+        with open(output_path, "ab") as output:
+            if output.tell() == 0:
+                output.write(json.dumps({"batch": manifest}).encode() + b"\n")
+                output.flush()
+
+            async def worker():
+                while True:
+                    item = await queue.get()
+                    if item is None:
+                        return
+                    index, start, assets = item
+                    response = await _submit(client, token_manager, settings, _request_obj(settings, assets))
+                    record = {"chunk": index, "start": start, "end": start + len(assets), "result": response}
+                    output.write(json.dumps(record).encode() + b"\n")
+                    output.flush()
+                    summary["chunks"] += 1
+                    summary["assets"] += len(assets)
+                    logger.info(f"Completed chunk {index} (assets {start} to {start + len(assets)})")
+
+            workers = [asyncio.create_task(worker()) for _ in range(settings.concurrency)]
+            start = 0
+            try:
+                for index, assets in enumerate(chunks(read_portfolio(input_path), settings.chunk_size)):
+                    if index in done:
+                        summary["skipped_chunks"] += 1
+                        summary["skipped_assets"] += len(assets)
+                    else:
+                        await _put(queue, (index, start, assets), workers)
+                    start += len(assets)
+                for _ in workers:
+                    await _put(queue, None, workers)
+                await asyncio.gather(*workers)
+            finally:
+                for task in workers:
+                    task.cancel()
+
+    summary["seconds"] = round(time.perf_counter() - start_time, 3)
+    return summary
+
+
+async def _put(queue: asyncio.Queue, item: Any, workers: List[asyncio.Task]) -> None:
+    # fail fast if a worker has failed, rather than waiting for space in the queue forever
+    put = asyncio.ensure_future(queue.put(item))
+    while not put.done():
+        running = [task for task in workers if not task.done()]
+        await asyncio.wait([put, *running], return_when=asyncio.FIRST_COMPLETED)
+        for task in workers:
+            if task.done() and task.exception() is not None:
+                put.cancel()
+                raise task.exception()
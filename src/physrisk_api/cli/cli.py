@@ -1,13 +1,16 @@
 import argparse
 import json
 import logging
+import os
 import sys
 from typing import List, Dict
 import httpx
 import httputilities
 import asyncio
 
+import batch
 import state
+import tokens
 
 
 from physrisk_temp import Asset, Assets
@@ -22,6 +25,8 @@ logger = logging.getLogger(__name__)
 
 
 STATE_PARSER="parser"
+STATE_TOKENS="tokens"
+STATE_TOKEN_CACHE="token_cache"
 
 
 def cmd_token(args):
@@ -102,6 +107,9 @@ def cmd_assets(args):
     host = args.host
     port = args.port
 
+    if args.action == "run":
+        return cmd_assets_run(args)
+
     provider_max_requests: Dict[str, int] = {"provider_id": 10}
     scenario = "historical"
     year = 1985
@@ -155,6 +163,25 @@ def cmd_assets(args):
     return output
 
 
+def cmd_assets_run(args):
+    if not args.input or not args.output:
+        usage("Missing parameter input or output")
+        sys.exit(0)
+
+    settings = batch.BatchSettings(
+        kind="impact" if args.impact else "exposure",
+        scenario=args.scenario,
+        year=args.year,
+        chunk_size=args.chunk_size,
+        concurrency=args.concurrency,
+        retries=args.retries,
+    )
+    output = asyncio.run(batch.run_batch(
+        args.host, args.port, _token_manager(args.host, args.port),
+        args.input, args.output, settings))
+    return output
+
+
 def cmd_tiles(args):
     if not args.host or not args.port:
         usage("Missing parameter host or port")
@@ -287,9 +314,8 @@ def _acquire_tile(
         min_value: float = None, max_value: float = None):
 
 
-    email = "test"
-    password = "test"
-    token = _acquire_token(host, port, email, password)
+    token_manager = _token_manager(host, port)
+    token = token_manager.token()
 
     # Construct the URL for the GET request
     service = f"/api/tiles/{resource}/{z}/{x}/{y}.{format}"
@@ -318,7 +344,8 @@ def _acquire_tile(
     timeout = httpx.Timeout(120.0, connect=120.0, read=120.0)
     response = asyncio.run(httputilities.httprequest(
         host, port, service, method,
-        params=params, headers=headers, timeout=timeout))
+        params=params, headers=headers, timeout=timeout,
+        event_hooks=token_manager.event_hooks))
     logger.info(f"Executed service: {service}, response (len): {len(response)}")
 
     output = response
@@ -331,9 +358,8 @@ def _acquire_image(
         colormap: str = None, min_value: float = None, max_value: float = None,
         provider_max_requests: Dict[str, int] = {"provider_id": 10}):
 
-    email = "test"
-    password = "test"
-    token = _acquire_token(host, port, email, password)
+    token_manager = _token_manager(host, port)
+    token = token_manager.token()
 
     # Construct the URL for the GET request
     service = f"/api/images/{resource}.{format}"
@@ -362,7 +388,8 @@ def _acquire_image(
     timeout = httpx.Timeout(120.0, connect=120.0, read=120.0)
     response = asyncio.run(httputilities.httprequest(
         host, port, service, method,
-        params=params, headers=headers, timeout=timeout))
+        params=params, headers=headers, timeout=timeout,
+        event_hooks=token_manager.event_hooks))
     logger.info(f"Executed service: {service}, response: {response}")
 
     output = response
@@ -374,9 +401,8 @@ def _acquire_asset_impact(
         assets: List[Asset], scenario: str = "rcp8p5", year: int = 2050,
         provider_max_requests: Dict[str, int] = {"provider_id": 10}):
 
-    email = "test"
-    password = "test"
-    token = _acquire_token(host, port, email, password)
+    token_manager = _token_manager(host, port)
+    token = token_manager.token()
 
     service = "/api/get_asset_impact"
     method = "POST"
@@ -401,7 +427,8 @@ def _acquire_asset_impact(
     response = asyncio.run(httputilities.httprequest(
         host, port, service, method,
         obj=request_obj.model_dump(),  # Convert to dict
-        headers=headers, timeout=timeout))
+        headers=headers, timeout=timeout,
+        event_hooks=token_manager.event_hooks))
     logger.info(f"Executed service: {service}, response (len): {len(response)}")
 
     output = response
@@ -414,9 +441,8 @@ def _acquire_asset_exposure(
         assets: List[Asset], scenario: str = "rcp8p5", year: int = 2050,
         provider_max_requests: Dict[str, int] = {"provider_id": 10}):
 
-    email = "test"
-    password = "test"
-    token = _acquire_token(host, port, email, password)
+    token_manager = _token_manager(host, port)
+    token = token_manager.token()
 
     service = "/api/get_asset_exposure"
     method = "POST"
@@ -441,7 +467,8 @@ def _acquire_asset_exposure(
     response = asyncio.run(httputilities.httprequest(
         host, port, service, method,
         obj=request_obj.model_dump(),  # Convert to dict
-        headers=headers, timeout=timeout))
+        headers=headers, timeout=timeout,
+        event_hooks=token_manager.event_hooks))
     logger.info(f"Executed service: {service}, response (len): {len(response)}")
 
     output = response
@@ -450,9 +477,8 @@ def _acquire_asset_exposure(
 
 def _acquire_hazard_data_availability(host: str, port: str):
 
-    email = "test"
-    password = "test"
-    token = _acquire_token(host, port, email, password)
+    token_manager = _token_manager(host, port)
+    token = token_manager.token()
 
     service = "/api/get_hazard_data_availability"
     method = "POST"
@@ -471,7 +497,8 @@ def _acquire_hazard_data_availability(host: str, port: str):
     timeout = httpx.Timeout(120.0, connect=120.0, read=120.0)
     response = asyncio.run(httputilities.httprequest(
         host, port, service, method,
-        obj=request_obj, headers=headers, timeout=timeout))
+        obj=request_obj, headers=headers, timeout=timeout,
+        event_hooks=token_manager.event_hooks))
     logger.info(f"Executed service:{service}, response:{response}")
 
     output = {
@@ -485,9 +512,8 @@ def _acquire_hazard_data(
         items: List, interpolation: str="floor",
         provider_max_requests: Dict[str, int] = {"provider_id": 10}):
 
-    email = "test"
-    password = "test"
-    token = _acquire_token(host, port, email, password)
+    token_manager = _token_manager(host, port)
+    token = token_manager.token()
 
     service = "/api/get_hazard_data"
     method = "POST"
@@ -508,11 +534,27 @@ def _acquire_hazard_data(
     timeout = httpx.Timeout(120.0, connect=120.0, read=120.0)
     response = asyncio.run(httputilities.httprequest(
         host, port, service, method,
-        obj=request_obj, headers=headers, timeout=timeout))
+        obj=request_obj, headers=headers, timeout=timeout,
+        event_hooks=token_manager.event_hooks))
     logger.info(f"Executed service:{service}, response:{response}")
     return response
 
 
+def _token_manager(host: str, port: str) -> tokens.TokenManager:
+    """
+    Token manager shared by all requests of this run, reusing tokens
+    cached by earlier runs if --token-cache is given
+    """
+    manager = state.gstate(STATE_TOKENS)
+    if manager is None:
+        email = "test"
+        password = "test"
+        manager = tokens.TokenManager(
+            host, port, email, password, cache_path=state.gstate(STATE_TOKEN_CACHE))
+        state.gstate(STATE_TOKENS, manager)
+    return manager
+
+
 def _acquire_token(host: str, port: int, email: str, password: str):
     service = "/api/token"
     method = "POST"
@@ -556,6 +598,8 @@ def execute(xargs=None):
     parser.add_argument('--verbose', action='store_true', help='Enable verbose output')
     parser.add_argument("--host", required=True, help="Registry host")
     parser.add_argument("--port", required=True, help="Registry port")
+    parser.add_argument("--token-cache", default=os.environ.get("PHYSRISK_TOKEN_CACHE"),
+                        help="File in which access tokens are kept for reuse by later runs")
 
     # Create subparsers to handle multiple commands
     subparsers = parser.add_subparsers(dest="command", help="Available commands")
@@ -573,6 +617,15 @@ def execute(xargs=None):
     assets_group = assets_parser.add_mutually_exclusive_group(required=True)
     assets_group.add_argument("--exposure", action="store_true", help="Get asset exposure")
     assets_group.add_argument("--impact", action="store_true", help="Get asset impact")
+    assets_parser.add_argument("action", nargs="?", choices=["run"],
+                               help="Run over a portfolio file rather than sample assets")
+    assets_parser.add_argument("--input", help="Portfolio file (.csv, .jsonl or .parquet), for 'run'")
+    assets_parser.add_argument("--output", help="Output file (JSON lines), for 'run'; an existing file is resumed")
+    assets_parser.add_argument("--scenario", default="historical", help="Scenario, for 'run'")
+    assets_parser.add_argument("--year", type=int, default=1985, help="Year, for 'run'")
+    assets_parser.add_argument("--chunk-size", type=int, default=1000, help="Assets per request, for 'run'")
+    assets_parser.add_argument("--concurrency", type=int, default=4, help="Requests in flight at once, for 'run'")
+    assets_parser.add_argument("--retries", type=int, default=5, help="Retries of a failed request, for 'run'")
 
     tiles_parser = subparsers.add_parser("tiles", help="Tiles inquiry")
     tiles_parser.add_argument("--parameter", required=True, help="Using parameter")
@@ -584,6 +637,8 @@ def execute(xargs=None):
     # Execute corresponding function based on provided command
     args: argparse.Namespace = parser.parse_args(xargs if xargs is not None else sys.argv[1:])
     logger.info(f"Using args:{args}")
+    if args.token_cache:
+        state.gstate(STATE_TOKEN_CACHE, args.token_cache)
 
     output = None
     if args.command == "token":
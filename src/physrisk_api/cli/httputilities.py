@@ -6,7 +6,8 @@
 #
 # Created:  2024-04-15 by eric.broda@brodagroupsoftware.com
 
-from typing import List, Optional, Dict, Any
+from typing import Callable, Iterable, List, Optional, Dict, Any
+import asyncio
 import httpx
 import logging
 
@@ -36,19 +37,36 @@ logger = logging.getLogger(__name__)
 # is specific to the time taken to read the response data from the server.
 DEFAULT_TIMEOUT = httpx.Timeout(10.0, connect=5.0, read=5.0)
 
+# Default connection pool limits for HttpClient:
+# - max_connections: maximum number of concurrent connections, across all
+# requests sent by the client
+# - max_keepalive_connections: maximum number of idle connections kept
+# open for reuse
+# - keepalive_expiry: seconds an idle connection is kept open
+DEFAULT_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=30.0)
+
+# Response header in which the server returns a refreshed access token
+ACCESS_TOKEN_HEADER = "X-Access-Token"
+
+
 async def httprequest(host: str, port: int, service: str, method: str,
              data: Optional[Any]=None, obj: Optional[Dict]=None,
              files: Optional[Any]=None, headers: Optional[Dict]=None,
-             params: Optional[Dict]=None, timeout: Optional[Any] = None) -> Any:
+             params: Optional[Dict]=None, timeout: Optional[Any] = None,
+             event_hooks: Optional[Dict[str, List[Callable]]] = None) -> Any:
     """
     Simple request function using the ASYNC httpx library.
 
+    A new connection is opened for each call; use HttpClient to reuse
+    connections across many requests.
+
     Parameters:
     - service (str): The URL of the service to which the request is made
     - method (str): The HTTP method to use (e.g., GET, POST, PUT, DELETE)
     - data (any, optional): Data to send in the request body, typically for POST requests
     - obj (dict, optional): JSON object to send in the request body
     - files (any, optional): Files to send in the request body
+    - event_hooks (dict, optional): httpx event hooks, e.g. {"response": [...]}
 
     Returns:
     - requests.Response: The response object
@@ -56,60 +74,166 @@ async def httprequest(host: str, port: int, service: str, method: str,
     # logger.info(f"Issue request, method:{method} headers:{headers} data:{data} obj:{obj} files:{files}")
 
     url = f"http://{host}:{port}{service}"
+    timeout = timeout or DEFAULT_TIMEOUT
+    logger.info(f"Using timeout:{timeout}")
+    async with httpx.AsyncClient(timeout=timeout, event_hooks=event_hooks) as client:
+        return await _send(client, url, method, data=data, obj=obj,
+                           files=files, headers=headers, params=params)
+
+
+class HttpClient:
+    """
+    Long-lived ASYNC client for one service, reusing connections (HTTP
+    keep-alive, and optionally HTTP/2) across requests.
+
+    Use as an async context manager, or call aclose() when done:
+
+        async with HttpClient(host, port, max_concurrency=50) as client:
+            token = await client.request("/api/token", "POST", obj=credentials)
+            responses = await client.gather([
+                {"service": "/api/get_hazard_data", "method": "POST", "obj": request_obj}
+                for request_obj in request_objs
+            ])
+    """
+
+    def __init__(self, host: str, port: int, scheme: str = "http",
+                 timeout: Optional[httpx.Timeout] = None,
+                 limits: Optional[httpx.Limits] = None,
+                 http2: bool = False,
+                 max_concurrency: Optional[int] = None,
+                 headers: Optional[Dict] = None,
+                 event_hooks: Optional[Dict[str, List[Callable]]] = None):
+        """
+        Parameters:
+        - host (str), port (int): Address of the service
+        - scheme (str, optional): 'http' or 'https'
+        - timeout (httpx.Timeout, optional): Timeout of each request (default DEFAULT_TIMEOUT)
+        - limits (httpx.Limits, optional): Connection pool limits (default DEFAULT_LIMITS)
+        - http2 (bool, optional): Use HTTP/2 if the server supports it (requires the 'h2' package)
+        - max_concurrency (int, optional): Maximum number of requests in flight at
+          once (default: the maximum number of connections)
+        - headers (dict, optional): Headers sent with every request, e.g. Authorization
+        - event_hooks (dict, optional): httpx event hooks, e.g. TokenManager.event_hooks
+        """
+        self.base_url = f"{scheme}://{host}:{port}"
+        limits = limits or DEFAULT_LIMITS
+        self.max_concurrency = max_concurrency or limits.max_connections or 100
+        # created on first use, within the event loop running the requests
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        try:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url, timeout=timeout or DEFAULT_TIMEOUT,
+                limits=limits, http2=http2, headers=headers, event_hooks=event_hooks)
+        except ImportError as e:
+            raise BgsException("HTTP/2 requires the 'h2' package: pip install 'httpx[http2]'", e)
+
+    @property
+    def headers(self) -> httpx.Headers:
+        """Headers sent with every request; may be updated, e.g. with a refreshed token"""
+        return self._client.headers
+
+    async def __aenter__(self) -> "HttpClient":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+    async def request(self, service: str, method: str,
+                      data: Optional[Any] = None, obj: Optional[Dict] = None,
+                      files: Optional[Any] = None, headers: Optional[Dict] = None,
+                      params: Optional[Dict] = None, timeout: Optional[Any] = None) -> Any:
+        """
+        Send a request, waiting first if max_concurrency requests are in flight.
+
+        Parameters and response handling are as for httprequest.
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._semaphore:
+            return await _send(self._client, self.base_url + service, method, data=data, obj=obj,
+                               files=files, headers=headers, params=params, timeout=timeout)
+
+    async def gather(self, requests: Iterable[Dict], return_exceptions: bool = False) -> List[Any]:
+        """
+        Send many requests concurrently, at most max_concurrency at a time.
+
+        Parameters:
+        - requests (iterable of dict): Keyword arguments of request() for each request
+        - return_exceptions (bool, optional): Return a failed request's BgsException
+          in place of its response rather than raising it
+
+        Returns:
+        - list: Responses, in the order of the requests
+        """
+        return await asyncio.gather(
+            *(self.request(**kwargs) for kwargs in requests),
+            return_exceptions=return_exceptions)
+
+
+async def _send(client: httpx.AsyncClient, url: str, method: str,
+                data: Optional[Any] = None, obj: Optional[Dict] = None,
+                files: Optional[Any] = None, headers: Optional[Dict] = None,
+                params: Optional[Dict] = None, timeout: Optional[Any] = None) -> Any:
     method = method.upper()
     logger.info(f"Request method:{method} url:{url}")
 
     if not headers and files is None:
         headers = {"Content-Type": "application/json"}
 
+    kwargs = {"timeout": timeout} if timeout is not None else {}
     try:
-        timeout = timeout or DEFAULT_TIMEOUT
-        logger.info(f"Using timeout:{timeout}")
-        async with httpx.AsyncClient(timeout=timeout) as client:
-            response = await client.request(
-                method, url, headers=headers, json=obj,
-                data=data, files=files, params=params
-            )
-            response.raise_for_status()
-            # Check the content type to determine how to process the response
-            if "application/json" in response.headers.get("Content-Type", ""):
-                return response.json()
-            elif "image/" in response.headers.get("Content-Type", ""):
-                # Return binary image data
-                return response.content
-            else:
-                # Handle other content types if necessary
-                return response.text
-    except httpx.HTTPStatusError as e:
-        details = e.response.json().get("detail", str(e))
-        msg = f"HTTP status error for {url}: {details}"
+        response = await client.request(
+            method, url, headers=headers, json=obj,
+            data=data, files=files, params=params, **kwargs
+        )
+        response.raise_for_status()
+        return _content(response)
+    except Exception as e:
+        msg = _error_message(url, e)
         logger.error(msg)
-        raise BgsException(msg)
+        raise BgsException(msg, e)
 
-    except httpx.ConnectTimeout:
-        msg = f"Connection timeout for {url}"
-        logger.error(msg)
-        raise BgsException(msg)
 
-    except httpx.ConnectError:
-        msg = f"Connection error for {url}"
-        logger.error(msg)
-        raise BgsException(msg)
+def _content(response: httpx.Response) -> Any:
+    # Check the content type to determine how to process the response
+    if "application/json" in response.headers.get("Content-Type", ""):
+        return response.json()
+    elif "image/" in response.headers.get("Content-Type", ""):
+        # Return binary image data
+        return response.content
+    else:
+        # Handle other content types if necessary
+        return response.text
 
-    except httpx.NetworkError:
-        msg = f"Network error for {url}"
-        logger.error(msg)
-        raise BgsException(msg)
 
-    except httpx.ReadTimeout:
-        msg = f"Read timeout for {url}"
-        logger.error(msg)
-        raise BgsException(msg)
+# Messages for errors sending a request, for the first matching exception type
+# (ConnectError is a NetworkError, so must come first)
+_ERROR_MESSAGES = [
+    (httpx.ConnectTimeout, "Connection timeout"),
+    (httpx.ConnectError, "Connection error"),
+    (httpx.NetworkError, "Network error"),
+    (httpx.ReadTimeout, "Read timeout"),
+]
+
+
+def _error_message(url: str, e: Exception) -> str:
+    if isinstance(e, httpx.HTTPStatusError):
+        try:
+            body = e.response.json()
+        except ValueError:
+            # e.g. an HTML error page
+            body = None
+        # FastAPI-style {"detail": ...} bodies; others, e.g. a JSON list, are not described
+        details = body.get("detail", str(e)) if isinstance(body, dict) else str(e)
+        return f"HTTP status error for {url}: {details}"
+    for error_type, message in _ERROR_MESSAGES:
+        if isinstance(e, error_type):
+            return f"{message} for {url}"
+    return f"Unexpected error for {url}: {e}"
 
-    except Exception as e:
-        msg = f"Unexpected error for {url}: {e}"
-        logger.error(msg)
-        raise BgsException(msg)
 
 def shttprequest(host: str, port: int, service: str, method: str,
              data: Optional[Any]=None, obj: Optional[Dict]=None,
@@ -0,0 +1,164 @@
+# Copyright 2024 Broda Group Software Inc.
+#
+# Use of this source code is governed by an MIT-style
+# license that can be found in the LICENSE file or at
+# https://opensource.org/licenses/MIT.
+
+"""
+Access token caching, so that a token is acquired once and reused until
+it is about to expire rather than acquired again for every request
+"""
+
+import asyncio
+import base64
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import httputilities
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Tokens are refreshed this many seconds before they expire
+DEFAULT_REFRESH_MARGIN = 300
+
+
+def token_expiry(token: str) -> Optional[float]:
+    """
+    Expiry time (seconds since the epoch) of a JWT, from its 'exp' claim.
+
+    The signature is not verified: the token is only inspected to decide
+    when to acquire a new one.
+    """
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except Exception:
+        return None
+
+
+class TokenManager:
+    """
+    Holds the access token for one user of one service, in memory and
+    optionally in a file shared by successive CLI runs.
+
+    A new token is acquired from /api/token only when there is none, or
+    when the current one expires within refresh_margin seconds. A token
+    refreshed by the server, in the X-Access-Token response header, is
+    picked up by the response hook in event_hooks.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        email: str,
+        password: str,
+        cache_path: Optional[str] = None,
+        refresh_margin: float = DEFAULT_REFRESH_MARGIN,
+    ):
+        """
+        Parameters:
+        - host (str), port (int): Address of the service
+        - email (str), password (str): Credentials used to acquire tokens
+        - cache_path (str, optional): JSON file in which tokens are kept between runs
+        - refresh_margin (float, optional): Seconds before expiry at which a token is replaced
+        """
+        self.host = host
+        self.port = port
+        self.email = email
+        self.password = password
+        self.cache_path = cache_path
+        self.refresh_margin = refresh_margin
+        self._key = f"{host}:{port}:{email}"
+        self._token: Optional[str] = None
+        self._lock = threading.Lock()
+        self._async_lock: Optional[asyncio.Lock] = None
+        if cache_path:
+            self._token = self._read_cache().get(self._key)
+
+    def valid(self) -> bool:
+        """True if the current token can be used for at least refresh_margin seconds"""
+        if self._token is None:
+            return False
+        expiry = token_expiry(self._token)
+        # a token without expiry is used until the server rejects it
+        return expiry is None or expiry - self.refresh_margin > time.time()
+
+    def token(self) -> str:
+        """Current token, acquired first if needed (not to be called from a running event loop)"""
+        with self._lock:
+            if not self.valid():
+                self._set(asyncio.run(self._acquire()))
+            return self._token
+
+    async def atoken(self, client: Optional[httputilities.HttpClient] = None) -> str:
+        """Current token, acquired first if needed, optionally using a pooled client"""
+        if self._async_lock is None:
+            self._async_lock = asyncio.Lock()
+        async with self._async_lock:
+            if not self.valid():
+                self._set(await self._acquire(client))
+            return self._token
+
+    @property
+    def event_hooks(self) -> Dict[str, List[Callable]]:
+        """httpx event hooks picking up tokens refreshed by the server"""
+        return {"response": [self.on_response]}
+
+    async def on_response(self, response: httpx.Response) -> None:
+        """Pick up a token refreshed by the server, if the response has one"""
+        self.update(response.headers.get(httputilities.ACCESS_TOKEN_HEADER))
+
+    def update(self, token: Optional[str]) -> None:
+        """Use a token refreshed by the server"""
+        if token and token != self._token:
+            logger.info("Using access token refreshed by server")
+            self._set(token)
+
+    def invalidate(self) -> None:
+        """Discard the current token, e.g. after the server has rejected it"""
+        self._token = None
+
+    async def _acquire(self, client: Optional[httputilities.HttpClient] = None) -> str:
+        request_obj = {"email": self.email, "password": self.password}
+        logger.info(f"Acquiring access token for email:{self.email}")
+        if client is not None:
+            response = await client.request("/api/token", "POST", obj=request_obj)
+        else:
+            response = await httputilities.httprequest(self.host, self.port, "/api/token", "POST", obj=request_obj)
+        return response["access_token"]
+
+    def _set(self, token: str) -> None:
+        self._token = token
+        if self.cache_path:
+            self._write_cache()
+
+    def _read_cache(self) -> Dict[str, str]:
+        try:
+            with open(self.cache_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_cache(self) -> None:
+        tokens = self._read_cache()
+        tokens[self._key] = self._token
+        directory = os.path.dirname(os.path.abspath(self.cache_path))
+        os.makedirs(directory, exist_ok=True)
+        # readable by the current user only; replaced atomically so that
+        # concurrent runs never read a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tokens-")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(tokens, f)
+            os.replace(tmp_path, self.cache_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
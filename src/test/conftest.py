@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# the CLI is run as a script, with its own directory on the path; its modules are imported likewise in tests
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "physrisk_api" / "cli"))
@@ -1,6 +1,9 @@
+import gzip
 import json
 import unittest.mock as mock
+from datetime import timedelta
 
+from flask_jwt_extended import create_access_token, decode_token
 from physrisk.requests import Requester
 
 from physrisk_api.app import create_app
@@ -149,3 +152,221 @@ def test_hazard_inventory_no_items_in_response(caplog):
 
         assert resp.status_code == 404
         assert "No results returned for 'get_hazard_data_availability' request" in caplog.text
+
+
+def test_tiles_cached():
+    app = create_app()
+    requester_mock = mock.Mock(spec=Requester)
+    with app.container.requester.override(requester_mock):
+        requester_mock.get_image.return_value = b"PNG"
+
+        with app.test_client() as test_client:
+            url = "/api/tiles/inundation/flood_depth/8/134/82.png?scenarioId=historical&year=1985"
+            first = test_client.get(url)
+            second = test_client.get(url)
+            other = test_client.get(url + "&maxValue=5")
+            stats = test_client.get("/api/cache/stats").json
+
+        assert first.data == second.data == other.data == b"PNG"
+        assert requester_mock.get_image.call_count == 2
+        assert stats["tiles"]["hits"] == 1
+        assert stats["tiles"]["misses"] == 2
+
+
+def test_reset_clears_tile_cache():
+    app = create_app()
+    requester_mock = mock.Mock(spec=Requester)
+    with app.container.requester.override(requester_mock):
+        requester_mock.get_image.return_value = b"PNG"
+
+        with app.test_client() as test_client:
+            url = "/api/tiles/inundation/flood_depth/8/134/82.png?scenarioId=historical&year=1985"
+            test_client.get(url)
+            test_client.get("/api/reset")
+            app.warm_up_thread.join(timeout=10)
+            test_client.get(url)
+
+        assert requester_mock.get_image.call_count == 2
+
+
+def test_tiles_not_modified():
+    app = create_app()
+    requester_mock = mock.Mock(spec=Requester)
+    with app.container.requester.override(requester_mock):
+        requester_mock.get_image.return_value = b"PNG"
+
+        with app.test_client() as test_client:
+            url = "/api/tiles/inundation/flood_depth/8/134/82.png?scenarioId=historical&year=1985"
+            first = test_client.get(url)
+            etag = first.headers["ETag"]
+            app.tile_cache.clear()
+            second = test_client.get(url, headers={"If-None-Match": etag})
+
+        assert first.status_code == 200
+        assert "max-age=3600" in first.headers["Cache-Control"]
+        assert second.status_code == 304
+        assert second.headers["ETag"] == etag
+        assert requester_mock.get_image.call_count == 1
+
+
+def test_tiles_keyed_on_data_access():
+    app = create_app()
+    requester_mock = mock.Mock(spec=Requester)
+    with app.container.requester.override(requester_mock):
+        requester_mock.get_image.return_value = b"PNG"
+        with app.app_context():
+            token = create_access_token(identity="test", additional_claims={"data_access": "public"})
+
+        with app.test_client() as test_client:
+            url = "/api/tiles/inundation/flood_depth/8/134/82.png?scenarioId=historical&year=1985"
+            tile = test_client.get(url, headers={"Authorization": f"Bearer {token}"})
+            group = test_client.get("/api/data_access", headers={"Authorization": f"Bearer {token}"})
+            default_group = test_client.get("/api/data_access")
+
+        # private to clients; only the proxy tier shares tiles, keyed on the group
+        assert "private" in tile.headers["Cache-Control"]
+        assert "public" not in tile.headers["Cache-Control"]
+        assert "Authorization" in tile.headers["Vary"]
+        assert tile.headers["X-Accel-Expires"] == "3600"
+        assert "X-Data-Access" not in tile.headers
+        assert group.status_code == 204
+        assert group.headers["X-Data-Access"] == "public"
+        assert default_group.headers["X-Data-Access"] == "osc"
+
+
+def test_hazard_data_cached():
+    app = create_app()
+    requester_mock = mock.Mock(spec=Requester)
+    with app.container.requester.override(requester_mock):
+        requester_mock.get.return_value = json.dumps(
+            {
+                "items": [
+                    {
+                        "intensity_curve_set": [{"intensities": [0.5], "return_periods": [100.0]}],
+                        "request_item_id": "afac2a5d-9961-...",
+                        "event_type": "RiverineInundation",
+                        "scenario": "rcp8p5",
+                        "year": 2080,
+                    }
+                ]
+            }
+        )
+
+        with app.test_client() as test_client:
+            first = do_hazard_data_request(test_client)
+            second = do_hazard_data_request(test_client)
+            stats = test_client.get("/api/cache/stats").json
+
+        assert first.json == second.json
+        assert requester_mock.get.call_count == 1
+        assert stats["hazard_data"]["hit_ratio"] == 0.5
+
+
+def test_asset_exposure_not_coalesced():
+    app = create_app()
+    requester_mock = mock.Mock(spec=Requester)
+    with app.container.requester.override(requester_mock):
+        requester_mock.get.return_value = json.dumps({"items": [{"asset_id": "0", "exposures": {}}]})
+        assets = [{"id": "0", "asset_class": "Asset", "latitude": 0.0, "longitude": 0.0}]
+
+        with app.test_client() as test_client:
+            resp = test_client.post("/api/get_asset_exposure", json={"assets": {"items": assets}})
+            test_client.post("/api/get_hazard_data_availability", json={})
+            stats = test_client.get("/api/cache/stats").json
+
+    assert resp.status_code == 200
+    # portfolio requests are not keyed by their content, which would cost a serialization of the portfolio
+    assert stats["single_flight"]["requests"]["executed"] == 1
+
+
+def test_asset_exposure_ndjson_stream():
+    app = create_app()
+    app.config["STREAM_CHUNK_SIZE"] = 2
+    requester_mock = mock.Mock(spec=Requester)
+    with app.container.requester.override(requester_mock):
+
+        def get(request_id, request_dict):
+            items = request_dict["assets"]["items"]
+            return json.dumps({"items": [{"asset_id": a["id"], "exposures": {}} for a in items]})
+
+        requester_mock.get.side_effect = get
+        assets = [{"id": str(i), "asset_class": "Asset", "latitude": 0.0, "longitude": 0.0} for i in range(5)]
+
+        with app.test_client() as test_client:
+            resp = test_client.post(
+                "/api/get_asset_exposure",
+                json={"assets": {"items": assets}},
+                headers={"Accept": "application/x-ndjson"},
+            )
+            lines = resp.data.splitlines()
+
+        assert resp.status_code == 200
+        assert resp.mimetype == "application/x-ndjson"
+        assert [json.loads(line)["asset_id"] for line in lines] == ["0", "1", "2", "3", "4"]
+        assert requester_mock.get.call_count == 3
+
+
+def test_hazard_inventory_prepared():
+    app = create_app()
+    requester_mock = mock.Mock(spec=Requester)
+    with app.container.requester.override(requester_mock):
+        expected = {"models": [{"hazard_type": "RiverineInundation", "path": "inundation/wri/v2/{scenario}_{year}"}]}
+        requester_mock.get.return_value = json.dumps(expected)
+
+        with app.test_client() as test_client:
+            first = test_client.post("/api/get_hazard_data_availability", json={})
+            etag = first.headers["ETag"]
+            not_modified = test_client.post(
+                "/api/get_hazard_data_availability", json={}, headers={"If-None-Match": etag}
+            )
+            gzipped = test_client.post(
+                "/api/get_hazard_data_availability", json={}, headers={"Accept-Encoding": "gzip"}
+            )
+            gzipped_not_modified = test_client.post(
+                "/api/get_hazard_data_availability",
+                json={},
+                headers={"Accept-Encoding": "gzip", "If-None-Match": gzipped.headers["ETag"]},
+            )
+            test_client.get("/api/reset")
+            app.warm_up_thread.join(timeout=10)
+            test_client.post("/api/get_hazard_data_availability", json={})
+
+    assert first.json == expected
+    assert not_modified.status_code == 304
+    assert gzipped.headers["Content-Encoding"] == "gzip"
+    assert gzipped.headers["ETag"].startswith("W/")
+    assert gzipped_not_modified.status_code == 304
+    assert json.loads(gzip.decompress(gzipped.data)) == expected
+    assert "Accept-Encoding" in gzipped.headers["Vary"]
+    assert requester_mock.get.call_count == 2
+
+
+def test_expiring_token_refreshed_in_header():
+    app = create_app()
+    requester_mock = mock.Mock(spec=Requester)
+    with app.container.requester.override(requester_mock):
+        expected = {"items": [{"asset_id": "", "exposures": {}}]}
+        requester_mock.get.return_value = json.dumps(expected)
+        with app.app_context():
+            expiring = create_access_token(
+                identity="test", additional_claims={"data_access": "osc"}, expires_delta=timedelta(minutes=5)
+            )
+            fresh = create_access_token(identity="test", additional_claims={"data_access": "osc"})
+
+        with app.test_client() as test_client:
+            refreshed = test_client.post(
+                "/api/get_asset_exposure",
+                json={"assets": {"items": []}},
+                headers={"Authorization": f"Bearer {expiring}"},
+            )
+            not_refreshed = test_client.post(
+                "/api/get_asset_exposure", json={"assets": {"items": []}}, headers={"Authorization": f"Bearer {fresh}"}
+            )
+
+    # the body is passed through unchanged
+    assert refreshed.json == expected
+    assert requester_mock.get.call_args.kwargs["request_dict"]["group_ids"] == ["osc"]
+    with app.app_context():
+        claims = decode_token(refreshed.headers["X-Access-Token"])
+    assert (claims["sub"], claims["data_access"]) == ("test", "osc")
+    assert "X-Access-Token" not in not_refreshed.headers
@@ -1,3 +1,8 @@
+import unittest.mock as mock
+
+from dependency_injector import providers
+from physrisk.requests import Requester
+
 from physrisk_api.app import create_app
 
 
@@ -11,3 +16,26 @@ def test_home():
 
         assert resp.status_code == 200
         assert resp.data == b"Hello World!"
+
+
+def test_ready_after_warm_up():
+    """Ensure readiness is only reported once the physrisk container can be built."""
+
+    app = create_app()
+    requester_mock = mock.Mock(spec=Requester)
+
+    def unreachable():
+        raise RuntimeError("hazard data not reachable")
+
+    with app.test_client() as test_client:
+        with app.container.requester.override(providers.Callable(unreachable)):
+            assert test_client.get("/ready").status_code == 503
+            app.warm_up_thread.join(timeout=10)
+            assert test_client.get("/ready").status_code == 503
+            app.warm_up_thread.join(timeout=10)
+        with app.container.requester.override(requester_mock):
+            # warm-up runs in the background, so the check that starts it does not wait for it
+            assert test_client.get("/ready").status_code == 503
+            app.warm_up_thread.join(timeout=10)
+            assert test_client.get("/ready").status_code == 200
+        assert app.ready
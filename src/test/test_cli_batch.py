@@ -0,0 +1,172 @@
+import asyncio
+import json
+
+import batch
+import httpx
+import pytest
+from batch import BatchSettings, completed_chunks, read_portfolio, run_batch, run_manifest
+from bgsexception import BgsException
+
+
+class FakeTokenManager:
+    event_hooks = {}
+
+    def __init__(self):
+        self.invalidated = 0
+
+    async def atoken(self, client=None):
+        return "token"
+
+    def invalidate(self):
+        self.invalidated += 1
+
+
+class FakeClient:
+    """Stands in for httputilities.HttpClient, answering with one result per asset of each request."""
+
+    requests = []
+    fail_at = None
+
+    def __init__(self, host, port, **kwargs):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    async def request(self, service, method, obj=None, headers=None):
+        latitudes = [asset["latitude"] for asset in obj["assets"]["items"]]
+        if FakeClient.fail_at in latitudes:
+            raise BgsException("Bad request", http_error(400))
+        FakeClient.requests.append(latitudes)
+        return {"items": [{"latitude": latitude} for latitude in latitudes]}
+
+
+def http_error(status_code: int) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "http://localhost/api/get_asset_exposure")
+    return httpx.HTTPStatusError("error", request=request, response=httpx.Response(status_code, request=request))
+
+
+def write_portfolio(path, n):
+    path.write_text(
+        "".join(json.dumps({"asset_class": "RealEstateAsset", "latitude": i, "longitude": 0}) + "\n" for i in range(n))
+    )
+    return str(path)
+
+
+def test_read_portfolio_csv(tmp_path):
+    path = tmp_path / "portfolio.csv"
+    path.write_text(
+        "asset_class,latitude,longitude,type,site\nPowerGeneratingAsset,53.7,9.4,Gas,north\nRealEstateAsset,1,2,,\n"
+    )
+
+    first, second = read_portfolio(str(path))
+
+    assert (first.asset_class, first.latitude, first.longitude, first.type) == (
+        "PowerGeneratingAsset",
+        53.7,
+        9.4,
+        "Gas",
+    )
+    assert first.attributes == {"site": "north"}
+    # empty values are omitted, so that defaults apply
+    assert second.type is None and second.attributes is None
+
+
+def test_read_portfolio_jsonl_and_unsupported(tmp_path):
+    path = tmp_path / "portfolio.jsonl"
+    path.write_text(
+        json.dumps(
+            {"asset_class": "RealEstateAsset", "latitude": 1, "longitude": 2, "attributes": {"a": "b"}, "floors": 3}
+        )
+        + "\n\n"
+    )
+
+    (asset,) = read_portfolio(str(path))
+
+    assert asset.attributes == {"a": "b", "floors": "3"}
+    with pytest.raises(BgsException):
+        list(read_portfolio(str(tmp_path / "portfolio.xlsx")))
+
+
+def test_partial_checkpoint_line_truncated(tmp_path):
+    input_path = write_portfolio(tmp_path / "portfolio.jsonl", 5)
+    manifest = run_manifest(input_path, BatchSettings(chunk_size=2))
+    output = tmp_path / "output.jsonl"
+    lines = [{"batch": manifest}, {"chunk": 0, "start": 0, "end": 2, "result": {}}]
+    complete = "".join(json.dumps(line) + "\n" for line in lines)
+    output.write_text(complete + '{"chunk": 1, "start": 2, "end": 4, "res')
+
+    assert completed_chunks(str(output), manifest) == {0}
+    assert output.read_text() == complete
+
+
+def test_resume_with_other_settings_refused(tmp_path):
+    input_path = write_portfolio(tmp_path / "portfolio.jsonl", 5)
+    output = tmp_path / "output.jsonl"
+    output.write_text(json.dumps({"batch": run_manifest(input_path, BatchSettings(chunk_size=2))}) + "\n")
+
+    with pytest.raises(BgsException, match="chunk_size"):
+        completed_chunks(str(output), run_manifest(input_path, BatchSettings(chunk_size=3)))
+    write_portfolio(tmp_path / "portfolio.jsonl", 6)
+    with pytest.raises(BgsException, match="input_sha256"):
+        completed_chunks(str(output), run_manifest(input_path, BatchSettings(chunk_size=2)))
+
+
+def test_retry_with_backoff(monkeypatch):
+    delays = []
+
+    async def sleep(delay):
+        delays.append(delay)
+
+    monkeypatch.setattr(batch.asyncio, "sleep", sleep)
+    errors = [http_error(503), http_error(401), httpx.ConnectError("refused")]
+
+    class FlakyClient:
+        async def request(self, service, method, obj=None, headers=None):
+            if errors:
+                raise BgsException("failed", errors.pop(0))
+            return {"items": []}
+
+    token_manager = FakeTokenManager()
+    settings = BatchSettings(backoff=1.0, max_backoff=3.0, retries=3)
+
+    assert asyncio.run(batch._submit(FlakyClient(), token_manager, settings, {})) == {"items": []}
+    assert token_manager.invalidated == 1
+    # doubled for each retry up to max_backoff, with jitter of up to half
+    for delay, limit in zip(delays, [1.0, 2.0, 3.0]):
+        assert limit / 2 <= delay <= limit
+    assert len(delays) == 3
+
+    errors.extend([http_error(503)] * 2)
+    with pytest.raises(BgsException):
+        asyncio.run(batch._submit(FlakyClient(), token_manager, BatchSettings(retries=1), {}))
+    errors[:] = [http_error(400)]
+    delays.clear()
+    with pytest.raises(BgsException):
+        asyncio.run(batch._submit(FlakyClient(), token_manager, settings, {}))
+    assert delays == []
+
+
+def test_resume(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch.httputilities, "HttpClient", FakeClient)
+    monkeypatch.setattr(FakeClient, "requests", [])
+    input_path = write_portfolio(tmp_path / "portfolio.jsonl", 7)
+    output_path = str(tmp_path / "output.jsonl")
+    settings = BatchSettings(chunk_size=2, concurrency=1, retries=0)
+
+    monkeypatch.setattr(FakeClient, "fail_at", 4)
+    with pytest.raises(BgsException):
+        asyncio.run(run_batch("localhost", 8081, FakeTokenManager(), input_path, output_path, settings))
+    monkeypatch.setattr(FakeClient, "fail_at", None)
+    summary = asyncio.run(run_batch("localhost", 8081, FakeTokenManager(), input_path, output_path, settings))
+
+    with open(output_path) as f:
+        header, *records = [json.loads(line) for line in f]
+    assert header["batch"]["chunk_size"] == 2
+    assert sorted((r["chunk"], r["start"], r["end"]) for r in records) == [(0, 0, 2), (1, 2, 4), (2, 4, 6), (3, 6, 7)]
+    assert FakeClient.requests == [[0, 1], [2, 3], [4, 5], [6]]
+    assert summary["skipped_chunks"] == 2
+    assert summary["chunks"] == 2
@@ -0,0 +1,103 @@
+import asyncio
+
+import httputilities
+import httpx
+import pytest
+from bgsexception import BgsException
+from httputilities import HttpClient
+
+
+class Clients(list):
+    """httpx clients created, which send requests to `handler` rather than the network."""
+
+    handler = None
+
+
+@pytest.fixture
+def clients(monkeypatch):
+    created = Clients()
+    async_client = httpx.AsyncClient
+
+    def make_client(**kwargs):
+        client = async_client(transport=httpx.MockTransport(lambda request: created.handler(request)), **kwargs)
+        created.append(client)
+        return client
+
+    monkeypatch.setattr(httputilities.httpx, "AsyncClient", make_client)
+    return created
+
+
+def requests_for(count):
+    return [{"service": "/api/test", "method": "POST", "obj": {"i": i}} for i in range(count)]
+
+
+def test_gather_bounded_and_ordered(clients):
+    in_flight, peak = 0, 0
+
+    async def handler(request):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        i = httpx.Response(200, content=request.content).json()["i"]
+        # later requests finish first
+        await asyncio.sleep(0.001 * (10 - i))
+        in_flight -= 1
+        return httpx.Response(200, json={"i": i})
+
+    clients.handler = handler
+
+    async def run():
+        async with HttpClient("localhost", 8081, max_concurrency=3) as client:
+            return await client.gather(requests_for(10))
+
+    responses = asyncio.run(run())
+
+    assert [response["i"] for response in responses] == list(range(10))
+    assert peak == 3
+
+
+def test_gather_reuses_client(clients):
+    clients.handler = lambda request: httpx.Response(200, json={})
+
+    async def run():
+        async with HttpClient("localhost", 8081) as client:
+            await client.request("/api/token", "POST", obj={})
+            await client.gather(requests_for(5))
+            assert not clients[0].is_closed
+
+    asyncio.run(run())
+
+    assert len(clients) == 1
+    assert clients[0].is_closed
+
+
+def test_gather_raises_failed_request(clients):
+    def handler(request):
+        i = httpx.Response(200, content=request.content).json()["i"]
+        if i == 2:
+            # a JSON body other than an object has no detail to report
+            return httpx.Response(500, json=["failed"])
+        return httpx.Response(200, json={"i": i})
+
+    clients.handler = handler
+
+    async def run(return_exceptions):
+        async with HttpClient("localhost", 8081) as client:
+            return await client.gather(requests_for(4), return_exceptions=return_exceptions)
+
+    with pytest.raises(BgsException, match="HTTP status error for http://localhost:8081/api/test"):
+        asyncio.run(run(False))
+    responses = asyncio.run(run(True))
+    assert isinstance(responses[2], BgsException)
+    assert [responses[i]["i"] for i in (0, 1, 3)] == [0, 1, 3]
+
+
+def test_error_detail(clients):
+    clients.handler = lambda request: httpx.Response(404, json={"detail": "no such job"})
+
+    async def run():
+        async with HttpClient("localhost", 8081) as client:
+            await client.request("/api/jobs/1", "GET")
+
+    with pytest.raises(BgsException, match="no such job"):
+        asyncio.run(run())
@@ -0,0 +1,112 @@
+import asyncio
+import base64
+import json
+import os
+import stat
+import time
+
+import httpx
+from tokens import TokenManager, token_expiry
+
+
+def make_token(exp=None) -> str:
+    claims = {"sub": "test"} if exp is None else {"sub": "test", "exp": exp}
+    payload = base64.urlsafe_b64encode(json.dumps(claims).encode()).decode().rstrip("=")
+    return f"header.{payload}.signature"
+
+
+def manager(tmp_path=None, refresh_margin=300) -> TokenManager:
+    cache_path = str(tmp_path / "tokens.json") if tmp_path is not None else None
+    return TokenManager("localhost", 8081, "test", "secret", cache_path=cache_path, refresh_margin=refresh_margin)
+
+
+def counting_acquire(token_manager: TokenManager, tokens):
+    calls = []
+
+    async def acquire(client=None):
+        calls.append(client)
+        return tokens[len(calls) - 1]
+
+    token_manager._acquire = acquire
+    return calls
+
+
+def test_token_expiry():
+    assert token_expiry(make_token(exp=1234)) == 1234.0
+    assert token_expiry(make_token()) is None
+    assert token_expiry("not a token") is None
+
+
+def test_token_refreshed_within_margin():
+    token_manager = manager(refresh_margin=300)
+    expiring, fresh = make_token(exp=time.time() + 200), make_token(exp=time.time() + 3600)
+    calls = counting_acquire(token_manager, [expiring, fresh])
+
+    # a token expiring within the margin is replaced at once; one that is not is reused
+    assert token_manager.token() == expiring
+    assert token_manager.token() == fresh
+    assert token_manager.token() == fresh
+    assert len(calls) == 2
+
+
+def test_token_without_expiry_used_until_invalidated():
+    token_manager = manager()
+    first, second = make_token(), make_token(exp=time.time() + 3600)
+    calls = counting_acquire(token_manager, [first, second])
+
+    assert token_manager.token() == token_manager.token() == first
+    token_manager.invalidate()
+    assert token_manager.token() == second
+    assert len(calls) == 2
+
+
+def test_token_refreshed_by_server():
+    token_manager = manager()
+    token_manager.update(make_token(exp=time.time() + 3600))
+    refreshed = make_token(exp=time.time() + 7200)
+    response = httpx.Response(200, headers={"X-Access-Token": refreshed})
+
+    asyncio.run(token_manager.on_response(response))
+
+    assert token_manager.valid()
+    assert token_manager._token == refreshed
+
+
+def test_cache_file_private_and_replaced_atomically(tmp_path):
+    token = make_token(exp=time.time() + 3600)
+    token_manager = manager(tmp_path)
+    counting_acquire(token_manager, [token])
+
+    token_manager.token()
+    cache_path = tmp_path / "tokens.json"
+
+    assert stat.S_IMODE(os.stat(cache_path).st_mode) == 0o600
+    # written to a temporary file that is then renamed over the cache
+    assert [path.name for path in tmp_path.iterdir()] == ["tokens.json"]
+    assert json.loads(cache_path.read_text()) == {"localhost:8081:test": token}
+    assert manager(tmp_path).token() == token
+
+
+def test_corrupt_cache_ignored(tmp_path):
+    (tmp_path / "tokens.json").write_text("{not json")
+    token = make_token(exp=time.time() + 3600)
+    token_manager = manager(tmp_path)
+    calls = counting_acquire(token_manager, [token])
+
+    assert token_manager.token() == token
+    assert len(calls) == 1
+    assert json.loads((tmp_path / "tokens.json").read_text()) == {"localhost:8081:test": token}
+
+
+def test_expired_cached_token_replaced(tmp_path):
+    other_user = make_token(exp=time.time() + 3600)
+    cached = {"localhost:8081:test": make_token(exp=time.time() - 60), "localhost:8081:other": other_user}
+    (tmp_path / "tokens.json").write_text(json.dumps(cached))
+    token = make_token(exp=time.time() + 3600)
+    token_manager = manager(tmp_path)
+    calls = counting_acquire(token_manager, [token])
+
+    assert not token_manager.valid()
+    assert token_manager.token() == token
+    assert len(calls) == 1
+    assert json.loads((tmp_path / "tokens.json").read_text())["localhost:8081:other"] == other_user
@@ -0,0 +1,92 @@
+import gzip
+import json
+from unittest import mock
+
+import pytest
+from flask import Flask, Response
+from physrisk.requests import Requester
+from werkzeug.datastructures import Accept
+
+from physrisk_api.app import create_app
+from physrisk_api.app.compression import Compressor, parse_levels
+
+BODY = json.dumps({"items": [{"asset_id": str(i), "value": i * 0.5} for i in range(200)]}).encode()
+
+
+def accept(value: str) -> Accept:
+    return Flask(__name__).test_request_context(headers={"Accept-Encoding": value}).request.accept_encodings
+
+
+def test_negotiate():
+    compressor = Compressor(encodings=["gzip"])
+
+    assert compressor.negotiate(accept("gzip, deflate")) == "gzip"
+    assert compressor.negotiate(accept("gzip;q=0")) is None
+    assert compressor.negotiate(accept("identity")) is None
+
+
+@pytest.mark.parametrize("encoding, module", [("br", "brotli"), ("zstd", "zstandard")])
+def test_optional_encodings(encoding, module):
+    decompress = pytest.importorskip(module).decompress
+    compressor = Compressor(encodings=["zstd", "br", "gzip"])
+
+    response = compressor.compress_response(Response(BODY, mimetype="application/json"), accept(f"gzip, {encoding}"))
+
+    assert response.headers["Content-Encoding"] == encoding
+    assert decompress(response.get_data()) == BODY
+
+
+def test_skipped_responses():
+    compressor = Compressor(encodings=["gzip"], min_size=100)
+
+    small = compressor.compress_response(Response(b"{}", mimetype="application/json"), accept("gzip"))
+    png = compressor.compress_response(Response(BODY, mimetype="image/png"), accept("gzip"))
+    error = compressor.compress_response(Response(BODY, status=500, mimetype="application/json"), accept("gzip"))
+
+    assert "Content-Encoding" not in small.headers and small.get_data() == b"{}"
+    assert "Accept-Encoding" in small.headers["Vary"]
+    assert "Content-Encoding" not in png.headers
+    assert "Content-Encoding" not in error.headers
+
+
+def test_streamed_and_large_responses():
+    compressor = Compressor(encodings=["gzip"], stream_size=len(BODY) // 2)
+    lines = [json.dumps({"asset_id": str(i)}).encode() + b"\n" for i in range(5)]
+
+    streamed = compressor.compress_response(Response(iter(lines), mimetype="application/x-ndjson"), accept("gzip"))
+    large = compressor.compress_response(Response(BODY, mimetype="application/json"), accept("gzip"))
+
+    assert streamed.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(b"".join(streamed.response)) == b"".join(lines)
+    assert large.is_streamed and "Content-Length" not in large.headers
+    assert gzip.decompress(b"".join(large.response)) == BODY
+
+
+def test_encoded_bodies_cached_by_etag():
+    compressor = Compressor(encodings=["gzip"])
+
+    for _ in range(2):
+        response = Response(BODY, mimetype="application/json")
+        response.set_etag("abc")
+        response = compressor.compress_response(response, accept("gzip"))
+
+    assert gzip.decompress(response.get_data()) == BODY
+    assert response.get_etag() == ("abc", True)
+    assert compressor.cache_stats() == {"entries": 1, "bytes": len(response.get_data())}
+
+
+def test_parse_levels():
+    assert parse_levels("gzip=9, br=5") == {"gzip": 9, "br": 5}
+
+
+def test_api_responses_compressed():
+    app = create_app()
+    requester_mock = mock.Mock(spec=Requester)
+    with app.container.requester.override(requester_mock):
+        requester_mock.get.return_value = BODY.decode()
+
+        with app.test_client() as test_client:
+            resp = test_client.post("/api/get_asset_exposure", json={}, headers={"Accept-Encoding": "gzip"})
+
+    assert resp.headers["Content-Encoding"] == "gzip"
+    assert json.loads(gzip.decompress(resp.data)) == json.loads(BODY)
@@ -0,0 +1,86 @@
+import json
+
+from physrisk_api.app.hazard_cache import HazardPointCache
+
+
+def item(request_item_id, latitudes, longitudes, scenario="rcp8p5"):
+    return {
+        "request_item_id": request_item_id,
+        "hazard_type": "RiverineInundation",
+        "indicator_id": "flood_depth",
+        "scenario": scenario,
+        "year": 2080,
+        "latitudes": latitudes,
+        "longitudes": longitudes,
+    }
+
+
+class FakeRequester:
+    """Returns one curve per location whose intensity is derived from the location."""
+
+    def __init__(self):
+        self.requests = []
+
+    def get(self, request_dict):
+        self.requests.append(request_dict)
+        items = [
+            {
+                "intensity_curve_set": [
+                    {"intensities": [round(lat + lon, 4)], "return_periods": [100.0]}
+                    for lat, lon in zip(i["latitudes"], i["longitudes"])
+                ],
+                "request_item_id": i["request_item_id"],
+                "hazard_type": i["hazard_type"],
+                "indicator_id": i["indicator_id"],
+                "scenario": i["scenario"],
+                "year": i["year"],
+            }
+            for i in request_dict["items"]
+        ]
+        return json.dumps({"items": items})
+
+
+def test_only_misses_fetched():
+    cache = HazardPointCache(resolution=1e-4)
+    requester = FakeRequester()
+    group = {"group_ids": ["osc"], "interpolation": "floor"}
+
+    first = json.loads(cache.get({**group, "items": [item("a", [10.0, 20.0], [1.0, 2.0])]}, requester.get))
+    second = json.loads(
+        cache.get(
+            {**group, "items": [item("b", [30.0], [3.0]), item("c", [20.0, 10.00001, 30.0], [2.0, 1.0, 3.0])]},
+            requester.get,
+        )
+    )
+
+    # second request only sends the one new location
+    assert len(requester.requests) == 2
+    assert requester.requests[1]["items"] == [item("b", [30.0], [3.0])]
+
+    assert [c["intensities"] for c in first["items"][0]["intensity_curve_set"]] == [[11.0], [22.0]]
+    assert [i["request_item_id"] for i in second["items"]] == ["b", "c"]
+    assert [c["intensities"] for c in second["items"][1]["intensity_curve_set"]] == [[22.0], [11.0], [33.0]]
+    assert cache.stats()["hits"] == 2
+    assert cache.stats()["misses"] == 4
+
+
+def test_key_includes_request_parameters():
+    cache = HazardPointCache()
+    requester = FakeRequester()
+
+    cache.get({"group_ids": ["osc"], "items": [item("a", [10.0], [1.0])]}, requester.get)
+    cache.get({"group_ids": ["public"], "items": [item("a", [10.0], [1.0])]}, requester.get)
+    cache.get({"group_ids": ["osc"], "items": [item("a", [10.0], [1.0], scenario="ssp585")]}, requester.get)
+
+    assert len(requester.requests) == 3
+
+
+def test_memory_bound():
+    cache = HazardPointCache(max_bytes=1000)
+    requester = FakeRequester()
+    lats = [float(i) for i in range(100)]
+
+    cache.get({"items": [item("a", lats, lats)]}, requester.get)
+
+    assert 0 < cache.stats()["entries"] < 100
+    assert cache.stats()["bytes"] <= 1000
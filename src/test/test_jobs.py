@@ -0,0 +1,149 @@
+import json
+import threading
+import time
+from unittest import mock
+
+from physrisk.requests import Requester
+
+from physrisk_api.app import create_app
+from physrisk_api.app.jobs import Job, JobManager, MemoryJobStore, SQLiteJobStore
+
+
+def exposure_response(request_id, request_dict):
+    return json.dumps({"items": [{"asset_id": str(item["latitude"])} for item in request_dict["assets"]["items"]]})
+
+
+def exposure_request(n):
+    return {"assets": {"items": [{"asset_class": "RealEstateAsset", "latitude": i, "longitude": 0} for i in range(n)]}}
+
+
+def wait_for(test_client, job_id, statuses=("succeeded", "failed", "cancelled")):
+    for _ in range(200):
+        status = test_client.get(f"/api/jobs/{job_id}").json
+        if status["status"] in statuses:
+            return status
+        time.sleep(0.01)
+    raise TimeoutError(status)
+
+
+def test_job_runs_in_chunks(monkeypatch):
+    monkeypatch.setenv("JOBS_CHUNK_SIZE", "3")
+    app = create_app()
+    requester_mock = mock.Mock(spec=Requester)
+    requester_mock.get.side_effect = exposure_response
+    with app.container.requester.override(requester_mock):
+        with app.test_client() as test_client:
+            submitted = test_client.post("/api/jobs/get_asset_exposure", json=exposure_request(7))
+            status = wait_for(test_client, submitted.json["job_id"])
+            result = test_client.get(f"/api/jobs/{submitted.json['job_id']}/result")
+
+    assert submitted.status_code == 202
+    assert submitted.headers["Location"].endswith(f"/api/jobs/{submitted.json['job_id']}")
+    assert status["status"] == "succeeded"
+    assert status["progress"] == {"done": 3, "total": 3}
+    assert [item["asset_id"] for item in result.json["items"]] == [str(i) for i in range(7)]
+
+
+def test_job_cancelled_with_partial_result(monkeypatch):
+    monkeypatch.setenv("JOBS_CHUNK_SIZE", "3")
+    app = create_app()
+    release = threading.Event()
+
+    def get(request_id, request_dict):
+        if request_dict["assets"]["items"][0]["latitude"] > 0:
+            release.wait(5)
+        return exposure_response(request_id, request_dict)
+
+    requester_mock = mock.Mock(spec=Requester)
+    requester_mock.get.side_effect = get
+    with app.container.requester.override(requester_mock):
+        with app.test_client() as test_client:
+            job_id = test_client.post("/api/jobs/get_asset_exposure", json=exposure_request(7)).json["job_id"]
+            wait_for(test_client, job_id, statuses=("running",))
+            while test_client.get(f"/api/jobs/{job_id}").json["progress"]["done"] < 1:
+                time.sleep(0.01)
+            partial = test_client.get(f"/api/jobs/{job_id}/result?partial=true")
+            cancelled = test_client.delete(f"/api/jobs/{job_id}")
+            release.set()
+            time.sleep(0.1)
+            status = test_client.get(f"/api/jobs/{job_id}").json
+            result = test_client.get(f"/api/jobs/{job_id}/result")
+
+    assert len(partial.json["items"]) == 3
+    assert cancelled.json["status"] == "cancelled"
+    assert status["status"] == "cancelled"
+    assert status["progress"]["done"] < 3
+    assert result.status_code == 409
+
+
+def test_job_queue_limit(monkeypatch):
+    monkeypatch.setenv("JOBS_MAX_ACTIVE", "0")
+    app = create_app()
+    with app.test_client() as test_client:
+        response = test_client.post("/api/jobs/get_asset_exposure", json=exposure_request(1))
+        unknown = test_client.get("/api/jobs/unknown")
+
+    assert response.status_code == 429
+    assert unknown.status_code == 404
+
+
+def test_sqlite_store_shared_and_evicted(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    store, other = SQLiteJobStore(path), SQLiteJobStore(path)
+    store.create(Job(id="a", request_id="get_asset_impact", request="{}"))
+    other.update("a", status="running", done=1, total=2)
+    store.add_chunk("a", 0, "{}")
+
+    assert store.get("a").status == "running"
+    assert other.chunks("a") == ["{}"]
+    assert other.count_active() == 1
+    assert store.evict(before=time.time() + 1) == 1
+    assert other.get("a") is None
+
+
+def test_status_changes_conditional(tmp_path):
+    for store in (MemoryJobStore(), SQLiteJobStore(str(tmp_path / "jobs.db"))):
+        store.create(Job(id="a", request_id="get_asset_impact", request="{}", status="cancelled"))
+
+        assert not store.update("a", status_in=("queued",), status="running")
+        assert not store.update("a", status_in=("running",), status="failed")
+        assert store.get("a").status == "cancelled"
+        assert store.update("a", status_in=("cancelled",), done=1)
+
+
+def test_status_without_request_and_result(tmp_path):
+    for store in (MemoryJobStore(), SQLiteJobStore(str(tmp_path / "jobs.db"))):
+        store.create(Job(id="a", request_id="get_asset_impact", request='{"assets": {}}'))
+        store.update("a", status="succeeded", done=2, total=2, result='{"asset_impacts": []}')
+
+        status = store.status("a")
+        assert (status.status, status.done, status.total) == ("succeeded", 2, 2)
+        assert (status.request, status.result) == ("", None)
+        assert store.get("a").result == '{"asset_impacts": []}'
+        assert store.status("b") is None
+
+
+def test_job_cancelled_before_start_not_run():
+    app = create_app()
+    requester_mock = mock.Mock(spec=Requester)
+    job = Job(id="a", request_id="get_asset_exposure", request="{}", status="cancelled")
+    app.jobs.store.create(job)
+    with app.container.requester.override(requester_mock):
+        app.jobs._run(job.id, job.request_id, exposure_request(1))
+
+    assert app.jobs.store.get("a").status == "cancelled"
+    assert requester_mock.get.call_count == 0
+
+
+def test_abandoned_jobs_failed(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    store = SQLiteJobStore(path)
+    store.create(Job(id="old", request_id="get_asset_impact", request="{}", status="running", updated=0.0))
+    store.create(Job(id="new", request_id="get_asset_impact", request="{}"))
+    app = create_app()
+
+    JobManager(app, SQLiteJobStore(path), stale_after=60)
+
+    assert store.get("old").status == "failed"
+    assert store.get("new").status == "queued"
+    assert store.count_active() == 1
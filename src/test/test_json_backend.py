@@ -0,0 +1,30 @@
+import json
+
+from physrisk_api.app import json_backend
+
+
+def test_has_results_small():
+    assert json_backend.has_results('{"items": [{"a": 1}]}')
+    assert json_backend.has_results('{"risk_measures": {"a": 1}}')
+    assert not json_backend.has_results('{"items": []}')
+    assert not json_backend.has_results('{"asset_impacts": null, "risk_measures": null}')
+
+
+def test_has_results_large():
+    colormaps = {str(i): "x" * 100 for i in range(1000)}
+    assert not json_backend.has_results(json.dumps({"models": [], "colormaps": colormaps}))
+    assert json_backend.has_results(json.dumps({"models": [{"id": "a"}], "colormaps": colormaps}))
+    assert json_backend.has_results(json.dumps({"items": [{"asset_id": str(i)} for i in range(10000)]}))
+
+
+def test_has_results_empty_same_at_any_size():
+    padding = {str(i): "x" * 100 for i in range(1000)}
+    for response in ({"risk_measures": {}}, {"risk_measures": {"a": 1}}):
+        small, large = json.dumps(response), json.dumps({**response, "padding": padding})
+        assert len(small) <= json_backend.RESULT_CHECK_PARSE_LIMIT < len(large)
+        assert json_backend.has_results(small) == json_backend.has_results(large) == bool(response["risk_measures"])
+
+
+def test_loads_nan():
+    # physrisk may emit non-standard NaN values
+    assert json_backend.loads('{"value": NaN}')["value"] != 0
@@ -0,0 +1,43 @@
+import json
+from unittest import mock
+
+from physrisk.requests import Requester
+
+from physrisk_api.app import create_app
+from physrisk_api.app.metrics import Histogram
+
+
+def test_histogram_render():
+    histogram = Histogram("latency_seconds", "Latency.", ["endpoint"], [0.1, 1])
+    for value in (0.05, 0.5, 0.5, 5):
+        histogram.observe(value, "/a")
+
+    assert list(histogram.render()) == [
+        "# HELP latency_seconds Latency.",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{endpoint="/a",le="0.1"} 1',
+        'latency_seconds_bucket{endpoint="/a",le="1.0"} 3',
+        'latency_seconds_bucket{endpoint="/a",le="+Inf"} 4',
+        'latency_seconds_sum{endpoint="/a"} 6.05',
+        'latency_seconds_count{endpoint="/a"} 4',
+    ]
+
+
+def test_metrics_endpoint():
+    app = create_app()
+    requester_mock = mock.Mock(spec=Requester)
+    with app.container.requester.override(requester_mock):
+        requester_mock.get.return_value = json.dumps({"items": [{"asset_id": "", "exposures": {}}]})
+
+        with app.test_client() as test_client:
+            test_client.post("/api/get_asset_exposure", json={"assets": {"items": []}})
+            resp = test_client.get("/metrics")
+
+    assert resp.status_code == 200
+    lines = resp.data.decode().splitlines()
+    endpoint = 'endpoint="/api/get_asset_exposure"'
+    assert f'physrisk_request_duration_seconds_count{{{endpoint},method="POST",status="200"}} 1' in lines
+    for phase in ("jwt", "parse", "compute"):
+        assert f'physrisk_request_phase_seconds_count{{{endpoint},phase="{phase}"}} 1' in lines
+    assert f"physrisk_response_size_bytes_count{{{endpoint}}} 1" in lines
+    assert 'physrisk_cache_lookups_total{cache="tiles",result="miss"} 0' in lines
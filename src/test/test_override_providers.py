@@ -0,0 +1,54 @@
+import numpy as np
+import zarr
+
+from physrisk_api.app.override_providers import CountingS3FileSystem, provide_s3_zarr_store, store_stats
+
+
+def test_local_store_counts_reads(tmp_path, monkeypatch):
+    root = zarr.open_group(str(tmp_path), mode="w")
+    root.create_dataset("hazard/indicator", data=np.arange(100.0).reshape(10, 10), chunks=(5, 5))
+    monkeypatch.setenv("OSC_ZARR_LOCAL_PATH", str(tmp_path))
+
+    store = provide_s3_zarr_store()
+    array = zarr.open(store, mode="r")["hazard/indicator"]
+
+    assert array[7, 7] == 77.0
+    stats = store_stats[str(tmp_path)].as_dict()
+    assert stats["requests"] > 0
+    assert stats["bytes_read"] > 0
+
+
+def test_s3_filesystem_shared_and_configured(monkeypatch):
+    monkeypatch.delenv("OSC_ZARR_LOCAL_PATH", raising=False)
+    monkeypatch.setenv("OSC_S3_BUCKET", "bucket")
+    monkeypatch.setenv("OSC_S3_ENDPOINT_URL", "http://localhost:5555")
+    monkeypatch.setenv("OSC_S3_MAX_CONCURRENCY", "7")
+    monkeypatch.setenv("OSC_S3_MAX_POOL_CONNECTIONS", "11")
+
+    store = provide_s3_zarr_store()
+
+    assert isinstance(store.fs, CountingS3FileSystem)
+    assert provide_s3_zarr_store().fs is store.fs
+    assert store.root == "bucket/hazard/hazard.zarr"
+    assert store.fs.batch_size == 7
+    assert store.fs.endpoint_url == "http://localhost:5555"
+    assert store.fs.config_kwargs["max_pool_connections"] == 11
+
+
+def test_local_store_chunk_cache(tmp_path, monkeypatch):
+    data_path, cache_path = tmp_path / "data", tmp_path / "cache"
+    root = zarr.open_group(str(data_path), mode="w")
+    root.create_dataset("hazard/indicator", data=np.arange(100.0).reshape(10, 10), chunks=(5, 5))
+    monkeypatch.setenv("OSC_ZARR_LOCAL_PATH", str(data_path))
+    monkeypatch.setenv("ZARR_CHUNK_CACHE_DIR", str(cache_path))
+
+    store = provide_s3_zarr_store()
+    array = zarr.open(store, mode="r")["hazard/indicator"]
+    assert array[7, 7] == 77.0
+    requests = store_stats[str(data_path)].requests
+    assert any(cache_path.rglob("*"))
+
+    assert array[7, 7] == 77.0
+    stats = store_stats[str(data_path)].as_dict()
+    assert stats["requests"] == requests
+    assert stats["cache_hits"] > 0
@@ -0,0 +1,101 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from physrisk_api.app.parallel import ImpactPool
+
+
+def impact_response(request_dict):
+    """Stand-in for physrisk's get_asset_impact: per-asset results in input order."""
+    items = request_dict["assets"]["items"]
+    ids = [item.get("id") for item in items]
+    return json.dumps(
+        {
+            "asset_impacts": [
+                {"asset_id": id or "", "impacts": [{"mean": item["latitude"]}]} for id, item in zip(ids, items)
+            ],
+            "risk_measures": {
+                "measures_for_assets": [
+                    {
+                        "key": {"hazard_type": hazard_type, "scenario_id": "ssp585", "year": "2050", "measure_id": "m"},
+                        "scores": [int(item["latitude"]) % 4 for item in items],
+                        "measures_0": [item["latitude"] / 100 for item in items],
+                    }
+                    for hazard_type in ("RiverineInundation", "Wind")
+                ],
+                "measures_for_portfolio": [],
+                "score_based_measure_set_defn": {"measure_set_id": "measure_set_0"},
+                "scenarios": [{"id": "ssp585", "years": [2050]}],
+                "asset_ids": [f"asset_{i}" if id is None else id for i, id in enumerate(ids)],
+            },
+        }
+    )
+
+
+def impact_pool(chunk_size, run_chunk=lambda request_id, d: impact_response(d)):
+    return ImpactPool(2, chunk_size, executor_factory=lambda: ThreadPoolExecutor(2), run_chunk=run_chunk)
+
+
+def portfolio(n):
+    items = [{"asset_class": "RealEstateAsset", "latitude": float(i), "longitude": 0.0} for i in range(n)]
+    items[3]["id"] = "named"
+    return {"assets": {"items": items}, "include_measures": True}
+
+
+def test_chunked_matches_serial():
+    request_dict = portfolio(23)
+    calls = []
+
+    def fetch(d):
+        calls.append(d)
+        return impact_response(d)
+
+    merged = impact_pool(chunk_size=5).get("get_asset_impact", request_dict, fetch)
+
+    assert calls == []
+    assert json.loads(merged) == json.loads(impact_response(request_dict))
+
+
+def test_small_request_not_chunked():
+    calls = []
+    impact_pool(chunk_size=50).get("get_asset_impact", portfolio(23), lambda d: calls.append(d) or "{}")
+
+    assert len(calls) == 1
+
+
+def test_portfolio_level_results_run_whole():
+    def run_chunk(request_id, d):
+        return json.dumps({**json.loads(impact_response(d)), "portfolio_impacts": [{"mean": 1.0}]})
+
+    calls = []
+    result = impact_pool(chunk_size=5, run_chunk=run_chunk).get(
+        "get_asset_impact", portfolio(12), lambda d: calls.append(d) or "whole"
+    )
+
+    assert result == "whole"
+    assert len(calls[0]["assets"]["items"]) == 12
+
+
+def test_restart_lets_running_requests_finish():
+    started, release = threading.Event(), threading.Event()
+
+    def run_chunk(request_id, d):
+        started.set()
+        release.wait(timeout=10)
+        return impact_response(d)
+
+    pool = impact_pool(chunk_size=5, run_chunk=run_chunk)
+    results = []
+    running = threading.Thread(target=lambda: results.append(pool.get("get_asset_impact", portfolio(23), None)))
+    running.start()
+    assert started.wait(timeout=10)
+    old_executor = pool.executor()
+
+    shutdown = pool.restart()
+    assert pool.executor() is not old_executor
+    release.set()
+    running.join(timeout=10)
+    shutdown.join(timeout=10)
+
+    assert json.loads(results[0]) == json.loads(impact_response(portfolio(23)))
+    assert not shutdown.is_alive()
@@ -0,0 +1,79 @@
+import json
+from unittest import mock
+
+from physrisk.requests import Requester
+
+from physrisk_api.app import create_app
+from physrisk_api.app.prewarm import PrewarmTarget, load_targets, prewarm_tiles, tile_xy
+from physrisk_api.app.warmup import warm_up
+
+RESOURCE = "inundation/river_tudelft/v2/flood_depth_unprot_{scenario}_{year}"
+
+
+def test_tile_xy():
+    assert tile_xy(53.6864, 9.4011, 8) == (134, 82)
+    assert tile_xy(90.0, -180.0, 2) == (0, 0)
+    assert tile_xy(-90.0, 180.0, 2) == (3, 3)
+
+
+def test_target_tiles():
+    target = PrewarmTarget(RESOURCE, ["historical"], [1985], bbox=(9.0, 53.0, 10.0, 54.0), zooms=[0, 8])
+
+    assert list(target.tiles()) == [(0, 0, 0), (134, 82, 8), (134, 83, 8), (135, 82, 8), (135, 83, 8)]
+
+
+def test_prewarmed_tiles_served_from_cache():
+    app = create_app()
+    requester_mock = mock.Mock(spec=Requester)
+    requester_mock.get_image.return_value = b"PNG"
+    with app.container.requester.override(requester_mock):
+        target = PrewarmTarget(RESOURCE, ["historical", "rcp8p5"], [1985], bbox=(9.0, 53.0, 10.0, 54.0), zooms=[8])
+        progress = prewarm_tiles(app, [target])
+
+        with app.test_client() as test_client:
+            response = test_client.get(f"/api/tiles/{RESOURCE}/8/134/82.png?scenarioId=historical&year=1985")
+
+    assert progress.as_dict()["done"] == progress.total == 8
+    assert response.data == b"PNG"
+    assert requester_mock.get_image.call_count == 8
+
+
+def test_prewarmed_tiles_from_config_served_from_cache(tmp_path):
+    config_path = tmp_path / "prewarm.json"
+    config_path.write_text(
+        json.dumps(
+            [{"resource": RESOURCE, "scenarios": ["historical"], "years": ["1985"], "zooms": [0], "min_value": 0}]
+            + [{"resource": RESOURCE, "scenarios": ["historical"], "years": [1985], "zooms": [0], "max_value": 5}]
+        )
+    )
+    app = create_app()
+    requester_mock = mock.Mock(spec=Requester)
+    requester_mock.get_image.return_value = b"PNG"
+    with app.container.requester.override(requester_mock):
+        prewarm_tiles(app, load_targets(str(config_path)))
+
+        with app.test_client() as test_client:
+            url = f"/api/tiles/{RESOURCE}/0/0/0.png?scenarioId=historical&year=1985"
+            min_value = test_client.get(f"{url}&minValue=0")
+            max_value = test_client.get(f"{url}&maxValue=5")
+
+    assert min_value.data == max_value.data == b"PNG"
+    assert requester_mock.get_image.call_count == 2
+    assert app.tile_cache.stats()["hits"] == 2
+
+
+def test_prewarm_started_after_warm_up(tmp_path, monkeypatch):
+    config_path = tmp_path / "prewarm.json"
+    config_path.write_text(
+        json.dumps([{"resource": RESOURCE, "scenarios": ["historical"], "years": [1985], "zooms": [0, 1]}])
+    )
+    monkeypatch.setenv("TILE_PREWARM_CONFIG", str(config_path))
+    app = create_app()
+    requester_mock = mock.Mock(spec=Requester)
+    requester_mock.get_image.return_value = b"PNG"
+    with app.container.requester.override(requester_mock):
+        assert warm_up(app)
+        app.tile_prewarm.thread.join(timeout=10)
+
+    assert app.tile_prewarm.progress.as_dict()["done"] == 5
+    assert app.tile_cache.stats()["entries"] == 5
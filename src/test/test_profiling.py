@@ -0,0 +1,55 @@
+import json
+import time
+from unittest import mock
+
+from physrisk.requests import Requester
+
+from physrisk_api.app import create_app
+from physrisk_api.app.profiling import Profiler
+
+
+def slow_response(**kwargs):
+    time.sleep(0.05)
+    return json.dumps({"items": [{"asset_id": "", "exposures": {}}]})
+
+
+def test_profiled_request(monkeypatch):
+    monkeypatch.setenv("PROFILING_KEY", "secret")
+    app = create_app()
+    requester_mock = mock.Mock(spec=Requester)
+    with app.container.requester.override(requester_mock):
+        requester_mock.get.side_effect = slow_response
+
+        with app.test_client() as test_client:
+            not_profiled = test_client.post("/api/get_asset_exposure", json={"assets": {"items": []}})
+            profiled = test_client.post(
+                "/api/get_asset_exposure", json={"assets": {"items": []}}, headers={"X-Profile-Key": "secret"}
+            )
+            profile_id = profiled.headers["X-Profile-Id"]
+            forbidden = test_client.get("/debug/profiles")
+            profiles = test_client.get("/debug/profiles", headers={"X-Profile-Key": "secret"})
+            stacks = test_client.get(f"/debug/profiles/{profile_id}", headers={"X-Profile-Key": "secret"})
+
+    assert "X-Profile-Id" not in not_profiled.headers
+    assert profiled.status_code == 200
+    assert forbidden.status_code == 403
+    assert [p["id"] for p in profiles.json["profiles"]] == [profile_id]
+    assert profiles.json["profiles"][0]["samples"] > 0
+    lines = stacks.data.decode().splitlines()
+    assert any("hazard_data" in line and "slow_response" in line for line in lines)
+
+
+def test_ring_buffer():
+    profiler = Profiler("secret", max_profiles=2)
+    for path in ("/a", "/b", "/c"):
+        with profiler.profile(path):
+            pass
+
+    assert [p.path for p in profiler.profiles()] == ["/c", "/b"]
+    assert not profiler.should_profile({"X-Profile-Key": "wrong"})
+
+
+def test_profiling_disabled_by_default():
+    app = create_app()
+    with app.test_client() as test_client:
+        assert test_client.get("/debug/profiles", headers={"X-Profile-Key": ""}).status_code == 404
@@ -0,0 +1,108 @@
+import gzip
+import json
+from unittest import mock
+
+import pytest
+from physrisk.requests import Requester
+
+from physrisk_api.app import create_app
+from physrisk_api.app.request_formats import (
+    ARROW_STREAM_MIMETYPE,
+    PARQUET_MIMETYPE,
+    RequestTooLarge,
+    UnsupportedRequestFormat,
+    decode_body,
+)
+
+ASSETS = [
+    {"asset_class": "RealEstateAsset", "type": "Buildings/Commercial", "latitude": 22.2972, "longitude": 91.8062},
+    {"asset_class": "PowerGeneratingAsset", "latitude": 22.3, "longitude": 91.8, "capacity": 1000.0},
+]
+RESPONSE = json.dumps({"items": [{"asset_id": "", "exposures": {}}] * 2})
+
+
+def test_decode_body():
+    body = json.dumps({"assets": {"items": ASSETS}}).encode()
+
+    assert decode_body(gzip.compress(body), "gzip", max_size=len(body)) == body
+    assert decode_body(body, None, max_size=len(body)) == body
+    with pytest.raises(RequestTooLarge):
+        decode_body(gzip.compress(body), "gzip", max_size=len(body) - 1)
+    with pytest.raises(UnsupportedRequestFormat):
+        decode_body(body, "compress", max_size=len(body))
+
+
+def test_multi_member_gzip_body():
+    body = json.dumps({"assets": {"items": ASSETS}}).encode()
+    members = gzip.compress(body[:10]) + gzip.compress(body[10:])
+
+    assert decode_body(members, "gzip", max_size=len(body)) == body
+    with pytest.raises(RequestTooLarge):
+        decode_body(members, "gzip", max_size=len(body) - 1)
+
+
+def test_zstd_body():
+    zstandard = pytest.importorskip("zstandard")
+    body = json.dumps({"assets": {"items": ASSETS}}).encode()
+
+    assert decode_body(zstandard.ZstdCompressor().compress(body), "zstd", max_size=len(body)) == body
+
+
+def test_multi_frame_zstd_body():
+    zstandard = pytest.importorskip("zstandard")
+    body = json.dumps({"assets": {"items": ASSETS}}).encode()
+    compressor = zstandard.ZstdCompressor()
+    frames = compressor.compress(body[:10]) + compressor.compress(body[10:])
+
+    assert decode_body(frames, "zstd", max_size=len(body)) == body
+    with pytest.raises(RequestTooLarge):
+        decode_body(frames, "zstd", max_size=len(body) - 1)
+
+
+def post(data: bytes, headers: dict):
+    app = create_app()
+    requester_mock = mock.Mock(spec=Requester)
+    with app.container.requester.override(requester_mock):
+        requester_mock.get.return_value = RESPONSE
+        with app.test_client() as test_client:
+            resp = test_client.post("/api/get_asset_exposure", data=data, headers=headers)
+    return resp, requester_mock
+
+
+def test_compressed_request():
+    request_dict = {"assets": {"items": ASSETS}, "scenario": "ssp585", "year": 2050}
+
+    resp, requester_mock = post(
+        gzip.compress(json.dumps(request_dict).encode()),
+        {"Content-Type": "application/json", "Content-Encoding": "gzip"},
+    )
+    unsupported, _ = post(b"{}", {"Content-Type": "application/json", "Content-Encoding": "compress"})
+
+    assert resp.status_code == 200
+    assert requester_mock.get.call_args.kwargs["request_dict"]["assets"] == request_dict["assets"]
+    assert unsupported.status_code == 415
+
+
+@pytest.mark.parametrize("mimetype", [ARROW_STREAM_MIMETYPE, PARQUET_MIMETYPE])
+def test_columnar_request(mimetype):
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+    columns = {
+        name: [asset.get(name) for asset in ASSETS]
+        for name in ("asset_class", "type", "latitude", "longitude", "capacity")
+    }
+    table = pa.table(columns).replace_schema_metadata({"request": json.dumps({"scenario": "ssp585", "year": 2050})})
+    sink = pa.BufferOutputStream()
+    if mimetype == ARROW_STREAM_MIMETYPE:
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        pq.write_table(table, sink)
+
+    resp, requester_mock = post(sink.getvalue().to_pybytes(), {"Content-Type": mimetype})
+
+    assert resp.status_code == 200
+    request_dict = requester_mock.get.call_args.kwargs["request_dict"]
+    # null values are omitted rather than passed to physrisk
+    assert request_dict["assets"]["items"] == ASSETS
+    assert (request_dict["scenario"], request_dict["year"]) == ("ssp585", 2050)
@@ -0,0 +1,113 @@
+import io
+from unittest import mock
+
+import numpy as np
+import pytest
+from physrisk.api.v1.common import ExceedanceCurve
+from physrisk.api.v1.exposure_req_resp import AssetExposure, AssetExposureResponse, Exposure
+from physrisk.api.v1.impact_req_resp import AssetImpactResponse, AssetLevelImpact, AssetSingleImpact, ImpactKey
+from physrisk.requests import Requester
+
+from physrisk_api.app import create_app
+from physrisk_api.app.request_formats import ARROW_STREAM_MIMETYPE, PARQUET_MIMETYPE
+from physrisk_api.app.response_formats import iter_columnar
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+
+ASSETS = [{"asset_class": "RealEstateAsset", "latitude": 22.3 + i * 0.01, "longitude": 91.8} for i in range(3)]
+
+
+def read(data: bytes, mimetype: str) -> "pa.Table":
+    if mimetype == ARROW_STREAM_MIMETYPE:
+        return pa.ipc.open_stream(data).read_all()
+    return pq.read_table(io.BytesIO(data))
+
+
+def impact_response(n: int) -> AssetImpactResponse:
+    curve = ExceedanceCurve(values=np.array([0.1, 0.2]), exceed_probabilities=np.array([0.01, 0.002]))
+    return AssetImpactResponse(
+        asset_impacts=[
+            AssetLevelImpact(
+                impacts=[
+                    AssetSingleImpact(
+                        key=ImpactKey(hazard_type="RiverineInundation", scenario_id="ssp585", year="2050"),
+                        impact_mean=0.05,
+                        impact_exceedance=curve,
+                    ),
+                    AssetSingleImpact(
+                        key=ImpactKey(hazard_type="Wind", scenario_id="ssp585", year="2050"), impact_mean=0.01
+                    ),
+                ]
+            )
+            for _ in range(n)
+        ]
+    )
+
+
+@pytest.mark.parametrize("mimetype", [ARROW_STREAM_MIMETYPE, PARQUET_MIMETYPE])
+def test_impact_results(mimetype):
+    app = create_app()
+    app.config["STREAM_CHUNK_SIZE"] = 2
+    requester_mock = mock.Mock(spec=Requester)
+    with app.container.requester.override(requester_mock):
+        requester_mock.get_asset_impacts.side_effect = lambda request: impact_response(len(request.assets.items))
+
+        with app.test_client() as test_client:
+            resp = test_client.post(
+                "/api/get_asset_impact", json={"assets": {"items": ASSETS}}, headers={"Accept": mimetype}
+            )
+
+    assert resp.status_code == 200
+    assert resp.mimetype == mimetype
+    table = read(resp.data, mimetype)
+    assert requester_mock.get_asset_impacts.call_count == 2
+    assert requester_mock.get.call_count == 0
+    assert table.column("asset_index").to_pylist() == [0, 0, 1, 1, 2, 2]
+    assert table.column("hazard_type").to_pylist() == ["RiverineInundation", "Wind"] * 3
+    assert table.column("exceedance_values").to_pylist()[:2] == [[0.1, 0.2], None]
+    assert table.column("year").to_pylist() == [2050] * 6
+
+
+@pytest.mark.parametrize("mimetype", [ARROW_STREAM_MIMETYPE, PARQUET_MIMETYPE])
+def test_results_without_assets(mimetype):
+    requester_mock = mock.Mock(spec=Requester)
+    requester_mock.get_asset_impacts.return_value = impact_response(0)
+
+    data = b"".join(iter_columnar(requester_mock, "get_asset_impact", {"assets": {"items": []}}, 2, mimetype))
+
+    table = read(data, mimetype)
+    assert table.num_rows == 0
+    assert table.schema.field("year").type == pa.int64()
+
+
+def test_exposure_results():
+    app = create_app()
+    requester_mock = mock.Mock(spec=Requester)
+    with app.container.requester.override(requester_mock):
+        requester_mock.get_asset_exposures.return_value = AssetExposureResponse(
+            items=[
+                AssetExposure(asset_id="", exposures={"Wind": Exposure(category="HIGH", value=55.0, path="wind")})
+                for _ in ASSETS
+            ]
+        )
+
+        with app.test_client() as test_client:
+            resp = test_client.post(
+                "/api/get_asset_exposure",
+                json={"assets": {"items": ASSETS}, "scenario": "ssp585", "year": 2050},
+                headers={"Accept": ARROW_STREAM_MIMETYPE},
+            )
+
+    table = read(resp.data, ARROW_STREAM_MIMETYPE)
+    assert table.to_pylist()[0] == {
+        "asset_index": 0,
+        "asset_id": "",
+        "hazard_type": "Wind",
+        "scenario": "ssp585",
+        "year": 2050,
+        "category": "HIGH",
+        "value": 55.0,
+        "path": "wind",
+    }
+    assert table.num_rows == len(ASSETS)
@@ -0,0 +1,63 @@
+import unittest.mock as mock
+
+import zarr
+from dependency_injector import providers
+from physrisk.requests import Requester
+
+from physrisk_api.app import create_app
+from physrisk_api.app.serving import ServerConfig
+from physrisk_api.app.warmup import warm_up, warm_up_shared
+
+
+def test_server_config_from_environment(monkeypatch):
+    monkeypatch.setenv("SERVER_MODE", "Gunicorn")
+    monkeypatch.setenv("SERVER_WORKERS", "4")
+    monkeypatch.setenv("SERVER_THREADS", "16")
+
+    config = ServerConfig()
+
+    assert config.mode == "gunicorn"
+    assert config.workers == 4
+    assert config.threads == 16
+    assert config.port == 8081
+
+
+def test_warm_up():
+    app = create_app()
+    requester_mock = mock.Mock(spec=Requester)
+    with app.container.requester.override(requester_mock):
+        assert warm_up(app)
+
+    def unreachable():
+        raise RuntimeError("hazard data not reachable")
+
+    with app.container.requester.override(providers.Callable(unreachable)):
+        assert not warm_up(app)
+
+
+def test_warm_up_shared_models_held_by_requester():
+    app = create_app()
+    store = zarr.storage.MemoryStore()
+    zarr.open_group(store, mode="w")
+    with app.container.zarr_store.override(providers.Object(store)):
+        assert warm_up_shared(app)
+        factory = app.container.vulnerability_models_factory()
+        assert app.container.requester().vulnerability_models_factory is factory
+
+
+def test_reset_during_warm_up_builds_again():
+    app = create_app()
+    calls = []
+
+    def build():
+        calls.append(app.warm_up_generation)
+        if len(calls) == 1:
+            # a reset arriving while the first build is in progress
+            app.warm_up_generation += 1
+            app.ready = False
+        return mock.Mock(spec=Requester)
+
+    with app.container.requester.override(providers.Callable(build)):
+        assert warm_up(app)
+    assert calls == [0, 1]
+    assert app.ready
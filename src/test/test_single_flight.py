@@ -0,0 +1,51 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from physrisk_api.app.single_flight import SingleFlight
+
+
+def test_concurrent_calls_coalesced():
+    single_flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "result"
+
+    with ThreadPoolExecutor(4) as executor:
+        leader = executor.submit(single_flight.do, "requests", "k", compute)
+        started.wait(5)
+        followers = [executor.submit(single_flight.do, "requests", "k", compute) for _ in range(3)]
+        while single_flight.stats()["requests"]["coalesced"] < 3:
+            pass
+        release.set()
+        results = [leader.result()] + [f.result() for f in followers]
+
+    assert results == ["result"] * 4
+    assert len(calls) == 1
+    assert single_flight.stats() == {"requests": {"executed": 1, "coalesced": 3, "in_flight": 0}}
+
+
+def test_errors_shared_and_not_kept():
+    single_flight = SingleFlight()
+
+    def fail():
+        raise ValueError("invalid")
+
+    with pytest.raises(ValueError):
+        single_flight.do("requests", "k", fail)
+    assert single_flight.do("requests", "k", lambda: "result") == "result"
+
+
+def test_key_includes_groups():
+    request = {"items": [], "group_ids": ["osc"]}
+
+    assert SingleFlight.key("get_hazard_data", request) == SingleFlight.key("get_hazard_data", dict(request))
+    assert SingleFlight.key("get_hazard_data", request) != SingleFlight.key(
+        "get_hazard_data", {**request, "group_ids": ["public"]}
+    )
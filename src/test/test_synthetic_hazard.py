@@ -0,0 +1,62 @@
+import logging
+
+import zarr
+
+from physrisk_api.app import create_app
+from physrisk_api.app.synthetic_hazard import SyntheticHazardSettings, ensure_generated
+
+
+def _coarse_settings(tmp_path, monkeypatch):
+    monkeypatch.delenv("OSC_ZARR_LOCAL_PATH", raising=False)
+    monkeypatch.setenv("SYNTHETIC_HAZARD_DIR", str(tmp_path))
+    monkeypatch.setenv("SYNTHETIC_HAZARD_RESOLUTION", "10")
+    monkeypatch.setenv("SYNTHETIC_HAZARD_MAX_ZOOM", "1")
+    monkeypatch.setenv("SYNTHETIC_HAZARD_CHUNK_SIZE", "100")
+
+
+def test_synthetic_hazard_serves_requests(tmp_path, monkeypatch):
+    _coarse_settings(tmp_path, monkeypatch)
+    app = create_app()
+    client = app.test_client()
+
+    assets = [
+        {"asset_class": "PowerGeneratingAsset", "type": "Gas", "location": "Europe", "latitude": 53.7, "longitude": 9.4}
+    ]
+    response = client.post(
+        "/api/get_asset_exposure", json={"assets": {"items": assets}, "scenario": "ssp585", "year": 2050}
+    )
+    assert response.status_code == 200
+    assert response.get_json()["items"]
+
+    response = client.get(
+        "/api/tiles/inundation/wri/v2/inunriver_{scenario}_MIROC-ESM-CHEM_{year}/0/0/0.png",
+        query_string={"scenarioId": "ssp585", "year": 2050},
+    )
+    assert response.status_code == 200
+    assert response.mimetype == "image/png"
+
+
+def test_synthetic_hazard_generated_once(tmp_path, monkeypatch):
+    _coarse_settings(tmp_path, monkeypatch)
+    settings = SyntheticHazardSettings()
+    root = str(tmp_path / "hazard.zarr")
+
+    assert ensure_generated(root, settings) == root
+    zarr.open_group(root, mode="a").attrs["marker"] = True
+    ensure_generated(root, settings)
+    assert zarr.open_group(root, mode="r").attrs["marker"]
+
+
+def test_synthetic_hazard_replaced_with_other_settings(tmp_path, monkeypatch, caplog):
+    _coarse_settings(tmp_path, monkeypatch)
+    root = str(tmp_path / "hazard.zarr")
+    ensure_generated(root, SyntheticHazardSettings())
+    monkeypatch.setenv("SYNTHETIC_HAZARD_SEED", "1")
+    settings = SyntheticHazardSettings()
+
+    with caplog.at_level(logging.INFO):
+        ensure_generated(root, settings)
+
+    assert zarr.open_group(root, mode="r").attrs["synthetic"] == settings.dataset()
+    assert [path.name for path in tmp_path.iterdir()] == ["hazard.zarr"]
+    assert "Generated synthetic hazard data" in caplog.text
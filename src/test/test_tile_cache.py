@@ -0,0 +1,67 @@
+from physrisk_api.app.disk_cache import DiskCache
+from physrisk_api.app.tile_cache import TileCache
+
+
+def test_lru_eviction():
+    cache = TileCache(max_entries=2)
+    cache.put("a", b"1")
+    cache.put("b", b"2")
+    assert cache.get("a") == b"1"
+    cache.put("c", b"3")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == b"1"
+    assert cache.get("c") == b"3"
+    assert cache.stats()["entries"] == 2
+
+
+def test_byte_bound():
+    cache = TileCache(max_entries=10, max_bytes=5)
+    cache.put("a", b"123")
+    cache.put("b", b"456")
+
+    assert cache.get("a") is None
+    assert cache.stats()["bytes"] == 3
+
+
+def test_disk_tier(tmp_path):
+    cache = TileCache(max_entries=1, disk_dir=str(tmp_path))
+    cache.put("a", b"1")
+    cache.put("b", b"2")
+
+    # evicted from memory but still on disk
+    assert cache.get("a") == b"1"
+    assert cache.stats()["disk_hits"] == 1
+
+    # a fresh cache sharing the directory sees the same entries
+    other = TileCache(disk_dir=str(tmp_path))
+    assert other.get("b") == b"2"
+
+    cache.clear()
+    assert TileCache(disk_dir=str(tmp_path)).get("b") is None
+
+
+def test_key_includes_group():
+    request_dict = {"resource": "r", "tile": (1, 2, 3), "year": 2050, "group_ids": ["osc"]}
+    assert TileCache.key(request_dict) != TileCache.key({**request_dict, "group_ids": ["public"]})
+
+
+def test_disk_cache_size_shared_between_processes(tmp_path):
+    # two caches on one directory stand in for the workers of a server
+    first, second = DiskCache(str(tmp_path), max_bytes=1000), DiskCache(str(tmp_path), max_bytes=1000)
+    for i in range(10):
+        (first if i % 2 else second).put(str(i), b"x" * 300)
+        assert first.size() == second.size() <= 1000
+
+    entries = [path for path in tmp_path.rglob("*") if path.is_file() and not path.name.startswith(".")]
+    assert sum(path.stat().st_size for path in entries) == first.size()
+
+
+def test_disk_cache_overwrite_not_counted_twice(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=1000)
+    cache.put("other", b"y" * 500)
+    for _ in range(5):
+        cache.put("a", b"x" * 300)
+
+    assert cache.size() == 800
+    assert cache.get("other") == b"y" * 500